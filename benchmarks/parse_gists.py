@@ -0,0 +1,88 @@
+"""
+Parses synthetic gists (as listed by GitHub's API) and reports the time it
+takes and the memory the parsed gists take, with the compact records used by
+GetGist (getgist.models) and with plain dicts (as GetGist used to parse them):
+
+    python benchmarks/parse_gists.py [number of gists]
+"""
+
+import sys
+import tracemalloc
+from time import perf_counter
+
+from getgist.github import GitHubTools
+
+FILENAMES = (".vimrc", ".bashrc", "README.md", "setup.cfg", "notes.txt")
+
+
+def synthetic_gists(count):
+    for number in range(count):
+        gist_id = "{:032x}".format(number)
+        names = FILENAMES[: number % len(FILENAMES) + 1]
+        yield {
+            "id": gist_id,
+            "description": "" if number % 3 else "Gist #{}".format(number),
+            "html_url": "https://gist.github.com/janedoe/" + gist_id,
+            "public": bool(number % 2),
+            "files": {
+                name: {
+                    "filename": name,
+                    "size": 1024,
+                    "raw_url": "https://gist.githubusercontent.com/janedoe/"
+                    "{}/raw/{}".format(gist_id, name),
+                }
+                for name in names
+            },
+        }
+
+
+def parse_as_dict(gist):
+    files = list()
+    for name in sorted(gist["files"]):
+        gist_file = gist["files"][name]
+        files.append(
+            dict(
+                filename=name,
+                raw_url=gist_file.get("raw_url"),
+                size=gist_file.get("size"),
+            )
+        )
+    description = gist["description"] or files[0]["filename"]
+    return dict(
+        description=description,
+        id=gist.get("id"),
+        files=files,
+        url=gist.get("html_url"),
+        public=gist.get("public"),
+    )
+
+
+def measure(parse, gists):
+    """Times parsing (best of 3 runs) without tracing memory allocations, as
+    it is much slower when tracing them, and then measures the memory."""
+    elapsed = None
+    for _ in range(3):
+        start = perf_counter()
+        parsed = [parse(gist) for gist in gists]
+        run = perf_counter() - start
+        elapsed = run if elapsed is None else min(elapsed, run)
+        del parsed
+
+    tracemalloc.start()
+    parsed = [parse(gist) for gist in gists]  # noqa: F841 (kept while measured)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size
+
+
+def main(count):
+    gists = list(synthetic_gists(count))
+    print("Parsing {:,} gists".format(count))
+    for label, parse in (("dict", parse_as_dict), ("compact", GitHubTools._parse_gist)):
+        elapsed, size = measure(parse, gists)
+        msg = "{:>8}: {:6.0f}ms, {:6.1f}MB ({:,.0f} gists/s)"
+        print(msg.format(label, elapsed * 1000, size / 2**20, count / elapsed))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
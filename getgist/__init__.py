@@ -1,7 +1,7 @@
+from json import dumps
 from sys import stderr, stdout
 
-from tabulate import tabulate
-from click import secho
+from click import echo, secho
 
 
 class GetGistCommons(object):
@@ -9,6 +9,7 @@ class GetGistCommons(object):
 
     indent_size = 2
     indent_char = " "
+    data_on_stdout = False  # if True, messages go to sys.stderr
 
     def indent(self, message):
         """
@@ -28,7 +29,7 @@ class GetGistCommons(object):
         :param color: (str) check click.secho() documentation
         :return: (None) prints to sys.stdout or sys.stderr
         """
-        output_to = stderr if color == "red" else stdout
+        output_to = stderr if color == "red" or self.data_on_stdout else stdout
         secho(self.indent(message), fg=color, file=output_to)
 
     def oops(self, message):
@@ -48,5 +49,24 @@ class GetGistCommons(object):
         return self.output(message, color="blue")
 
     def tabulate(self, *files):
+        from tabulate import tabulate  # slow to import, only lsgists needs it
+
         data = tuple((str(f), f.gist, f.url) for f in files)
         return self.output(tabulate(data, headers=("Gist", "File", "URL")))
+
+    def rows(self, files, output_format="jsonl"):
+        """
+        Prints files one per line, as soon as each one is read from files
+        (unlike tabulate, which needs all of them).
+        :param files: (iterable) of FileFromGist
+        :param output_format: (str) jsonl (JSON Lines) or tsv
+        :return: (None) prints to sys.stdout
+        """
+        for f in files:
+            if output_format == "jsonl":
+                data = dict(gist=f.name, file=f.gist, url=f.url, public=f.public)
+                line = dumps(data)
+            else:
+                values = (str(f), f.gist, f.url)
+                line = "\t".join(" ".join(str(v).split()) for v in values)
+            echo(line)
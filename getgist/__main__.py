@@ -1,10 +1,24 @@
+from datetime import datetime
+from glob import glob
 from os import getenv
-from sys import exit
+from os.path import exists
+from shutil import rmtree
+from sys import executable, exit
+from time import time
 
-from click import argument, command, option
+from click import BadParameter, Choice, Parameter, argument, command, group, option
 
 from getgist import GetGistCommons
-from getgist.github import GitHubTools
+from getgist.cache import (
+    BlobCache,
+    cache_dir,
+    parse_duration,
+    parse_size,
+    read_json,
+    write_json,
+)
+from getgist.catalog import Catalog
+from getgist.github import GitHubTools, is_pattern, parse_gist_reference
 from getgist.local import LocalTools
 
 
@@ -12,6 +26,10 @@ GETGIST_DESC = """
     GetGist downloads any file from a GitHub Gist, with one single command.
     Usage: `getgist <GitHub username> <file name from any file inside a gist>`.
 
+    Several file names and glob patterns (e.g. `getgist <GitHub username>
+    .vimrc .zshrc '*.toml'`) are looked up in a single listing of the gists
+    and downloaded concurrently.
+
     If you set GETGIST_USER envvar with your GitHub username, you can use the
     shortcut `getmy <file name>` (see `getmy --help` for details).
 
@@ -31,6 +49,10 @@ PUTGIST_DESC = """
     PutGist uploads any file to a GitHub Gist, with one single command.
     Usage: `putgist <GitHub username> <file name>`.
 
+    Several files (e.g. `putgist <GitHub username> .vimrc .zshrc`) are sent
+    with a single request per gist, and the ones not found in any gist are
+    sent together to a new gist.
+
     You have to set the GETGIST_TOKEN envvar with your personal access token
     (see https://github.com/settings/tokens for details).
 
@@ -55,6 +77,13 @@ MYGISTS_DESC = """
     See:  `lsgists --help` for more more details.
 """
 
+CACHE_DESC = """
+    Manages GetGist's local cache (catalog of gists, raw files and API
+    responses) stored in GETGIST_CACHE_DIR (defaults to ~/.cache/getgist).
+    The size of the cache of raw files is limited by GETGIST_CACHE_SIZE
+    (defaults to 64M).
+"""
+
 
 class GetGist(object):
     """
@@ -69,20 +98,54 @@ class GetGist(object):
         to get, create or update gists (filename and public/private flag)
         :param user: (str) GitHub username
         :param filename: (str) name of file from any Gist or local file system
+        :param filenames: (tuple) of file names or glob patterns to download
+        at once (a single file name is handled as filename)
         :param allow_none: (bool) flag to use GitHubTools.select_gist
         differently with `getgist` and `putgist` commands (if no gist/filename
         is found it raises an error for `getgist`, or sets `putgist` to create
         a new gist).
         :param create_private: (bool) create a new gist as private
         :param assume_yes: (bool) assume yes (or first option) for all prompts
+        :param newest: (bool) if filename is found in more than one gist, use
+        the most recently updated one
+        :param no_cache: (bool) do not use the local caches (catalog of gists,
+        raw files and API responses)
+        :param gist_id: (str) ID of the gist to use, skipping the search for
+        filename in all gists (it can also be set as a prefix in filename,
+        e.g. `<gist id>:<filename>`)
+        :param offline: (bool) use only the local caches, never the API
+        :param max_stale: (float) seconds: use only the local caches if the
+        catalog of gists is more recent than that
         :return: (None)
         """
         user = kwargs.get("user")
         allow_none = kwargs.get("allow_none", False)
         assume_yes = kwargs.get("assume_yes", False)
         filename = kwargs.get("filename")
+        filenames = kwargs.get("filenames")
+        gist_id = kwargs.get("gist_id")
+        newest = kwargs.get("newest", False)
+        use_cache = not kwargs.get("no_cache", False)
+        offline = kwargs.get("offline", False)
+        max_stale = kwargs.get("max_stale")
         self.public = not kwargs.get("create_private", False)
 
+        if filenames and allow_none:
+            # files to upload: expand glob patterns in the local file system
+            filenames = tuple(
+                path
+                for filename in filenames
+                for path in (sorted(glob(filename)) or (filename,))
+            )
+
+        if filenames and len(filenames) == 1 and not is_pattern(filenames[0]):
+            filename, filenames = filenames[0], None
+
+        if filename and not gist_id:
+            reference_id, reference_filename = parse_gist_reference(filename)
+            if reference_id and reference_filename:
+                gist_id, filename = reference_id, reference_filename
+
         if not user:
             message = """
             No default user set yet. To avoid this prompt set an
@@ -91,98 +154,501 @@ class GetGist(object):
             GetGistCommons().oops(message)
             exit(1)
 
-        self.github = GitHubTools(user, filename, assume_yes)
+        if not use_cache and (offline or max_stale is not None):
+            message = "--offline and --max-stale cannot be used with --no-cache"
+            GetGistCommons().oops(message)
+            exit(1)
+
+        self.github = GitHubTools(
+            user,
+            filename,
+            assume_yes,
+            use_cache,
+            pipeline=True,
+            offline=offline,
+            max_stale=max_stale,
+        )
         self.local = LocalTools(filename, assume_yes) if filename else None
-        self.gist = self.github.select_gist(allow_none) if filename else None
+        self.files = None
+        if filenames:
+            self.gist = None
+            self.files = self.github.select_files(
+                filenames, gist_id, newest, allow_none
+            )
+        elif not filename:
+            self.gist = None
+        elif gist_id:
+            self.gist = self.github.select_gist_by_id(gist_id, allow_none)
+        else:
+            self.gist = self.github.select_gist(allow_none, newest)
 
     def get(self):
-        """Reads the remote file from Gist and save it locally"""
+        """
+        Reads the remote file from Gist and save it locally
+        :return: (bool) whether all files were downloaded
+        """
+        if self.files is not None:
+            return self.get_files()
         if self.gist:
-            content = self.github.read_gist_file(self.gist)
-            self.local.save(content)
+            return self._download(self.local, self.gist)
+        return False
+
+    def get_files(self):
+        """
+        Downloads all the selected files concurrently (up to
+        GitHubTools.max_workers at once) and summarizes the results.
+        :return: (bool) whether all files were downloaded
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        commons = GetGistCommons()
+        failed = [path for path, gist in self.files if not gist]
+        files = [(path, gist) for path, gist in self.files if gist]
+        with ThreadPoolExecutor(max_workers=self.github.max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self._download, LocalTools(path, self.github.assume_yes), gist
+                ): path
+                for path, gist in files
+            }
+            for count, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    done = future.result()
+                except OSError as error:
+                    commons.oops("Could not download {}: {}".format(path, error))
+                    done = False
+                if not done:
+                    failed.append(path)
+                commons.output("[{}/{}] {}".format(count, len(files), path))
+
+        downloaded = len(self.files) - len(failed)
+        commons.yeah("Downloaded {} of {} file(s)".format(downloaded, len(self.files)))
+        if failed:
+            commons.oops("Could not download " + ", ".join(failed))
+        return not failed
+
+    def _download(self, local, gist):
+        """
+        Downloads a file from a gist (resuming an interrupted download of it
+        if possible) and saves it locally.
+        :param local: (LocalTools) for the file to be saved
+        :param gist: (dict) gist parsed by GitHubTools._parse_gist()
+        :return: (bool) whether the file was downloaded
+        """
+        url = self.github.raw_url(gist, local.filename)
+        offset, etag = local.partial(url)
+        download = self.github.stream_gist_file(gist, offset, etag, local.filename)
+        if download is None:
+            return False
+        local.save(download)
+        return True
 
     def put(self):
         """ Reads local file & update the remote gist (or create a new one)"""
+        if self.files is not None:
+            return self.put_files()
         content = self.local.read()
         if self.gist:
-            self.github.update(self.gist, content)
-        else:
-            self.github.create(content, public=self.public)
+            return self.github.update(self.gist, content)
+        if self.gist is None:
+            return bool(self.github.create(content, public=self.public))
+        return False
 
-    def ls(self):
+    def put_files(self):
+        """
+        Reads all the selected local files and sends them with a single
+        request per gist: one PATCH for each existing gist, and one POST
+        creating a new gist with all the files not found in any gist.
+        :return: (bool) whether all files were sent
+        """
+        updates, new, sent = dict(), dict(), True
+        for path, gist in self.files:
+            if gist is False:
+                sent = False
+                continue
+            local = LocalTools(path, self.github.assume_yes)
+            content = local.read()
+            if content is False:
+                sent = False
+            elif gist:
+                _, contents = updates.setdefault(gist["id"], (gist, dict()))
+                contents[local.filename] = content
+            else:
+                new[local.filename] = content
+
+        for gist, contents in updates.values():
+            sent = self.github.update_files(gist, contents) and sent
+        if new:
+            sent = self.github.create_files(new, public=self.public) and sent
+        return sent
+
+    def ls(self, output_format="table"):
         """ Lists all gists from a github user """
-        self.github.list_gists()
+        self.github.list_gists(output_format)
+
+
+def print_rate_limit(ctx, param, value):
+    """Click callback printing GitHub API's rate limit budget and exiting"""
+    if not value or ctx.resilient_parsing:
+        return
+
+    from tabulate import tabulate  # slow to import, so only when needed
+
+    headers = {"User-Agent": GitHubTools.user_agent()}
+    token = GitHubTools._get_token()
+    if token:
+        headers["Authorization"] = "token " + token
+
+    commons = GetGistCommons()
+    url = GitHubTools.api_root_url + "rate_limit"
+    resources = GitHubTools.requests.rate_limit_status(url, **headers)
+    if not resources:
+        commons.oops("Could not read the rate limit from " + url)
+        ctx.exit(1)
+
+    data = tuple(
+        (
+            name,
+            resource.get("limit"),
+            resource.get("used"),
+            resource.get("remaining"),
+            datetime.fromtimestamp(resource.get("reset")).strftime("%H:%M:%S"),
+        )
+        for name, resource in sorted(resources.items())
+    )
+    headers = ("Resource", "Limit", "Used", "Remaining", "Resets at")
+    commons.output(tabulate(data, headers=headers))
+    ctx.exit()
+
+
+def validate_gist(ctx, param, value):
+    """Click callback reading the gist ID from a gist ID or URL"""
+    if value is None:
+        return None
+    gist_id, filename = parse_gist_reference(value)
+    if not gist_id or filename:
+        raise BadParameter("{} is not a gist ID or URL".format(value))
+    return gist_id
+
+
+def validate_duration(ctx, param, value):
+    """Click callback reading a duration (e.g. 30m) in seconds"""
+    if value is None:
+        return None
+    try:
+        return parse_duration(value)
+    except ValueError:
+        msg = "{} is not a duration (e.g. 90s, 30m, 2h or 1d)"
+        raise BadParameter(msg.format(value))
+
+
+def set_output_format(ctx, param, value):
+    """Click callback sending messages to stderr if stdout carries data"""
+    if value != "table":
+        GetGistCommons.data_on_stdout = True
+    return value
+
+
+refresh_completion_after = 60 * 60  # seconds
+
+
+def complete_filenames(ctx, incomplete):
+    """
+    Shell completion of file names read from the local catalog only (no
+    request is sent to the API). If the catalog is stale, it is refreshed in
+    the background for the next completions.
+    :param ctx: (click.Context) with the user (if it is an argument)
+    :param incomplete: (str) beginning of the file name to complete
+    :return: (list) of file names
+    """
+    user = ctx.params.get("user") or getenv("GETGIST_USER")
+    catalog = Catalog()
+    if not user or not exists(catalog.path):
+        return []
+
+    # the token is not validated, as it would take a request
+    authenticated = bool(GitHubTools._get_token())
+    try:
+        scope, synced_at = catalog.latest_scope(user, authenticated)
+        if scope is None:
+            return []
+        names = catalog.filenames(scope, incomplete)
+    finally:
+        catalog.close()
+
+    refresh_in_background(user, scope, synced_at)
+    return names
+
+
+def refresh_in_background(user, scope, synced_at, now=None):
+    """
+    Starts `getgist-cache refresh <user>` in a detached process if the
+    catalog was synced more than refresh_completion_after seconds ago (and
+    no other refresh started meanwhile).
+    :return: (bool) whether a refresh was started
+    """
+    now = now or time()
+    path = cache_dir("refreshes.json")
+    refreshes = read_json(path) or dict()
+    started_at = max(synced_at, refreshes.get(scope, 0))
+    if now - started_at < refresh_completion_after:
+        return False
+
+    import subprocess  # only when a refresh is needed
+
+    refreshes[scope] = now
+    write_json(path, refreshes)
+    code = "from getgist.__main__ import run_cache; run_cache()"
+    subprocess.Popen(
+        (executable, "-c", code, "refresh", user),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return True
+
+
+def filename_completion():
+    """Keyword arguments to complete file names with click 8 or click 7"""
+    if hasattr(Parameter, "shell_complete"):  # click 8
+
+        def shell_complete(ctx, param, incomplete):
+            return complete_filenames(ctx, incomplete)
+
+        return dict(shell_complete=shell_complete)
+
+    from click import __version__  # not deprecated before click 8
+
+    if int(__version__.split(".")[0]) < 7:  # no completion callbacks
+        return dict()
+
+    def autocompletion(ctx, args, incomplete):
+        return complete_filenames(ctx, incomplete)
+
+    return dict(autocompletion=autocompletion)
+
+
+no_cache_option = option(
+    "--no-cache", is_flag=True, help="Do not use nor update the local cache."
+)
+
+newest_option = option(
+    "--newest",
+    "-n",
+    is_flag=True,
+    help="Use the most recently updated gist if more than one has the file.",
+)
+
+gist_option = option(
+    "--gist",
+    "-g",
+    callback=validate_gist,
+    help="ID or URL of the gist to use (skips searching all gists).",
+)
+
+offline_option = option(
+    "--offline",
+    is_flag=True,
+    help="Use only the local cache (no requests to GitHub).",
+)
+
+max_stale_option = option(
+    "--max-stale",
+    callback=validate_duration,
+    help="Use only the local cache if the gists were listed more recently "
+    "than this (e.g. 30m, 2h or 1d).",
+)
+
+format_option = option(
+    "--format",
+    "output_format",
+    type=Choice(("table", "jsonl", "tsv")),
+    default="table",
+    callback=set_output_format,
+    help="Print a table (default), or JSON Lines or TSV as gists are listed.",
+)
+
+rate_limit_option = option(
+    "--rate-limit",
+    is_flag=True,
+    is_eager=True,
+    expose_value=False,
+    callback=print_rate_limit,
+    help="Show GitHub API's rate limit budget and exit.",
+)
 
 
 @command(help=GETGIST_DESC)
+@rate_limit_option
+@no_cache_option
+@offline_option
+@max_stale_option
 @option("--yes-to-all", "-y", is_flag=True, help="Assume yes to all prompts.")
+@newest_option
+@gist_option
 @argument("user")
-@argument("filename")
-def run_getgist(filename, user, **kwargs):
+@argument("filenames", nargs=-1, required=True, **filename_completion())
+def run_getgist(filenames, user, **kwargs):
     """Passes user inputs to GetGist() and calls get()"""
     assume_yes = kwargs.get("yes_to_all")
-    getgist = GetGist(user=user, filename=filename, assume_yes=assume_yes)
-    getgist.get()
+    getgist = GetGist(
+        user=user,
+        filenames=filenames,
+        assume_yes=assume_yes,
+        gist_id=kwargs.get("gist"),
+        newest=kwargs.get("newest"),
+        no_cache=kwargs.get("no_cache"),
+        offline=kwargs.get("offline"),
+        max_stale=kwargs.get("max_stale"),
+    )
+    if not getgist.get():
+        exit(1)
 
 
 @command(help=GETMY_DESC)
+@rate_limit_option
+@no_cache_option
+@offline_option
+@max_stale_option
 @option("--yes-to-all", "-y", is_flag=True, help="Assume yes to all prompts.")
-@argument("filename")
-def run_getmy(filename, **kwargs):
+@newest_option
+@gist_option
+@argument("filenames", nargs=-1, required=True, **filename_completion())
+def run_getmy(filenames, **kwargs):
     """Shortcut for run_getgist() reading username from env var"""
     assume_yes = kwargs.get("yes_to_all")
     user = getenv("GETGIST_USER")
-    getgist = GetGist(user=user, filename=filename, assume_yes=assume_yes)
-    getgist.get()
+    getgist = GetGist(
+        user=user,
+        filenames=filenames,
+        assume_yes=assume_yes,
+        gist_id=kwargs.get("gist"),
+        newest=kwargs.get("newest"),
+        no_cache=kwargs.get("no_cache"),
+        offline=kwargs.get("offline"),
+        max_stale=kwargs.get("max_stale"),
+    )
+    if not getgist.get():
+        exit(1)
 
 
 @command(help=PUTGIST_DESC)
+@rate_limit_option
+@no_cache_option
 @option("--yes-to-all", "-y", is_flag=True, help="Assume yes to all prompts.")
 @option("--private", "-p", is_flag=True, help="Create new gist as private")
+@newest_option
+@gist_option
 @argument("user")
-@argument("filename")
-def run_putgist(filename, user, **kwargs):
+@argument("filenames", nargs=-1, required=True, **filename_completion())
+def run_putgist(filenames, user, **kwargs):
     """Passes user inputs to GetGist() and calls put()"""
     assume_yes = kwargs.get("yes_to_all")
     private = kwargs.get("private")
     getgist = GetGist(
         user=user,
-        filename=filename,
+        filenames=filenames,
         assume_yes=assume_yes,
         create_private=private,
         allow_none=True,
+        gist_id=kwargs.get("gist"),
+        newest=kwargs.get("newest"),
+        no_cache=kwargs.get("no_cache"),
     )
-    getgist.put()
+    if not getgist.put():
+        exit(1)
 
 
 @command(help=PUTMY_DESC)
+@rate_limit_option
+@no_cache_option
 @option("--yes-to-all", "-y", is_flag=True, help="Assume yes to all prompts.")
 @option("--private", "-p", is_flag=True, help="Create new gist as private")
-@argument("filename")
-def run_putmy(filename, **kwargs):
+@newest_option
+@gist_option
+@argument("filenames", nargs=-1, required=True, **filename_completion())
+def run_putmy(filenames, **kwargs):
     """Shortcut for run_putgist() reading username from env var"""
     assume_yes = kwargs.get("yes_to_all")
     private = kwargs.get("private")
     user = getenv("GETGIST_USER")
     getgist = GetGist(
         user=user,
-        filename=filename,
+        filenames=filenames,
         assume_yes=assume_yes,
         create_private=private,
         allow_none=True,
+        gist_id=kwargs.get("gist"),
+        newest=kwargs.get("newest"),
+        no_cache=kwargs.get("no_cache"),
     )
-    getgist.put()
+    if not getgist.put():
+        exit(1)
 
 
 @command(help=LSGISTS_DESC)
+@rate_limit_option
+@no_cache_option
+@offline_option
+@max_stale_option
+@format_option
 @argument("user")
-def run_lsgists(user):
-    getgist = GetGist(user=user)
-    getgist.ls()
+def run_lsgists(user, **kwargs):
+    getgist = GetGist(
+        user=user,
+        no_cache=kwargs.get("no_cache"),
+        offline=kwargs.get("offline"),
+        max_stale=kwargs.get("max_stale"),
+    )
+    getgist.ls(kwargs.get("output_format"))
 
 
 @command(help=MYGISTS_DESC)
-def run_mygists():
+@rate_limit_option
+@no_cache_option
+@offline_option
+@max_stale_option
+@format_option
+def run_mygists(**kwargs):
     user = getenv("GETGIST_USER")
-    getgist = GetGist(user=user)
-    getgist.ls()
+    getgist = GetGist(
+        user=user,
+        no_cache=kwargs.get("no_cache"),
+        offline=kwargs.get("offline"),
+        max_stale=kwargs.get("max_stale"),
+    )
+    getgist.ls(kwargs.get("output_format"))
+
+
+@group(help=CACHE_DESC)
+def run_cache():
+    pass
+
+
+@run_cache.command(help="Remove least recently used cached files.")
+@option("--max-size", help="Size to shrink the cache to (e.g. 10M, default 64M).")
+def prune(max_size=None):
+    blobs = BlobCache()
+    removed, freed = blobs.prune(parse_size(max_size) if max_size else None)
+    message = "Removed {} cached file(s), freeing {} bytes"
+    GetGistCommons().yeah(message.format(removed, freed))
+
+
+@run_cache.command(help="Update the local catalog of gists of a user.")
+@argument("user")
+def refresh(user):
+    github = GitHubTools(user, None)
+    if github.sync_catalog():
+        github.yeah("Catalog of {}'s gists is up to date".format(user))
+    else:
+        exit(1)
+
+
+@run_cache.command(help="Remove everything GetGist has cached.")
+def clear():
+    path = cache_dir()
+    if exists(path):
+        rmtree(path)
+    GetGistCommons().yeah("Removed {}".format(path))
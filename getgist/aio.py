@@ -0,0 +1,225 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import gmtime, strftime
+
+from getgist import GetGistCommons
+from getgist.github import FileFromGist, GitHubTools
+
+
+class AsyncGitHubTools(GetGistCommons):
+    """
+    asyncio counterpart of GitHubTools. There is no asyncio HTTP client among
+    GetGist's dependencies, so requests are still sent through GitHubTools'
+    pooled session, but from a pool of threads owned by this instance: the
+    event loop is never blocked and at most max_concurrency requests are in
+    flight at once. Gists are parsed (GitHubTools._parse_gist) and listed
+    (FileFromGist) exactly as in GitHubTools.
+    """
+
+    max_concurrency = 16  # matches GetGistRequests.pool_maxsize
+
+    def __init__(
+        self, user, file_path=None, assume_yes=False, use_cache=True, **kwargs
+    ):
+        """
+        :param user: (str) GitHub username
+        :param file_path: (str or None) default file name for the methods
+        taking a filename
+        :param assume_yes: (bool) assume yes (or first option) for all prompts
+        :param use_cache: (bool) use the local catalog of gists, the cache
+        of raw files and the cache of API responses
+        :param max_concurrency: (int) maximum number of requests in flight
+        :return: (None)
+        """
+        self.max_concurrency = kwargs.get("max_concurrency") or self.max_concurrency
+        self.github = GitHubTools(user, file_path, assume_yes, use_cache, pipeline=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stops the threads used to send requests"""
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, function, *args, **kwargs):
+        """Runs a blocking function in the pool of threads of the instance"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_event_loop()
+        async with self._semaphore:
+            call = partial(function, *args, **kwargs)
+            return await loop.run_in_executor(self._executor, call)
+
+    async def is_authenticated(self):
+        """Whether the token is valid (waits for its validation, if needed)"""
+        return await self._run(lambda: self.github.is_authenticated)
+
+    async def get_gists(self):
+        """
+        Async generator of gists (dict), in the same format and order as
+        GitHubTools.get_gists(), e.g. `async for gist in tools.get_gists()`.
+        """
+        github = self.github
+        if github.catalog is None:
+            count = 0
+            async for page in self._get_gists_pages():
+                # abort if a page could not be fetched
+                if page is None:
+                    return
+
+                # abort if there are no gists
+                if not count and not page:
+                    self.oops("No gists found for user `{}`".format(github.user))
+                    return
+
+                count += 1
+                for gist in page:
+                    yield github._parse_gist(gist)
+            return
+
+        if not await self._run(github.sync_catalog):
+            return
+
+        gists = await self._run(
+            lambda: list(github.catalog.gists(github.catalog_scope))
+        )
+        if not gists:
+            self.oops("No gists found for user `{}`".format(github.user))
+        for gist in gists:
+            yield gist
+
+    async def _get_gists_pages(self, since=None):
+        """
+        Async generator of pages of gists (list of gists as returned by the
+        API). Once the first page tells the number of the last page, the other
+        pages are all requested concurrently (bounded by max_concurrency) and
+        still yielded in order. If a page cannot be fetched None is yielded
+        and the generator stops.
+        :param since: (float) Unix timestamp to list only gists updated after
+        it
+        """
+        github = self.github
+        if await self.is_authenticated():
+            base_url = github._api_url("gists")
+        else:
+            base_url = github._api_url("users", github.user, "gists")
+
+        updated_after = None
+        if since is not None:
+            updated_after = strftime("%Y-%m-%dT%H:%M:%SZ", gmtime(since))
+
+        first = await self._run(github._get_gists_page, base_url, 1, updated_after)
+        if first is None:
+            yield None
+            return
+        yield first.json()
+
+        pages = range(2, github._last_page(first) + 1)
+        tasks = [
+            asyncio.ensure_future(
+                self._run(github._get_gists_page, base_url, page, updated_after)
+            )
+            for page in pages
+        ]
+        try:
+            for task in tasks:
+                response = await task
+                if response is None:
+                    yield None
+                    return
+                yield response.json()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_gist(self, gist_id):
+        """
+        Fetches a single gist by its ID (no need to list all gists).
+        :param gist_id: (str)
+        :return: (dict) gist parsed by GitHubTools._parse_gist(), or None
+        """
+        return await self._run(self.github.get_gist, gist_id)
+
+    async def select_gist(self, filename=None, allow_none=False, newest=False):
+        """
+        Selects the gist with a file named filename, asking the user (in a
+        thread) if more than one gist has it and assume_yes and newest are not
+        set (see GitHubTools.select_gist).
+        :param filename: (str) defaults to the instance file name
+        :param allow_none: (bool) return None instead of False if no gist is
+        found
+        :param newest: (bool) pick the most recently updated gist
+        :return: (dict) selected gist
+        """
+        filename = filename or self.github.filename
+        matches = list()
+        gists = self.get_gists()
+        try:
+            async for gist in gists:
+                if not any(f["filename"] == filename for f in gist["files"]):
+                    continue
+                if self.github.assume_yes or newest:
+                    return gist
+                matches.append(gist)
+        finally:
+            await gists.aclose()
+
+        if not matches:
+            if allow_none:
+                return None
+            msg = "No file named `{}` found in {}'s gists"
+            self.oops(msg.format(filename, self.github.user))
+            return False
+
+        if len(matches) == 1:
+            return matches[0]
+
+        return await self._run(self.github._ask_which_gist, matches, filename)
+
+    async def list_gists(self):
+        """
+        :return: (list) of FileFromGist for all the files of all the gists
+        (GitHubTools.list_gists prints the same data)
+        """
+        return [
+            gist_file
+            async for gist in self.get_gists()
+            for gist_file in FileFromGist.from_gist(gist)
+        ]
+
+    async def read_gist_file(self, gist, filename=None):
+        """
+        :param gist: (dict) gist parsed by GitHubTools._parse_gist()
+        :param filename: (str) defaults to the instance file name
+        :return: (bytes) contents of the file
+        """
+        return await self._run(self.github.read_gist_file, gist, filename)
+
+    async def update(self, gist, content, filename=None):
+        """
+        Updates the contents of a file in a gist (see GitHubTools.update_files)
+        :param gist: (dict) gist parsed by GitHubTools._parse_gist()
+        :param content: (str or bytes) to be written
+        :param filename: (str) defaults to the instance file name
+        :return: (bool) indicating the success or failure of the update
+        """
+        filename = filename or self.github.filename
+        return await self._run(self.github.update_files, gist, {filename: content})
+
+    async def create(self, content, filename=None, public=True):
+        """
+        Creates a new gist (see GitHubTools.create_files)
+        :param content: (str or bytes) to be written
+        :param filename: (str) defaults to the instance file name
+        :param public: (bool) defines if the gist is public or private
+        :return: (bool) indicating the success or failure of the creation
+        """
+        filename = filename or self.github.filename
+        contents = {filename: content}
+        return await self._run(self.github.create_files, contents, public=public)
@@ -0,0 +1,327 @@
+import os
+import re
+from hashlib import sha256
+from json import dumps, load
+from tempfile import NamedTemporaryFile
+
+
+def cache_dir(*parts):
+    """
+    Path to GetGist's cache directory (or to something inside it). It honors
+    GETGIST_CACHE_DIR and XDG_CACHE_HOME, falling back to ~/.cache/getgist.
+    :param parts: (str) optional path components inside the cache directory
+    :return: (str)
+    """
+    root = os.getenv("GETGIST_CACHE_DIR")
+    if not root:
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        root = os.path.join(base, "getgist")
+    return os.path.join(root, *parts)
+
+
+def write_json(path, data):
+    """Atomically writes data as JSON to path (creating directories)"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with NamedTemporaryFile("w", dir=directory, delete=False) as handler:
+        handler.write(dumps(data))
+    os.replace(handler.name, path)
+
+
+def read_json(path):
+    """Reads a JSON file written by write_json, or None if it is unusable"""
+    try:
+        with open(path) as handler:
+            return load(handler)
+    except (OSError, ValueError):
+        return None
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of HTTP validators (ETag and Last-Modified) and bodies, so
+    unchanged resources can be replayed when the server answers 304.
+    """
+
+    directory = "responses"
+    replay_headers = ("Content-Type", "ETag", "Last-Modified", "Link")
+
+    def __init__(self, path=None):
+        """
+        :param path: (str) directory to store the responses in, defaults to
+        the responses directory inside cache_dir()
+        :return: (None)
+        """
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path or cache_dir(self.directory)
+
+    @staticmethod
+    def key(url, params=None, authorization=None):
+        """
+        Builds a cache key for a request. The Authorization header is part of
+        the key as authenticated and anonymous requests differ in contents.
+        :return: (str)
+        """
+        parts = dumps((url, params, authorization), sort_keys=True, default=str)
+        return sha256(parts.encode("utf-8")).hexdigest()
+
+    def load(self, key):
+        """
+        :param key: (str) key generated by ResponseCache.key()
+        :return: (dict) with etag, last_modified, headers & content, or None
+        """
+        return read_json(os.path.join(self.path, key))
+
+    def save(self, key, response):
+        """
+        Stores validators and body of a response, if it has any validator.
+        :param key: (str) key generated by ResponseCache.key()
+        :param response: (requests.Response)
+        :return: (bool) whether the response was stored
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return False
+
+        headers = {
+            name: response.headers[name]
+            for name in self.replay_headers
+            if name in response.headers
+        }
+        try:
+            content = response.content.decode("utf-8")
+        except UnicodeDecodeError:
+            return False
+
+        data = dict(
+            etag=etag, last_modified=last_modified, headers=headers, content=content
+        )
+        try:
+            write_json(os.path.join(self.path, key), data)
+        except OSError:
+            return False
+        return True
+
+
+def parse_size(size):
+    """
+    Reads a size in bytes from a string such as 512, 64K, 100M or 1G.
+    :param size: (str or int)
+    :return: (int) size in bytes
+    """
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    size = str(size).strip().upper().rstrip("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+DURATION_UNITS = {"S": 1, "M": 60, "H": 60 * 60, "D": 24 * 60 * 60}
+
+
+def parse_duration(duration):
+    """
+    Reads a duration in seconds from a string such as 90, 30s, 10m, 2h or 1d.
+    :param duration: (str or int)
+    :return: (float) duration in seconds
+    """
+    duration = str(duration).strip().upper()
+    if duration and duration[-1] in DURATION_UNITS:
+        return float(duration[:-1]) * DURATION_UNITS[duration[-1]]
+    return float(duration)
+
+
+def format_age(seconds):
+    """
+    Describes a duration the way people do, e.g. 5 minutes or 2 days.
+    :param seconds: (float)
+    :return: (str)
+    """
+    seconds = max(0, int(seconds))
+    for name, unit in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= unit:
+            count = seconds // unit
+            return "{} {}{}".format(count, name, "" if count == 1 else "s")
+    return "{} second{}".format(seconds, "" if seconds == 1 else "s")
+
+
+class BlobCache(object):
+    """
+    On-disk cache of raw gist files. Raw URLs embed the revision (SHA) of
+    the gist, so the content behind a given URL never changes: files are
+    stored under a key derived from the revision and the file name, and
+    evicted least recently used first once the cache is over max_size.
+    """
+
+    directory = "blobs"
+    max_size = parse_size(os.getenv("GETGIST_CACHE_SIZE", "64M"))
+    revision = re.compile(r"/raw/(?P<revision>[0-9a-f]{40})/(?P<filename>.+)$")
+
+    def __init__(self, path=None, max_size=None):
+        """
+        :param path: (str) directory to store the files in, defaults to the
+        blobs directory inside cache_dir()
+        :param max_size: (int) maximum size of the cache in bytes
+        :return: (None)
+        """
+        self._path = path
+        if max_size is not None:
+            self.max_size = max_size
+
+    @property
+    def path(self):
+        return self._path or cache_dir(self.directory)
+
+    def key(self, url):
+        """
+        :param url: (str) raw URL of a file from a gist
+        :return: (str) key of the file in the cache, or None if the URL does
+        not pin a revision (and its content might change)
+        """
+        match = self.revision.search(url or "")
+        if not match:
+            return None
+        filename = sha256(match.group("filename").encode("utf-8")).hexdigest()
+        return "{}-{}".format(match.group("revision"), filename[:16])
+
+    def path_for(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, url):
+        """
+        :param url: (str) raw URL of a file from a gist
+        :return: (bytes) contents of the file, or None if not cached
+        """
+        key = self.key(url)
+        if not key:
+            return None
+
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as handler:
+                content = handler.read()
+            os.utime(path)  # mark as recently used
+        except OSError:
+            return None
+        return content
+
+    def open(self, url):
+        """
+        :param url: (str) raw URL of a file from a gist
+        :return: (file) cached file opened in binary mode, or None
+        """
+        key = self.key(url)
+        if not key:
+            return None
+
+        path = self.path_for(key)
+        try:
+            handler = open(path, "rb")
+            os.utime(path)  # mark as recently used
+        except OSError:
+            return None
+        return handler
+
+    def store(self, url, chunks):
+        """
+        Generator yielding the chunks it receives while storing them in the
+        cache; the file is only added to the cache if all chunks are read
+        and they fit in max_size.
+        :param url: (str) raw URL of a file from a gist
+        :param chunks: (iterable) of bytes
+        """
+        key = self.key(url)
+        if not key:
+            yield from chunks
+            return
+
+        path = self.path_for(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            handler = NamedTemporaryFile("wb", dir=directory, delete=False)
+        except OSError:
+            yield from chunks
+            return
+
+        size, complete = 0, False
+        try:
+            with handler:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size <= self.max_size:
+                        handler.write(chunk)
+                    yield chunk
+            complete = size <= self.max_size
+        finally:
+            if complete:
+                os.replace(handler.name, path)
+                self.prune()
+            else:
+                os.remove(handler.name)
+
+    def put(self, url, content):
+        """
+        :param url: (str) raw URL of a file from a gist
+        :param content: (bytes) contents of the file
+        :return: (bool) whether the file was stored
+        """
+        key = self.key(url)
+        if not key or len(content) > self.max_size:
+            return False
+
+        path = self.path_for(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with NamedTemporaryFile("wb", dir=directory, delete=False) as handler:
+                handler.write(content)
+            os.replace(handler.name, path)
+        except OSError:
+            return False
+
+        self.prune()
+        return True
+
+    def entries(self):
+        """
+        :return: (list) of tuples with last use (timestamp), size and path of
+        each cached file
+        """
+        entries = list()
+        for directory, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def prune(self, max_size=None):
+        """
+        Removes least recently used files until the cache fits in max_size.
+        :param max_size: (int) in bytes, defaults to self.max_size
+        :return: (tuple) number of files removed and bytes freed
+        """
+        max_size = self.max_size if max_size is None else max_size
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed, freed = 0, 0
+        for _, size, path in entries:
+            if total - freed <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+        return removed, freed
@@ -0,0 +1,365 @@
+import os
+from itertools import groupby
+from operator import itemgetter
+from sys import intern
+from threading import Lock
+from time import time
+from uuid import uuid4
+
+from getgist.cache import cache_dir
+from getgist.models import Gist
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gists (
+    scope TEXT NOT NULL,
+    id TEXT NOT NULL,
+    description TEXT,
+    url TEXT,
+    public INTEGER,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (scope, id)
+);
+CREATE TABLE IF NOT EXISTS files (
+    scope TEXT NOT NULL,
+    gist_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    raw_url TEXT,
+    size INTEGER,
+    PRIMARY KEY (scope, gist_id, filename)
+);
+CREATE INDEX IF NOT EXISTS files_by_filename ON files (scope, filename);
+CREATE TABLE IF NOT EXISTS syncs (
+    scope TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL,
+    full_synced_at REAL NOT NULL
+);
+"""
+
+
+class Catalog(object):
+    """
+    Persistent catalog of gists (and their files) stored in a SQLite database
+    in GetGist's cache directory. Gists are kept in the same order the API
+    lists them (most recently updated first), per scope: a scope is a user
+    and whether the listing was authenticated or not, as authenticated
+    listings include secret gists.
+    """
+
+    filename = "catalog.sqlite3"
+    full_sync_every = 24 * 60 * 60
+    chunk_size = 500  # gists read at once (see Catalog._select)
+
+    def __init__(self, path=None):
+        """
+        :param path: (str) path to the SQLite database, defaults to a file
+        inside cache_dir()
+        :return: (None)
+        """
+        self._path = path
+        self._connection = None
+        self.lock = Lock()
+
+    @property
+    def path(self):
+        return self._path or cache_dir(self.filename)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            import sqlite3  # only when the catalog is used
+
+            # the catalog lists secret gists: keep it private to the user
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+            os.chmod(self.path, 0o600)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.executescript(SCHEMA)
+            columns = connection.execute("PRAGMA table_info(files)").fetchall()
+            if "size" not in (column[1] for column in columns):  # older catalogs
+                connection.execute("ALTER TABLE files ADD COLUMN size INTEGER")
+            self._connection = connection
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @staticmethod
+    def scope(user, authenticated=False):
+        """
+        :param user: (str) GitHub username
+        :param authenticated: (bool) whether the listing includes secret gists
+        :return: (str)
+        """
+        return "{}:{}".format(user.lower(), "auth" if authenticated else "anon")
+
+    def synced_at(self, scope):
+        """
+        :param scope: (str) created by Catalog.scope()
+        :return: (float) Unix timestamp of the last sync, or None
+        """
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT synced_at FROM syncs WHERE scope = ?", (scope,)
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def latest_scope(self, user, authenticated=False):
+        """
+        Finds the most complete listing of a user's gists in the catalog,
+        without requests to the API: the authenticated one (which includes
+        secret gists) if authenticated and if there is one, or else the
+        anonymous one.
+        :param user: (str) GitHub username
+        :param authenticated: (bool) whether there is a token (the token is
+        not validated)
+        :return: (tuple) scope and Unix timestamp of its last sync, or
+        (None, None) if the user's gists were never listed
+        """
+        if self._connection is None and not os.path.exists(self.path):
+            return None, None
+        scopes = (self.scope(user),)
+        if authenticated:
+            scopes = (self.scope(user, authenticated=True),) + scopes
+        for scope in scopes:
+            synced_at = self.synced_at(scope)
+            if synced_at is not None:
+                return scope, synced_at
+        return None, None
+
+    def needs_full_sync(self, scope, now=None):
+        """
+        Incremental syncs cannot tell about deleted gists, so the whole
+        catalog of a scope is refreshed from time to time.
+        :param scope: (str) created by Catalog.scope()
+        :param now: (float) Unix timestamp, defaults to the current time
+        :return: (bool)
+        """
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT full_synced_at FROM syncs WHERE scope = ?", (scope,)
+            )
+            row = cursor.fetchone()
+        if not row:
+            return True
+        return (now or time()) - row[0] > self.full_sync_every
+
+    def replace(self, scope, gists, synced_at):
+        """
+        Replaces all the gists of a scope.
+        :param scope: (str) created by Catalog.scope()
+        :param gists: (iterable) of gists parsed by GitHubTools._parse_gist()
+        in the order the API lists them
+        :param synced_at: (float) Unix timestamp of when the listing started
+        :return: (None)
+        """
+        with self.lock, self.connection as connection:
+            connection.execute("DELETE FROM files WHERE scope = ?", (scope,))
+            connection.execute("DELETE FROM gists WHERE scope = ?", (scope,))
+            for position, gist in enumerate(gists):
+                self._insert(connection, scope, gist, position)
+            connection.execute(
+                "INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)",
+                (scope, synced_at, synced_at),
+            )
+
+    @staticmethod
+    def staging(scope):
+        """
+        :param scope: (str) created by Catalog.scope()
+        :return: (str) a scope of its own to write a full listing to while it
+        is fetched, so syncs of the same scope can overlap (e.g. getgist
+        running in many jobs at once)
+        """
+        return "{}:staging:{}".format(scope, uuid4().hex)
+
+    def append(self, scope, gists, position=0):
+        """
+        Adds a page of gists after the ones already in a staging scope,
+        committing it right away.
+        :param scope: (str) created by Catalog.staging()
+        :param gists: (iterable) of gists parsed by GitHubTools._parse_gist()
+        in the order the API lists them
+        :param position: (int) position of the first gist of the page
+        :return: (int) position of the first gist of the next page
+        """
+        with self.lock, self.connection as connection:
+            for position, gist in enumerate(gists, position):
+                self._insert(connection, scope, gist, position)
+                position += 1
+        return position
+
+    def promote(self, staging, scope, synced_at):
+        """
+        Replaces all the gists of a scope by the ones written to a staging
+        scope (see Catalog.append) once the listing is complete, in a single
+        transaction.
+        :param staging: (str) created by Catalog.staging()
+        :param scope: (str) created by Catalog.scope()
+        :param synced_at: (float) Unix timestamp of when the listing started
+        :return: (None)
+        """
+        with self.lock, self.connection as connection:
+            for table in ("files", "gists"):
+                query = "DELETE FROM {} WHERE scope = ?".format(table)
+                connection.execute(query, (scope,))
+                query = "UPDATE {} SET scope = ? WHERE scope = ?".format(table)
+                connection.execute(query, (scope, staging))
+            connection.execute(
+                "INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)",
+                (scope, synced_at, synced_at),
+            )
+
+    def discard(self, staging):
+        """
+        Deletes what was written to a staging scope of a listing that was not
+        completed.
+        :param staging: (str) created by Catalog.staging()
+        :return: (None)
+        """
+        with self.lock, self.connection as connection:
+            for table in ("files", "gists"):
+                query = "DELETE FROM {} WHERE scope = ?".format(table)
+                connection.execute(query, (staging,))
+
+    def update(self, scope, gists, synced_at):
+        """
+        Adds or updates gists changed since the last sync.
+        :param scope: (str) created by Catalog.scope()
+        :param gists: (iterable) of gists parsed by GitHubTools._parse_gist()
+        in the order the API lists them (they are newer than the ones
+        already in the catalog, so they are placed before them)
+        :param synced_at: (float) Unix timestamp of when the listing started
+        :return: (None)
+        """
+        gists = tuple(gists)
+        with self.lock, self.connection as connection:
+            cursor = connection.execute(
+                "SELECT MIN(position) FROM gists WHERE scope = ?", (scope,)
+            )
+            first = cursor.fetchone()[0] or 0
+            for position, gist in enumerate(gists, first - len(gists)):
+                connection.execute(
+                    "DELETE FROM files WHERE scope = ? AND gist_id = ?",
+                    (scope, gist["id"]),
+                )
+                self._insert(connection, scope, gist, position)
+            connection.execute(
+                "UPDATE syncs SET synced_at = ? WHERE scope = ?", (synced_at, scope)
+            )
+
+    def gists(self, scope):
+        """
+        :param scope: (str) created by Catalog.scope()
+        :return: (generator) of gists in the same format and order as
+        GitHubTools.get_gists()
+        """
+        return self._select(scope)
+
+    def find(self, scope, filename):
+        """
+        :param scope: (str) created by Catalog.scope()
+        :param filename: (str) name of a file inside a gist
+        :return: (generator) of gists (in the same format and order as
+        GitHubTools.get_gists()) that contain a file with that name
+        """
+        return self._select(scope, filename)
+
+    def gist(self, scope, gist_id):
+        """
+        :param scope: (str) created by Catalog.scope()
+        :param gist_id: (str)
+        :return: (Gist) in the same format as GitHubTools.get_gists(), or None
+        """
+        return next(self._select(scope, gist_id=gist_id), None)
+
+    def filenames(self, scope, prefix=""):
+        """
+        Reads only the (indexed) file names, without loading any gist.
+        :param scope: (str) created by Catalog.scope()
+        :param prefix: (str) list only the file names starting with it
+        :return: (list) of file names, sorted
+        """
+        query = "SELECT DISTINCT filename FROM files WHERE scope = ?"
+        params = (scope,)
+        if prefix:
+            # a range (instead of LIKE) is case sensitive and uses the index
+            query += " AND filename >= ? AND filename < ?"
+            params += (prefix, prefix + "\U0010ffff")
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY filename", params)
+            return [name for name, in rows.fetchall()]
+
+    def _select(self, scope, filename=None, gist_id=None):
+        """
+        Reads gists in chunks of chunk_size (with their files, in a single
+        ordered query per chunk), so they are yielded without loading them
+        all and without holding the lock while callers read them.
+        """
+        gists = "SELECT * FROM gists WHERE scope = ?"
+        params = (scope,)
+        if filename is not None:
+            subquery = "SELECT gist_id FROM files WHERE scope = ? AND filename = ?"
+            gists += " AND id IN ({})".format(subquery)
+            params += (scope, filename)
+        if gist_id is not None:
+            gists += " AND id = ?"
+            params += (gist_id,)
+        query = (
+            "SELECT g.id, g.description, g.url, g.public, g.position, "
+            "f.filename, f.raw_url, f.size "
+            "FROM ({} ORDER BY position LIMIT ?) AS g "
+            "LEFT JOIN files AS f ON f.scope = g.scope AND f.gist_id = g.id "
+            "ORDER BY g.position, f.filename"
+        )
+        first, after = query.format(gists), query.format(gists + " AND position > ?")
+
+        position = None
+        while True:
+            with self.lock:
+                if position is None:
+                    chunk = (first, params + (self.chunk_size,))
+                else:
+                    chunk = (after, params + (position, self.chunk_size))
+                rows = self.connection.execute(*chunk).fetchall()
+            if not rows:
+                return
+
+            for gist, rows in groupby(rows, key=itemgetter(0, 1, 2, 3, 4)):
+                gist_id, description, url, public, position = gist
+                files = tuple(
+                    (intern(name), raw_url, size)
+                    for *_, name, raw_url, size in rows
+                    if name is not None  # a gist without files
+                )
+                yield Gist(description, gist_id, files, url, bool(public))
+
+    @staticmethod
+    def _insert(connection, scope, gist, position):
+        connection.execute(
+            "INSERT OR REPLACE INTO gists VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                scope,
+                gist["id"],
+                gist["description"],
+                gist["url"],
+                gist["public"],
+                position,
+            ),
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO files "
+            "(scope, gist_id, filename, raw_url, size) VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    scope,
+                    gist["id"],
+                    gist_file["filename"],
+                    gist_file["raw_url"],
+                    gist_file.get("size"),
+                )
+                for gist_file in gist["files"]
+            ),
+        )
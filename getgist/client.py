@@ -0,0 +1,232 @@
+import os
+from threading import Lock
+from time import time
+
+from getgist.github import FileFromGist, GitHubTools
+
+
+class GetGistError(Exception):
+    """Base class for the errors raised by GetGistClient"""
+
+
+class AuthenticationError(GetGistError):
+    """Raised when an operation requires a valid token"""
+
+
+class GistNotFoundError(GetGistError):
+    """Raised when no gist (or no file in a gist) matches a request"""
+
+
+class AmbiguousGistError(GetGistError):
+    """Raised when more than one gist has the requested file"""
+
+    def __init__(self, message, gists):
+        super().__init__(message)
+        self.gists = gists
+
+
+class QuietGitHubTools(GitHubTools):
+    """
+    GitHubTools that prints nothing: error messages are kept in self.errors
+    so they can be raised as exceptions. It can also use a token other than
+    the one from the GETGIST_TOKEN envvar.
+    """
+
+    def __init__(self, user, file_path, assume_yes=False, use_cache=True, **kwargs):
+        self.token = kwargs.pop("token", None)
+        self.errors = list()
+        super().__init__(user, file_path, assume_yes, use_cache, **kwargs)
+
+    def output(self, message, color=None):
+        if color == "red":
+            self.errors.append(message)
+
+    def _get_token(self):
+        return self.token or GitHubTools._get_token()
+
+
+class GetGistClient(object):
+    """
+    Programmatic interface to GetGist, meant to be created once and reused:
+    the HTTP session, the authentication and the local catalog of gists are
+    kept across calls. Nothing is printed, nothing is prompted and errors
+    are raised as GetGistError (or one of its subclasses).
+
+        client = GetGistClient("cuducos")
+        content = client.get(".vimrc")
+        client.put(".vimrc", content + b"set number")
+    """
+
+    sync_every = 60  # seconds before listing the gists changed meanwhile
+
+    def __init__(self, user, token=None, use_cache=True):
+        """
+        :param user: (str) GitHub username
+        :param token: (str) personal access token, defaults to the
+        GETGIST_TOKEN envvar
+        :param use_cache: (bool) use the local catalog of gists, the cache
+        of raw files and the cache of API responses
+        :return: (None)
+        """
+        if not user:
+            raise GetGistError("A GitHub username is required")
+        self.github = QuietGitHubTools(
+            user, None, assume_yes=True, use_cache=use_cache, token=token
+        )
+        self._synced_at = None
+        self._lock = Lock()
+
+    def close(self):
+        """Closes the local catalog (it is opened again if needed)"""
+        if self.github.catalog is not None:
+            self.github.catalog.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def is_authenticated(self):
+        return self.github.is_authenticated
+
+    def gists(self):
+        """
+        :return: (list) of gists (dict) as parsed by GitHubTools._parse_gist()
+        most recently updated first
+        """
+        github = self.github
+        if github.catalog is None:
+            del github.errors[:]
+            pages = list(github._get_gists_pages())
+            if None in pages:
+                self._raise("Could not list {}'s gists".format(github.user))
+            return [github._parse_gist(gist) for page in pages for gist in page]
+
+        self._sync()
+        return list(github.catalog.gists(github.catalog_scope))
+
+    def _sync(self):
+        """Lists the gists changed since the last sync of the local catalog
+        (if it is older than sync_every)"""
+        github = self.github
+        with self._lock:  # callers from other threads wait for the same sync
+            del github.errors[:]
+            if self._synced_at is None or time() - self._synced_at > self.sync_every:
+                github._catalog_synced = False
+            if not github.sync_catalog():
+                self._raise("Could not list {}'s gists".format(github.user))
+            self._synced_at = time()
+
+    def ls(self):
+        """
+        :return: (list) of FileFromGist for all the files of all the gists
+        """
+        return [
+            gist_file
+            for gist in self.gists()
+            for gist_file in FileFromGist.from_gist(gist)
+        ]
+
+    def find(self, filename):
+        """
+        :param filename: (str) name of a file inside a gist
+        :return: (list) of gists with a file named filename, most recently
+        updated first
+        """
+        name = os.path.basename(filename)
+        github = self.github
+        if github.catalog is None:
+            return [
+                gist
+                for gist in self.gists()
+                if any(gist_file["filename"] == name for gist_file in gist["files"])
+            ]
+
+        self._sync()
+        return list(github.catalog.find(github.catalog_scope, name))
+
+    def get(self, filename, gist_id=None, newest=False):
+        """
+        Reads a file from a gist.
+        :param filename: (str) name of the file
+        :param gist_id: (str) ID of the gist, instead of looking for the file
+        in all the gists
+        :param newest: (bool) if more than one gist has the file, use the most
+        recently updated one instead of raising AmbiguousGistError
+        :return: (bytes) contents of the file
+        """
+        gist = self._select(filename, gist_id, newest)
+        if gist is None:
+            msg = "No file named `{}` found in {}'s gists"
+            raise GistNotFoundError(msg.format(filename, self.github.user))
+
+        download = self.github.stream_gist_file(
+            gist, filename=os.path.basename(filename)
+        )
+        if download is None:
+            self._raise("Could not read {}".format(filename))
+        return b"".join(download)
+
+    def put(self, filename, content, gist_id=None, newest=False, public=True):
+        """
+        Writes a file to the gist that has it (or to a new gist). Nothing is
+        sent if the gist already has the same contents.
+        :param filename: (str) name of the file
+        :param content: (str or bytes) to be written
+        :param gist_id: (str) ID of the gist, instead of looking for the file
+        in all the gists
+        :param newest: (bool) if more than one gist has the file, use the most
+        recently updated one instead of raising AmbiguousGistError
+        :param public: (bool) whether a new gist is public or private
+        :return: (dict) the updated (read again after the update) or created
+        gist
+        """
+        if not self.is_authenticated:
+            raise AuthenticationError("A valid token is required to write gists")
+
+        name = os.path.basename(filename)
+        gist = self._select(filename, gist_id, newest, allow_none=True)
+        if gist is None:
+            gist = self.github.create_files({name: content}, public=public)
+        elif self.github.update_files(gist, {name: content}):
+            gist = self.github.get_gist(gist["id"])
+            if not gist:
+                self._raise("Could not read {} back".format(filename))
+        else:
+            gist = False
+        if not gist:
+            self._raise("Could not send {}".format(filename))
+
+        self._synced_at = None  # list the changes on the next call
+        return gist
+
+    def _select(self, filename, gist_id=None, newest=False, allow_none=False):
+        """
+        :return: (dict) the gist to read filename from (or write it to), or
+        None if there is none
+        """
+        name = os.path.basename(filename)
+        if gist_id:
+            gist = self.github.get_gist(gist_id)
+            if not gist:
+                self._raise("Gist `{}` not found".format(gist_id), GistNotFoundError)
+            if allow_none or any(f["filename"] == name for f in gist["files"]):
+                return gist
+            msg = "No file named `{}` found in gist `{}`"
+            raise GistNotFoundError(msg.format(filename, gist_id))
+
+        matches = self.find(filename)
+        if len(matches) > 1 and not newest:
+            msg = "{} gists have a file named `{}`"
+            raise AmbiguousGistError(msg.format(len(matches), filename), matches)
+        return matches[0] if matches else None
+
+    def _raise(self, message, error=GetGistError):
+        """Raises the last error reported by GitHubTools (or message)"""
+        errors = self.github.errors
+        if errors:
+            message = errors[-1]
+        del errors[:]
+        raise error(message)
@@ -1,45 +1,60 @@
 import os
+import re
+from collections import deque
+from datetime import datetime
+from hashlib import sha256
+from itertools import islice
+from threading import Lock
 from json import dumps
-from pkg_resources import get_distribution
+from time import gmtime, strftime, time
+from functools import lru_cache
+from urllib.parse import parse_qs, urlparse
 
 from click import prompt
 
 from getgist import GetGistCommons
-from getgist.request import GetGistRequests
-
-
-class FileFromGist:
-    def __init__(self, name, gist, url, public):
-        self.name = name
-        self.gist = gist
-        self.url = url
-        self.public = public
-
-    def __str__(self):
-        if self.public:
-            return self.name
-        return "{} [Secret Gist]".format(self.name)
-
-    def __repr__(self):
-        return str(
-            {
-                "name": self.name,
-                "gist": self.gist,
-                "url": self.url,
-                "public": self.public,
-            }
-        )
+from getgist.cache import BlobCache, cache_dir, format_age, read_json, write_json
+from getgist.catalog import Catalog
+from getgist.index import FilenameIndex, is_pattern
+from getgist.models import FileFromGist, Gist
+from getgist.request import Download, GetGistRequests
 
-    def __eq__(self, other):
-        if self.name != other.name:
-            return False
-        if self.gist != other.gist:
-            return False
-        if self.url != other.url:
-            return False
-        if self.public != other.public:
-            return False
-        return True
+
+@lru_cache(maxsize=None)
+def get_version():
+    """
+    Reads GetGist's version from the package metadata (only when needed, as
+    the modules to read it are slow to import).
+    :return: (str)
+    """
+    try:
+        from importlib.metadata import version
+    except ImportError:  # Python < 3.8
+        from pkg_resources import get_distribution
+
+        return get_distribution("getgist").version
+    return version("getgist")
+
+
+GIST_REFERENCE = re.compile(
+    r"^(?:https://gist\.github\.com/(?:[\w-]+/)?)?(?P<gist_id>[0-9a-f]{20,})"
+    r"(?::(?P<filename>.+))?$"
+)
+
+
+def parse_gist_reference(reference):
+    """
+    Reads a gist ID or a gist URL, optionally followed by a colon and a file
+    name, e.g. `aa5a315d61ae9438b18d:.vimrc` or
+    `https://gist.github.com/cuducos/aa5a315d61ae9438b18d:.vimrc`.
+    :param reference: (str)
+    :return: (tuple) with the gist ID and the file name (or None for any of
+    them not found in the reference)
+    """
+    match = GIST_REFERENCE.match(reference or "")
+    if not match:
+        return None, None
+    return match.group("gist_id"), match.group("filename")
 
 
 def oauth_only(function):
@@ -80,33 +95,138 @@ def with_filename_only(function):
 class GitHubTools(GetGistCommons):
     """Helpers to deal with GitHub API and manipulate gists"""
 
-    version = get_distribution("getgist").version
     api_root_url = "https://api.github.com/"
-    headers = {
-        "Accept": "application/vnd.github.v3+json",
-        "User-Agent": "GetGist v{}".format(version),
-    }
+    per_page = 100
+    max_workers = 4
+    clock_skew = 60
+    headers = {"Accept": "application/vnd.github.v3+json"}
     requests = GetGistRequests(headers)
-    is_authenticated = False
+    token_ttl = int(os.getenv("GETGIST_TOKEN_TTL", 24 * 60 * 60))
+    _authenticated = False
+    _validation = None
 
-    def __init__(self, user, file_path, assume_yes=False):
+    def __init__(
+        self,
+        user,
+        file_path,
+        assume_yes=False,
+        use_cache=True,
+        pipeline=False,
+        offline=False,
+        max_stale=None,
+    ):
         """
         Save basic variables to all methods, instantiate GetGistrequests and
         calls the OAuth method.
         :param user: (str) GitHub username
         :param file_path: (str or None) file_path to be saved (locally), created or updated (remotelly)
         :param assume_yes: (bool) assume yes (or first option) for all prompts
+        :param use_cache: (bool) use the local catalog of gists, the cache
+        of raw files and the cache of API responses
+        :param pipeline: (bool) validate the token in the background while
+        the first page of gists is requested (see start_oauth_check)
+        :param offline: (bool) answer only from the local catalog of gists
+        and cache of raw files, never reaching the API
+        :param max_stale: (float) seconds: if the local catalog was synced
+        more recently than that, answer from the local caches as if offline
         :return: (None)
         """
         self.user = user
         self.file_path = file_path
         self.filename = os.path.basename(file_path) if file_path else None
         self.assume_yes = assume_yes
-        self.add_oauth_header()
+        self.use_cache = use_cache
+        self.catalog = Catalog() if use_cache else None
+        self.blobs = BlobCache() if use_cache else None
+        self._catalog_synced = False
+        self._catalog_sync_lock = Lock()
+        self._filename_index = None
+        self.offline = offline
+        self.max_stale = max_stale
+        self.local_listing = self._local_listing()
+
+        # headers (e.g. the token) are per instance, connections are shared
+        self.headers = dict(self.headers, **{"User-Agent": self.user_agent()})
+        self.requests = GitHubTools.requests.with_headers(self.headers)
+        if offline or self.local_listing:
+            pass  # answered from the local caches, no need to check the token
+        elif pipeline:
+            self.start_oauth_check()
+        else:
+            self.add_oauth_header()
+
+    def _local_listing(self):
+        """
+        Listing of gists in the local catalog to answer from without reaching
+        the API, i.e. when offline or if it is more recent than max_stale.
+        :return: (tuple) catalog scope and Unix timestamp of its last sync,
+        or None
+        """
+        if self.catalog is None or not (self.offline or self.max_stale is not None):
+            return None
+
+        scope, synced_at = self.catalog.latest_scope(
+            self.user, authenticated=bool(self._get_token())
+        )
+        if scope is None:
+            return None
+        if self.offline or time() - synced_at <= self.max_stale:
+            return scope, synced_at
+        return None
+
+    @staticmethod
+    def user_agent():
+        return "GetGist v{}".format(get_version())
+
+    @property
+    def is_authenticated(self):
+        """Whether the token is valid (waits for a token check in progress)"""
+        self.wait_for_oauth_check()
+        return self._authenticated
+
+    @is_authenticated.setter
+    def is_authenticated(self, value):
+        self._authenticated = value
+
+    @property
+    def is_checking_token(self):
+        """Whether a token check started by start_oauth_check is in progress"""
+        return self._validation is not None and not self._validation.done()
+
+    def wait_for_oauth_check(self):
+        """Waits for a token check started by start_oauth_check (if any)"""
+        if self._validation is not None:
+            self._validation.result()
+
+    def start_oauth_check(self):
+        """
+        Like add_oauth_header, but if the token has to be validated against
+        the API it happens in the background, so the validation overlaps
+        with the first requests (see GitHubTools._get_gists_pages). Reading
+        is_authenticated waits for the validation to finish.
+        :return: (None)
+        """
+        oauth_token = self._get_token()
+        if not oauth_token:
+            return
+
+        if self._cached_login(oauth_token) == self.user.lower():
+            self.add_oauth_header()
+            return
 
-    def add_oauth_header(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        self._validation = executor.submit(self.add_oauth_header, True)
+        executor.shutdown(wait=False)
+
+    def add_oauth_header(self, revalidate=False):
         """
-        Validate token and add the proper header for further requests.
+        Validate token and add the proper header for further requests. A
+        successful validation is cached (see GitHubTools.token_ttl) so the
+        API is not reached again until the cache expires or the token is
+        rejected.
+        :param revalidate: (bool) ignore the cached validation
         :return: (None)
         """
         # abort if no token
@@ -114,8 +234,14 @@ class GitHubTools(GetGistCommons):
         if not oauth_token:
             return
 
-        # add oauth header & reach the api
+        # add oauth header & use the cached validation if possible
         self.headers["Authorization"] = "token " + oauth_token
+        if not revalidate and self._cached_login(oauth_token) == self.user.lower():
+            self.is_authenticated = True
+            self.yeah("User {} authenticated".format(self.user))
+            return
+
+        # reach the api
         url = self._api_url("user")
         raw_resp = self.requests.get(url)
         resp = raw_resp.json()
@@ -124,114 +250,652 @@ class GitHubTools(GetGistCommons):
         if resp.get("login", "").lower() != self.user.lower():
             self.oops("Invalid token for user " + self.user)
             self.headers.pop("Authorization")
+            self.is_authenticated = False
+            self._cache_login(oauth_token, None)
             return
 
         self.is_authenticated = True
+        self._cache_login(oauth_token, self.user.lower())
         self.yeah("User {} authenticated".format(self.user))
 
-    def get_gists(self, page=1):
+    def check_authorization(self, response):
+        """
+        Validates the token again if an authenticated request is refused
+        with 401 (e.g. the token was revoked after it was cached as valid).
+        :param response: (requests.Response)
+        :return: (bool) False if the token was rejected
+        """
+        if response.status_code != 401 or not self.is_authenticated:
+            return True
+        self.add_oauth_header(revalidate=True)
+        return False
+
+    @staticmethod
+    def _token_cache_path():
+        return cache_dir("tokens.json")
+
+    def _cached_login(self, token):
+        """
+        :param token: (str) personal access token
+        :return: (str) login validated for this token within token_ttl, or
+        None
+        """
+        if not self.use_cache:
+            return None
+        tokens = read_json(self._token_cache_path()) or dict()
+        cached = tokens.get(sha256(token.encode("utf-8")).hexdigest())
+        if not cached or time() - cached.get("validated_at", 0) > self.token_ttl:
+            return None
+        return cached.get("login")
+
+    def _cache_login(self, token, login):
+        """
+        Stores (or forgets, if login is None) the login validated for a
+        token, keyed by a hash of the token (the token itself is not stored).
+        :param token: (str) personal access token
+        :param login: (str) GitHub login (lower case) or None
+        :return: (None)
+        """
+        if not self.use_cache:
+            return
+        path = self._token_cache_path()
+        tokens = read_json(path) or dict()
+        key = sha256(token.encode("utf-8")).hexdigest()
+        if login:
+            tokens[key] = dict(login=login, validated_at=time())
+        elif key not in tokens:
+            return
+        else:
+            tokens.pop(key)
+        try:
+            write_json(path, tokens)
+        except OSError:
+            pass
+
+    def get_gists(self):
         """
         List generator containing gist relevant information
         such as id, description, filenames and raw URL (dict).
+        Gists come from the local catalog (synced incrementally with the API)
+        unless it is disabled.
+        """
+        if self.catalog is None:
+            yield from self.fetch_gists()
+            return
+
+        found = False
+        for gist in self._sync_catalog():  # a full sync streams the gists
+            found = True
+            yield gist
+
+        if not self._catalog_synced:
+            return
+
+        if not found:
+            for gist in self.catalog.gists(self.catalog_scope):
+                found = True
+                yield gist
+
+        if not found:
+            self.oops("No gists found for user `{}`".format(self.user))
+
+    def fetch_gists(self):
+        """
+        List generator containing gist relevant information
+        such as id, description, filenames and raw URL (dict), straight from
+        the API (i.e. not using the local catalog).
         """
-        # fetch all gists
-        if self.is_authenticated:
+        if self.offline:
+            self.oops("Gists cannot be listed offline without the local cache")
+            return
+
+        for count, page in enumerate(self._get_gists_pages()):
+            # abort if a page could not be fetched
+            if page is None:
+                return
+
+            # abort if there are no gists
+            if not count and not page:
+                self.oops("No gists found for user `{}`".format(self.user))
+                return
+
+            # parse response
+            yield from (self._parse_gist(gist) for gist in page)
+
+    def sync_catalog(self):
+        """
+        Updates the local catalog with the gists changed since the last sync
+        (or with all gists, see Catalog.needs_full_sync).
+        :return: (bool) indicating the success or failure of the sync
+        """
+        for _ in self._sync_catalog():
+            pass
+        return self._catalog_synced
+
+    def _sync_catalog(self):
+        """
+        Generator behind sync_catalog. Only one sync runs at a time per
+        instance (e.g. for lookups from many threads, see AsyncGitHubTools):
+        other callers wait for it and then find the catalog synced.
+        """
+        with self._catalog_sync_lock:
+            yield from self._run_catalog_sync()
+
+    def _run_catalog_sync(self):
+        """
+        Generator behind _sync_catalog. A full sync is written to a staging
+        scope of its own page by page and its gists are yielded as soon as
+        their page arrives, so callers can stream them, or stop early. The
+        last page is promoted to the catalog before its gists are yielded, so
+        the sync is complete even if callers stop on that page; if they stop
+        before it, the staged gists are discarded, the catalog is kept as it
+        was and the next sync is a full sync again. An incremental sync
+        yields nothing: the few gists changed are merged into the catalog
+        once they are all listed.
+        """
+        if self._catalog_synced:
+            return
+
+        if self.local_listing:
+            _, synced_at = self.local_listing
+            msg = "Using {}'s gists as listed {} ago{}"
+            age = format_age(time() - synced_at)
+            self.warn(msg.format(self.user, age, " (offline)" if self.offline else ""))
+            self._catalog_synced = True
+            return
+
+        if self.offline:
+            msg = "{}'s gists are not in the local cache, list them once online"
+            self.oops(msg.format(self.user))
+            return
+
+        # speculate the token is valid while it is checked (see
+        # GitHubTools._get_gists_pages)
+        authenticated = self.is_checking_token or self.is_authenticated
+        scope = Catalog.scope(self.user, authenticated)
+        full = self.catalog.needs_full_sync(scope)
+        since = None if full else self.catalog.synced_at(scope)
+        started = time() - self.clock_skew
+
+        staging, position, gists = Catalog.staging(scope), 0, list()
+        pages = self._get_gists_pages_until_last(since)
+        promoted = False
+        try:
+            for page, last in pages:
+                if page is None:
+                    return
+
+                if scope != self.catalog_scope:  # the token is not valid after all
+                    pages.close()
+                    yield from self._run_catalog_sync()
+                    return
+
+                parsed = [self._parse_gist(gist) for gist in page]
+                if not full:
+                    gists.extend(parsed)
+                    continue
+
+                position = self.catalog.append(staging, parsed, position)
+                if last:
+                    self.catalog.promote(staging, scope, started)
+                    promoted = self._catalog_synced = True
+                    self._filename_index = None
+                yield from parsed
+
+            if not full:
+                self.catalog.update(scope, gists, started)
+        finally:
+            pages.close()
+            if full and not promoted and position:
+                self.catalog.discard(staging)
+
+        self._catalog_synced = True
+        self._filename_index = None
+
+    @property
+    def filename_index(self):
+        """FilenameIndex of the files of all the gists (listed only once)"""
+        if self._filename_index is None:
+            self._filename_index = FilenameIndex(self.get_gists())
+        return self._filename_index
+
+    @property
+    def catalog_scope(self):
+        if self.local_listing:
+            scope, _ = self.local_listing
+            return scope
+        return Catalog.scope(self.user, self.is_authenticated)
+
+    def _get_gists_pages(self, since=None):
+        """
+        Generator of pages of gists (list of gists as returned by the API).
+        Pages are requested with the maximum page size; once the first page
+        tells the number of the last page (Link header), the other pages are
+        fetched concurrently and still yielded in order. If a page cannot be
+        fetched None is yielded and the generator stops.
+        :param since: (float) Unix timestamp to list only gists updated after
+        it
+        """
+        pages = self._get_gists_pages_until_last(since)
+        try:
+            for page, _ in pages:
+                yield page
+        finally:
+            pages.close()
+
+    def _get_gists_pages_until_last(self, since=None):
+        """
+        Generator behind _get_gists_pages, yielding tuples with each page and
+        whether it is the last one (None and False if a page cannot be
+        fetched).
+        :param since: (float) Unix timestamp to list only gists updated after
+        it
+        """
+        # while the token is checked, speculate it is valid: the first page
+        # of the authenticated listing is requested in the meantime
+        speculative = self.is_checking_token
+        headers = dict()
+        if speculative:
+            base_url = self._api_url("gists")
+            headers["Authorization"] = "token " + self._get_token()
+        elif self.is_authenticated:
             base_url = self._api_url("gists")
         else:
             base_url = self._api_url("users", self.user, "gists")
 
-        url = "{}?page={}".format(base_url, page)
+        updated_after = None
+        if since is not None:
+            updated_after = strftime("%Y-%m-%dT%H:%M:%SZ", gmtime(since))
+
+        first = self._get_gists_page(
+            base_url, 1, updated_after, quiet=speculative, **headers
+        )
+        if speculative:
+            if not self.is_authenticated:  # the token is not valid after all
+                yield from self._get_gists_pages_until_last(since)
+                return
+            if first is None:  # fetch it again to report why it failed
+                first = self._get_gists_page(base_url, 1, updated_after)
+        if first is None:
+            yield None, False
+            return
+        last = self._last_page(first)
+        yield first.json(), last == 1
+
+        # fetch the remaining pages keeping up to max_workers requests ahead
+        from concurrent.futures import ThreadPoolExecutor
+
+        pages = iter(range(2, last + 1))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque(
+                executor.submit(self._get_gists_page, base_url, page, updated_after)
+                for page in islice(pages, self.max_workers)
+            )
+            try:
+                while pending:
+                    response = pending.popleft().result()
+                    for page in islice(pages, 1):
+                        future = executor.submit(
+                            self._get_gists_page, base_url, page, updated_after
+                        )
+                        pending.append(future)
+                    if response is None:
+                        yield None, False
+                        return
+                    yield response.json(), not pending
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _get_gists_page(self, base_url, page, since=None, quiet=False, **headers):
+        """
+        Fetches a page of gists.
+        :param base_url: (str) URL of the gists listing
+        :param page: (int) page number
+        :param since: (str) ISO 8601 timestamp to list only gists updated
+        after it
+        :param quiet: (bool) do not report errors
+        :param headers: extra headers for the request
+        :return: (requests.Response) or None if the request failed
+        """
+        url = "{}?per_page={}&page={}".format(base_url, self.per_page, page)
+        if since:
+            url += "&since={}".format(since)
         self.output("Fetching " + url)
-        raw_resp = self.requests.get(url)
+        # each incremental listing has its own URL: caching it would only
+        # pile up entries that are never requested again
+        cache = self.use_cache and not since
+        raw_resp = self.requests.get(url, cache=cache, **headers)
 
-        # abort if user not found
+        # abort if rate limit is exceeded or if user not found
+        if raw_resp.status_code != 200 and quiet:
+            return None
         if raw_resp.status_code != 200:
-            self.oops("User `{}` not found".format(self.user))
-            return
+            if self.requests.rate_limit.is_exceeded(raw_resp):
+                self.oops(self._rate_limit_message())
+            elif self.check_authorization(raw_resp):
+                self.oops("User `{}` not found".format(self.user))
+            return None
 
-        # abort if there are no gists
-        resp = raw_resp.json()
-        if not resp:
-            if page == 1:
-                self.oops("No gists found for user `{}`".format(self.user))
-            return
+        return raw_resp
 
-        # parse response
-        yield from (self._parse_gist(gist) for gist in raw_resp.json())
+    @staticmethod
+    def _last_page(response):
+        """
+        Reads the number of the last page from the Link header of a response.
+        :param response: (requests.Response)
+        :return: (int) 1 if there is no link to the last page
+        """
+        links = response.headers.get("Link", "")
+        match = re.search(r'<([^>]+)>;\s*rel="last"', links)
+        if not match:
+            return 1
+        query = parse_qs(urlparse(match.group(1)).query)
+        return int(query.get("page", [1])[0])
 
-        # check next page
-        try:
-            yield from (gist for gist in self.get_gists(page=page + 1))
-        except StopIteration:
-            pass
+    def get_gist(self, gist_id):
+        """
+        Fetches a single gist by its ID (no need to list all gists).
+        :param gist_id: (str)
+        :return: (dict) gist parsed by GitHubTools._parse_gist(), or None
+        """
+        if self.local_listing:
+            gist = self.catalog.gist(self.catalog_scope, gist_id)
+            if gist is not None:
+                self.sync_catalog()  # reports how old the catalog is
+                return gist
+        if self.offline:
+            self.oops("Gist `{}` not found in the local cache".format(gist_id))
+            return None
+
+        self.wait_for_oauth_check()  # secret gists require the token
+        url = self._api_url("gists", gist_id)
+        self.output("Fetching " + url)
+        response = self.requests.get(url, cache=self.use_cache)
+
+        if response.status_code != 200:
+            if self.requests.rate_limit.is_exceeded(response):
+                self.oops(self._rate_limit_message())
+            elif self.check_authorization(response):
+                self.oops("Gist `{}` not found".format(gist_id))
+            return None
+
+        return self._parse_gist(response.json())
+
+    @with_filename_only
+    def select_gist_by_id(self, gist_id, allow_none=False):
+        """
+        Selects a gist by its ID instead of looking for the requested filename
+        in all the gists of the user.
+        :param gist_id: (str)
+        :allow_none: (bool) for `getgist` the gist has to have a file with the
+        requested filename, but for `putgist` it is fine if it doesn't
+        :return: (dict) selected gist, or False if not found
+        """
+        gist = self.get_gist(gist_id)
+        if not gist:
+            return False
+
+        filenames = (gist_file.get("filename") for gist_file in gist.get("files"))
+        if not allow_none and self.filename not in filenames:
+            msg = "No file named `{}` found in gist `{}`"
+            self.oops(msg.format(self.file_path, gist_id))
+            return False
+
+        return gist
 
     @with_filename_only
-    def select_gist(self, allow_none=False):
+    def select_gist(self, allow_none=False, newest=False):
         """
         Given the requested filename, it selects the proper gist; if more than
         one gist is found with the given filename, user is asked to choose.
+        Gists are searched lazily: when the first match is enough (assume_yes
+        or newest) no further gists (or pages of gists) are fetched.
         :allow_none: (bool) for `getgist` it should raise error if no gist is
         found, but setting this argument to True avoid this error, which is
         useful when `putgist` is calling this method
+        :newest: (bool) pick the most recently updated gist (the first one
+        listed by the API) instead of asking the user
         :return: (dict) selected gist
         """
-        # pick up all matching gists
-        matches = list()
-        for gist in self.get_gists():
-            for gist_file in gist.get("files"):
-                if self.filename == gist_file.get("filename"):
-                    matches.append(gist)
+        # pick up the first matching gist
+        matches = self._find_gists()
+        first = next(matches, None)
 
         # abort if no match is found
-        if not matches:
+        if first is None:
             if allow_none:
                 return None
             else:
                 msg = "No file named `{}` found in {}'s gists"
                 self.oops(msg.format(self.file_path, self.user))
-                if not self.is_authenticated:
+                if self._catalog_synced or self._filename_index is not None:
+                    # only if the gists were listed (e.g. not offline without
+                    # the local cache, which would be reported again)
+                    self._did_you_mean(self.filename, self.filename_index)
+                if self.catalog_scope != Catalog.scope(self.user, True):
                     self.warn("To access private gists set the GETGIST_TOKEN")
                     self.warn("(see `getgist --help` for details)")
                 return False
 
+        # return the first match if that is all we need
+        if self.assume_yes or newest:
+            matches.close()
+            return first
+
         # return if there's is only one match
-        if len(matches) == 1 or self.assume_yes:
-            return matches.pop(0)
-
-        return self._ask_which_gist(matches)
-
-    def list_gists(self):
-        """ Prints all gists names, filenames and URLs"""
-        gists = tuple(
-            FileFromGist(
-                gist.get("description"),
-                gist_file.get("filename"),
-                gist.get("url"),
-                gist.get("public"),
-            )
+        others = list(matches)
+        if not others:
+            return first
+
+        return self._ask_which_gist([first] + others)
+
+    def select_files(self, filenames, gist_id=None, newest=False, allow_none=False):
+        """
+        Selects the gists to download several files from. All file names and
+        glob patterns (e.g. `*.toml`) are resolved against a single listing
+        of gists (or against a single gist if gist_id is set); if a file is
+        found in more than one gist, user is asked to choose.
+        :param filenames: (iterable) of file names, glob patterns or gist
+        references (e.g. `<gist id>:<file name>`)
+        :param gist_id: (str) ID of the gist to look the files up in, instead
+        of listing all gists
+        :param newest: (bool) pick the most recently updated gist instead of
+        asking the user
+        :param allow_none: (bool) for `getgist` file names not found are
+        errors, but for `putgist` they are selected with None (i.e. they go to
+        a new gist)
+        :return: (list) of tuples with the local path of each file and the
+        selected gist (dict), or False for file names and patterns not found;
+        each local path is selected only once (e.g. `.vimrc` and `*rc`)
+        """
+        indexes, selected, seen = dict(), list(), set()
+        for path in filenames:
+            reference_id, reference_filename = parse_gist_reference(path)
+            if reference_id and reference_filename:
+                path = reference_filename
+            else:
+                reference_id = gist_id
+
+            if reference_id:
+                if reference_id not in indexes:
+                    gist = self.get_gist(reference_id)
+                    indexes[reference_id] = FilenameIndex([gist] if gist else [])
+                index = indexes[reference_id]
+            else:
+                index = self.filename_index
+
+            directory, pattern = os.path.split(path)
+            names = index.search(pattern)
+
+            if not names and path in seen:
+                continue
+            if not names:
+                seen.add(path)
+
+            if not names and allow_none and not is_pattern(pattern):
+                selected.append((path, None))
+                continue
+
+            if not names:
+                msg = "No file named `{}` found in {}'s gists"
+                self.oops(msg.format(path, self.user))
+                if not is_pattern(pattern):
+                    self._did_you_mean(pattern, index)
+                selected.append((path, False))
+                continue
+
+            for name in names:
+                local_path = os.path.join(directory, name)
+                if local_path in seen:
+                    continue
+                seen.add(local_path)
+                matches = index.gists(name)
+                if self.assume_yes or newest or len(matches) == 1:
+                    gist = matches[0]
+                else:
+                    gist = self._ask_which_gist(matches, name)
+                selected.append((local_path, gist))
+
+        return selected
+
+    def _find_gists(self):
+        """
+        Generator of gists containing a file with the requested filename, in
+        the order they are listed by the API (most recently updated first).
+        """
+        if self.catalog is None:
+            index = FilenameIndex()
+            for gist in self.fetch_gists():
+                index.add(gist)
+                filenames = (gist_file.get("filename") for gist_file in gist["files"])
+                if self.filename in filenames:
+                    yield gist
+            self._filename_index = index  # all gists were listed
+        else:
+            streamed = False
+            for gist in self._sync_catalog():  # a full sync streams the gists
+                streamed = True
+                filenames = (gist_file["filename"] for gist_file in gist["files"])
+                if self.filename in filenames:
+                    yield gist
+            if self._catalog_synced and not streamed:
+                yield from self.catalog.find(self.catalog_scope, self.filename)
+
+    def list_gists(self, output_format="table"):
+        """
+        Prints all gists names, filenames and URLs
+        :param output_format: (str) table, or jsonl or tsv to print each file
+        as soon as it is listed (see GetGistCommons.rows)
+        """
+        gists = (
+            gist_file
             for gist in self.get_gists()
-            for gist_file in gist.get("files")
+            for gist_file in FileFromGist.from_gist(gist)
         )
-        self.tabulate(*gists)
+        if output_format == "table":
+            self.tabulate(*gists)
+        else:
+            self.rows(gists, output_format)
 
-    @with_filename_only
-    def read_gist_file(self, gist):
+    def read_gist_file(self, gist, filename=None):
         """
         Returns the contents of file hosted inside a gist at GitHub.
         :param gist: (dict) gist parsed by GitHubTools._parse()
+        :param filename: (str) name of the file, defaults to self.filename
         :return: (bytes) content of a gist loaded from GitHub
         """
-        url = False
-        files = gist.get("files")
-        for gist_file in files:
-            if gist_file.get("filename") == self.filename:
-                url = gist_file.get("raw_url")
-                break
+        url = self.raw_url(gist, filename)
         if url:
+            if self.blobs is not None:
+                content = self.blobs.get(url)
+                if content is not None:
+                    self.output("Reading {} (cached)".format(url))
+                    return content
+
+            if self.offline:
+                self.oops("{} is not in the local cache".format(url))
+                return None
+
             self.output("Reading {}".format(url))
             response = self.requests.get(url)
+            if self.blobs is not None and response.status_code == 200:
+                self.blobs.put(url, response.content)
             return response.content
 
+    def stream_gist_file(self, gist, offset=0, etag=None, filename=None):
+        """
+        Returns the contents of file hosted inside a gist at GitHub as an
+        iterable of chunks, downloaded only as they are read.
+        :param gist: (dict) gist parsed by GitHubTools._parse()
+        :param offset: (int) resume a download from this position (the whole
+        file is downloaded if the server does not support ranges)
+        :param etag: (str) validator of the partially downloaded content, so
+        the whole file is downloaded if it changed
+        :param filename: (str) name of the file, defaults to self.filename
+        :return: (Download) or None if the file cannot be downloaded
+        """
+        url = self.raw_url(gist, filename)
+        if not url:
+            return None
+
+        if self.blobs is not None:
+            handler = self.blobs.open(url)
+            if handler:
+                self.output("Reading {} (cached)".format(url))
+                return Download.from_file(url, handler)
+
+        if self.offline:
+            self.oops("{} is not in the local cache".format(url))
+            return None
+
+        # ranges count bytes of the body as sent: ask for it uncompressed, so
+        # the size of a partial download is a valid offset to resume from
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            self.output("Resuming {} from byte {}".format(url, offset))
+            headers["Range"] = "bytes={}-".format(offset)
+            if etag:
+                headers["If-Range"] = etag
+        else:
+            self.output("Reading {}".format(url))
+
+        response = self.requests.stream(url, **headers)
+        if offset and response.status_code == 416:
+            response.close()
+            return self.stream_gist_file(gist, filename=filename)
+
+        if response.status_code == 206:
+            return Download.from_response(url, response, offset)
+
+        if response.status_code != 200:
+            response.close()
+            msg = "Could not read {} (GET request returned {})"
+            self.oops(msg.format(url, response.status_code))
+            return None
+
+        download = Download.from_response(url, response)
+        if self.blobs is not None:
+            download.chunks = self.blobs.store(url, download.chunks)
+        return download
+
+    def raw_url(self, gist, filename=None):
+        """Raw URL of a file (defaults to self.filename) in a gist (or None)"""
+        filename = filename or self.filename
+        for gist_file in gist.get("files"):
+            if gist_file.get("filename") == filename:
+                return gist_file.get("raw_url")
+        return None
+
+    def file_size(self, gist, filename=None):
+        """Size in bytes of a file (defaults to self.filename) in a gist (or
+        None if unknown)"""
+        filename = filename or self.filename
+        for gist_file in gist.get("files"):
+            if gist_file.get("filename") == filename:
+                return gist_file.get("size")
+        return None
+
     @with_filename_only
     @oauth_only
     def update(self, gist, content):
@@ -245,14 +909,41 @@ class GitHubTools(GetGistCommons):
         if content is False:
             return False
 
+        return self.update_files(gist, {self.filename: content})
+
+    @oauth_only
+    def update_files(self, gist, contents):
+        """
+        Updates the contents of several files hosted inside a gist at GitHub
+        with a single request (and a single revision of the gist).
+        :param gist: (dict) gist parsed by GitHubTools._parse_gist()
+        :param contents: (dict) contents (str or bytes) by file name
+        :return: (bool) indicatind the success or failure of the update
+        """
+        # skip files with the same contents in the gist
+        unchanged = tuple(
+            name
+            for name, content in contents.items()
+            if not self.has_changed(gist, content, name)
+        )
+        if unchanged:
+            msg = "{} unchanged in {}, skipping"
+            self.hey(msg.format(", ".join(unchanged), gist.get("description")))
+            contents = {n: c for n, c in contents.items() if n not in unchanged}
+        if not contents:
+            self.yeah("Nothing to update")
+            return True
+
         # request
         url = self._api_url("gists", gist.get("id"))
-        data = {"files": {self.filename: {"content": content}}}
-        self.output("Sending contents of {} to {}".format(self.file_path, url))
-        response = self.requests.patch(url, data=dumps(data))
+        data = {"files": {name: {"content": c} for name, c in contents.items()}}
+        names = ", ".join(contents)
+        self.output("Sending contents of {} to {}".format(names, url))
+        response = self.requests.patch(url, data=dumps(data), safe=True)
 
         # error
         if response.status_code != 200:
+            self.check_authorization(response)
             self.oops("Could not update " + gist.get("description"))
             self.oops("PATCH request returned " + str(response.status_code))
             return False
@@ -262,6 +953,40 @@ class GitHubTools(GetGistCommons):
         self.hey("The URL to this Gist is: {}".format(gist["url"]))
         return True
 
+    def has_changed(self, gist, content, filename=None):
+        """
+        Compares the size of the contents to be sent with the size of the file
+        in the gist, as listed by the API, and only if they match compares
+        their hashes: the file in the gist is read from the cache of raw files
+        or downloaded from its raw URL (which does not count towards the API
+        rate limit).
+        :param gist: (dict) gist parsed by GitHubTools._parse_gist()
+        :param content: (str or bytes) to be sent
+        :param filename: (str) name of the file, defaults to self.filename
+        :return: (bool) False only if the file in the gist is known to have
+        the same contents
+        """
+        url = self.raw_url(gist, filename)
+        if not url:
+            return True
+
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        size = self.file_size(gist, filename)
+        if size is not None and size != len(content):
+            return True
+
+        remote = self.blobs.get(url) if self.blobs is not None else None
+        if remote is None:
+            response = self.requests.get(url)
+            if response.status_code != 200:
+                return True
+            remote = response.content
+            if self.blobs is not None:
+                self.blobs.put(url, remote)
+
+        return sha256(content).digest() != sha256(remote).digest()
+
     @with_filename_only
     @oauth_only
     def create(self, content, **kwargs):
@@ -276,22 +1001,35 @@ class GitHubTools(GetGistCommons):
         if content is False:
             return False
 
+        return self.create_files({self.filename: content}, **kwargs)
+
+    @oauth_only
+    def create_files(self, contents, **kwargs):
+        """
+        Create a new gist with several files in a single request.
+        :param contents: (dict) contents (str or bytes) by file name
+        :param public: (bool) defines if the gist is public or private
+        :return: (dict) the created gist parsed by GitHubTools._parse_gist(),
+        or False if the creation failed
+        """
         # set new gist
         public = bool(kwargs.get("public", True))
+        names = ", ".join(contents)
         data = {
-            "description": self.filename,
+            "description": names,
             "public": public,
-            "files": {self.filename: {"content": content}},
+            "files": {name: {"content": c} for name, c in contents.items()},
         }
 
         # send request
         url = self._api_url("gists")
-        self.output("Sending contents of {} to {}".format(self.file_path, url))
+        self.output("Sending contents of {} to {}".format(names, url))
         response = self.requests.post(url, data=dumps(data))
 
         # error
         if response.status_code != 201:
-            self.oops("Could not create " + self.filename)
+            self.check_authorization(response)
+            self.oops("Could not create " + names)
             self.oops("POST request returned " + str(response.status_code))
             return False
 
@@ -301,18 +1039,30 @@ class GitHubTools(GetGistCommons):
         # success
         self.yeah("Done!")
         self.hey("The URL to this Gist is: {}".format(gist["url"]))
-        return True
+        return gist
 
-    @with_filename_only
-    def _ask_which_gist(self, matches):
+    def _did_you_mean(self, filename, index):
+        """
+        Suggests file names similar to one not found (e.g. a typo)
+        :param filename: (str) file name not found
+        :param index: (FilenameIndex) of the gists it was looked up in
+        :return: (None)
+        """
+        suggestions = index.fuzzy(filename)
+        if suggestions:
+            names = ", ".join("`{}`".format(name) for name in suggestions)
+            self.warn("Did you mean {}?".format(names))
+
+    def _ask_which_gist(self, matches, filename=None):
         """
         Asks user which gist to use in case of more than one gist matching the
         instance filename.
         :param matches: (list) of dictionaries generated within select_gists()
+        :param filename: (str) name of the file, defaults to self.filename
         :return: (dict) of the selected gist
         """
         # ask user which gist to use
-        self.hey("Use {} from which gist?".format(self.filename))
+        self.hey("Use {} from which gist?".format(filename or self.filename))
         for count, gist in enumerate(matches, 1):
             self.hey("[{}] {}".format(count, gist.get("description")))
 
@@ -328,35 +1078,23 @@ class GitHubTools(GetGistCommons):
         self.output("Using `{}` Gist".format(selected["description"]))
         return selected
 
+    def _rate_limit_message(self):
+        """Explains that the rate limit is exhausted and when it resets"""
+        message = "GitHub API rate limit exceeded"
+        reset = self.requests.rate_limit.reset
+        if reset:
+            reset_at = datetime.fromtimestamp(reset).strftime("%H:%M:%S")
+            message += " (it resets at {})".format(reset_at)
+        return message
+
     def _api_url(self, *args):
         """Get entrypoints adding arguments separated by slashes"""
         return self.api_root_url + "/".join(args)
 
     @staticmethod
     def _parse_gist(gist):
-        """Receive a gist (dict) and parse it to GetGist"""
-
-        # parse files
-        files = list()
-        file_names = sorted(filename for filename in gist["files"].keys())
-        for name in file_names:
-            files.append(
-                dict(filename=name, raw_url=gist["files"][name].get("raw_url"))
-            )
-
-        # parse description
-        description = gist["description"]
-        if not description:
-            names = sorted(f.get("filename") for f in files)
-            description = names.pop(0)
-
-        return dict(
-            description=description,
-            id=gist.get("id"),
-            files=files,
-            url=gist.get("html_url"),
-            public=gist.get("public"),
-        )
+        """Receive a gist (dict) and parse it to GetGist (see models.Gist)"""
+        return Gist.from_api(gist)
 
     @staticmethod
     def _get_token():
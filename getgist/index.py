@@ -0,0 +1,154 @@
+import re
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+
+GLOB_CHARACTERS = re.compile(r"[*?[]")
+
+
+def is_pattern(filename):
+    """Tells whether a file name is a glob pattern, e.g. `*.toml`"""
+    return bool(GLOB_CHARACTERS.search(filename or ""))
+
+
+def deletions(name):
+    """The name itself and every variant of it missing one character"""
+    yield name
+    for position in range(len(name)):
+        after = position + 1
+        yield name[:position] + name[after:]
+
+
+class FilenameIndex(object):
+    """
+    In-memory index of the file names of a listing of gists: a hash map from
+    each file name to the gists that have it (in the order they were added,
+    i.e. most recently updated first) and a sorted list of the file names
+    for prefix and glob lookups. It is built from the local catalog (where
+    the file names are persisted and indexed, see Catalog) or from gists as
+    they are listed by the API.
+
+    Fuzzy lookups use another map, built only when first needed, from the
+    variants of each (lower case) file name missing one character to the
+    file names: names one typo apart share at least one variant.
+    """
+
+    scan_limit = 2000  # slower, broader fuzzy lookups up to this many names
+
+    def __init__(self, gists=None):
+        """
+        :param gists: (iterable) of gists parsed by GitHubTools._parse_gist()
+        :return: (None)
+        """
+        self._gists = dict()
+        self._rank = dict()  # order in which each file name was first added
+        self._names = None
+        self._variants = None
+        for gist in gists or ():
+            self.add(gist)
+
+    def __len__(self):
+        return len(self._gists)
+
+    def __contains__(self, filename):
+        return filename in self._gists
+
+    def add(self, gist):
+        """
+        :param gist: (dict) gist parsed by GitHubTools._parse_gist()
+        :return: (None)
+        """
+        for gist_file in gist["files"]:
+            name = gist_file["filename"]
+            if name not in self._gists:
+                self._gists[name] = list()
+                self._rank[name] = len(self._rank)
+            self._gists[name].append(gist)
+        self._names = None
+        self._variants = None
+
+    @property
+    def names(self):
+        """(list) of all the file names, sorted"""
+        if self._names is None:
+            self._names = sorted(self._gists)
+        return self._names
+
+    def gists(self, filename):
+        """
+        :param filename: (str) name of a file inside a gist
+        :return: (list) of gists with a file named filename
+        """
+        return list(self._gists.get(filename, ()))
+
+    def exact(self, filename):
+        """
+        :param filename: (str)
+        :return: (list) with filename, if it is in the index
+        """
+        return [filename] if filename in self._gists else []
+
+    def prefix(self, prefix):
+        """
+        :param prefix: (str) e.g. `.vim`
+        :return: (list) of the file names starting with prefix, sorted
+        """
+        names = self.names
+        matches = list()
+        for position in range(bisect_left(names, prefix), len(names)):
+            if not names[position].startswith(prefix):
+                break
+            matches.append(names[position])
+        return matches
+
+    def glob(self, pattern):
+        """
+        Only the file names sharing the literal beginning of the pattern (e.g.
+        `.vim` for `.vim*`) are matched against it.
+        :param pattern: (str) e.g. `*.toml`
+        :return: (list) of the file names matching the pattern, in the order
+        they were added (i.e. from the most recently updated gist first)
+        """
+        literal = GLOB_CHARACTERS.split(pattern, maxsplit=1)[0]
+        candidates = self.prefix(literal) if literal else self.names
+        matches = [name for name in candidates if fnmatchcase(name, pattern)]
+        return sorted(matches, key=self._rank.__getitem__)
+
+    def search(self, filename):
+        """
+        :param filename: (str) file name or glob pattern
+        :return: (list) of matching file names
+        """
+        if is_pattern(filename):
+            return self.glob(filename)
+        return self.exact(filename)
+
+    def fuzzy(self, filename, limit=3):
+        """
+        File names similar to filename, e.g. to suggest `.vimrc` for `vimrc`,
+        `.VIMRC` or `.virmc`: names one typo (or case) apart and, in indexes
+        up to scan_limit names, names difflib finds similar enough.
+        :param filename: (str)
+        :param limit: (int) maximum number of suggestions
+        :return: (list) of file names, most similar first
+        """
+        from difflib import SequenceMatcher, get_close_matches  # only on misses
+
+        if self._variants is None:
+            self._variants = dict()
+            for name in self._gists:
+                for variant in set(deletions(name.lower())):
+                    self._variants.setdefault(variant, list()).append(name)
+
+        lower = filename.lower()
+        matches = set()
+        for variant in set(deletions(lower)):
+            matches.update(self._variants.get(variant, ()))
+        matches.discard(filename)
+        if not matches and len(self) <= self.scan_limit:
+            matches.update(get_close_matches(filename, self.names, cutoff=0.8))
+
+        def similarity(name):
+            ratio = SequenceMatcher(None, filename, name).ratio()
+            return name.lower() != lower, -ratio, name
+
+        return sorted(matches, key=similarity)[:limit]
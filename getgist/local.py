@@ -1,13 +1,21 @@
+import mmap
 import os
+import stat
+from hashlib import sha256
+from threading import Lock
 
 from click import confirm
 
 from getgist import GetGistCommons
+from getgist.cache import read_json, write_json
 
 
 class LocalTools(GetGistCommons):
     """Helpers to deal with local files and local file system"""
 
+    prompt_lock = Lock()  # files saved concurrently prompt one at a time
+    mmap_threshold = 1024 * 1024  # hash larger files through mmap
+
     def __init__(self, filename, assume_yes=False):
         """
         Sets the file name to be used by the instance.
@@ -19,27 +27,144 @@ class LocalTools(GetGistCommons):
         self.file_path = os.path.expanduser(filename)
         self.filename = os.path.basename(filename)
         self.assume_yes = assume_yes
+        self.digest = None
 
     def save(self, content):
         """
-        Save any given content to the instance file.
-        :param content: (str or bytes)
+        Save any given content to the instance file. Content is written (and
+        hashed) chunk by chunk to a temporary file next to the instance file,
+        which is then renamed, so an interrupted write never leaves a
+        half-written file behind. If content comes from an URL (e.g. it is a
+        Download) an interrupted temporary file is kept, with the URL and its
+        validator, so the download can be resumed (see LocalTools.partial).
+        :param content: (str, bytes or iterable of bytes, e.g. a Download)
         :return: (None)
         """
-        # backup existing file if needed
-        if os.path.exists(self.file_path) and not self.assume_yes:
-            message = "Overwrite existing {}? (y/n) "
-            if not confirm(message.format(self.filename)):
-                self.backup()
-
-        # write file
-        self.output("Saving " + self.filename)
-        with open(self.file_path, "wb") as handler:
-            if not isinstance(content, bytes):
-                content = bytes(content, "utf-8")
-            handler.write(content)
+        if isinstance(content, str):
+            content = bytes(content, "utf-8")
+        if isinstance(content, bytes):
+            content = (content,)
+
+        temporary = self.temporary_path
+        url = getattr(content, "url", None)
+        offset = getattr(content, "offset", 0)
+        written = False
+        try:
+            if url:
+                partial = dict(url=url, etag=getattr(content, "etag", None))
+                write_json(self.partial_info_path, partial)
+            self.digest = self._write(temporary, content, offset)
+            written = True
+
+            # leave the existing file untouched (e.g. its mtime) if unchanged
+            if self.is_unchanged(temporary):
+                self.yeah("{} is up to date".format(self.filename))
+                return
+
+            # backup existing file if needed
+            if os.path.exists(self.file_path):
+                if not self.assume_yes:
+                    message = "Overwrite existing {}? (y/n) "
+                    with self.prompt_lock:
+                        if not confirm(message.format(self.filename)):
+                            self.backup()
+                if os.path.exists(self.file_path):
+                    mode = stat.S_IMODE(os.stat(self.file_path).st_mode)
+                    os.chmod(temporary, mode)
+
+            # write file
+            self.output("Saving " + self.filename)
+            os.replace(temporary, self.file_path)
+        finally:
+            if written or not url:
+                for path in (temporary, self.partial_info_path):
+                    if os.path.exists(path):
+                        os.remove(path)
         self.yeah("Done!")
 
+    def is_unchanged(self, path):
+        """
+        Tells whether the instance file exists and has the same contents as
+        the file in path (which is hashed as self.digest).
+        :param path: (str) path to the new contents of the instance file
+        :return: (bool)
+        """
+        if not self.digest or not os.path.isfile(self.file_path):
+            return False
+        if os.path.getsize(self.file_path) != os.path.getsize(path):
+            return False
+        return self.file_digest(self.file_path) == self.digest
+
+    @classmethod
+    def file_digest(cls, path):
+        """
+        Hashes a file, mapping it in memory if it is large.
+        :param path: (str)
+        :return: (str) SHA-256 hex digest of the file
+        """
+        with open(path, "rb") as handler:
+            size = os.fstat(handler.fileno()).st_size
+            if size >= cls.mmap_threshold:
+                with mmap.mmap(handler.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return sha256(data).hexdigest()
+
+            digest = sha256()
+            for chunk in iter(lambda: handler.read(64 * 1024), b""):
+                digest.update(chunk)
+            return digest.hexdigest()
+
+    def partial(self, url):
+        """
+        Size and validator of an interrupted download of the instance file.
+        :param url: (str) URL the instance file is being downloaded from
+        :return: (tuple) offset (int) to resume the download from and its
+        validator (str or None), or (0, None) if there is nothing to resume
+        """
+        partial = read_json(self.partial_info_path)
+        if not partial or partial.get("url") != url:
+            return 0, None
+        if not os.path.exists(self.temporary_path):
+            return 0, None
+        return os.path.getsize(self.temporary_path), partial.get("etag")
+
+    @property
+    def temporary_path(self):
+        """Path to the temporary file used while saving the instance file"""
+        directory, filename = os.path.split(os.path.abspath(self.file_path))
+        return os.path.join(directory, ".{}.part".format(filename))
+
+    @property
+    def partial_info_path(self):
+        """Path to the URL and validator of the temporary file"""
+        return "{}.json".format(self.temporary_path)
+
+    @staticmethod
+    def _write(path, chunks, offset=0):
+        """
+        Writes chunks of bytes to a file.
+        :param path: (str) path to the file (created with default permissions)
+        :param chunks: (iterable) of bytes
+        :param offset: (int) if greater than zero, chunks are appended to the
+        first offset bytes of the existing file
+        :return: (str) SHA-256 hex digest of the content
+        """
+        digest = sha256()
+        flags = os.O_RDWR | os.O_CREAT
+        with os.fdopen(os.open(path, flags, 0o666), "r+b") as handler:
+            remaining = offset
+            while remaining:
+                chunk = handler.read(min(remaining, 64 * 1024))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            handler.seek(offset)
+            handler.truncate()
+            for chunk in chunks:
+                digest.update(chunk)
+                handler.write(chunk)
+        return digest.hexdigest()
+
     def backup(self):
         """Backups files with the same name of the instance filename"""
         count = 0
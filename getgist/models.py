@@ -0,0 +1,150 @@
+from collections import namedtuple
+from sys import intern
+
+
+class Record(object):
+    """
+    Mixin for compact, tuple-backed records (see namedtuple): there is no
+    per-instance __dict__, so thousands of gists take a fraction of the
+    memory they would take as dicts. Records can still be read as if they
+    were dicts (e.g. gist["files"] or gist.get("url")) and a record equals a
+    dict with the same keys and values.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            return tuple.__getitem__(self, key)
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self._fields:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self._fields
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            if set(other) != set(self._fields):
+                return False
+            return all(self._field_equals(name, other[name]) for name in other)
+        if isinstance(other, Record) and type(self) is not type(other):
+            return False
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+    def _field_equals(self, name, value):
+        return getattr(self, name) == value
+
+
+class GistFile(Record, namedtuple("GistFile", ("filename", "raw_url", "size"))):
+    """A file from a gist (its size in bytes is None if unknown)"""
+
+    __slots__ = ()
+
+
+class Gist(Record, namedtuple("Gist", ("description", "id", "files", "url", "public"))):
+    """
+    A gist, with its files (a tuple of GistFile) sorted by file name. The
+    files are stored as plain tuples, which (unlike records) the garbage
+    collector stops tracking, so thousands of parsed gists do not slow down
+    its collections: they are read as GistFile records only when accessed.
+    """
+
+    __slots__ = ()
+
+    @property
+    def files(self):
+        new = tuple.__new__
+        return tuple(
+            [new(GistFile, gist_file) for gist_file in tuple.__getitem__(self, 2)]
+        )
+
+    def _field_equals(self, name, value):
+        if name == "files":
+            return list(self.files) == list(value)
+        return super()._field_equals(name, value)
+
+    @classmethod
+    def from_api(cls, gist):
+        """
+        Parses a gist as returned by GitHub's API. File names are interned,
+        as the same names (e.g. README.md) repeat across gists.
+        :param gist: (dict)
+        :return: (Gist)
+        """
+        files = gist["files"]
+        names = sorted(files)
+        gist_files = tuple(
+            [
+                (intern(name), files[name].get("raw_url"), files[name].get("size"))
+                for name in names
+            ]
+        )
+        description = gist["description"]
+        if not description and names:
+            description = names[0]
+        fields = (
+            description,
+            gist.get("id"),
+            gist_files,
+            gist.get("html_url"),
+            gist.get("public"),
+        )
+        # tuple.__new__ skips the (slower) constructor namedtuple generates
+        return tuple.__new__(cls, fields)
+
+
+class FileFromGist(object):
+    __slots__ = ("name", "gist", "url", "public")
+
+    def __init__(self, name, gist, url, public):
+        self.name = name
+        self.gist = gist
+        self.url = url
+        self.public = public
+
+    @classmethod
+    def from_gist(cls, gist):
+        """
+        :param gist: (Gist or dict)
+        :return: (generator) of FileFromGist for each file in a gist
+        """
+        description, url, public = gist["description"], gist["url"], gist["public"]
+        for gist_file in gist["files"]:
+            yield cls(description, gist_file["filename"], url, public)
+
+    def __str__(self):
+        if self.public:
+            return self.name
+        return "{} [Secret Gist]".format(self.name)
+
+    def __repr__(self):
+        return str(
+            {
+                "name": self.name,
+                "gist": self.gist,
+                "url": self.url,
+                "public": self.public,
+            }
+        )
+
+    def __eq__(self, other):
+        if self.name != other.name:
+            return False
+        if self.gist != other.gist:
+            return False
+        if self.url != other.url:
+            return False
+        if self.public != other.public:
+            return False
+        return True
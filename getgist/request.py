@@ -1,18 +1,316 @@
-import requests
+import os
+from random import uniform
+from threading import Lock
+from time import sleep, time
+from urllib.parse import urlparse
+
+from getgist import GetGistCommons
+from getgist.cache import ResponseCache
+
+
+class RateLimit(object):
+    """
+    Tracks GitHub's rate limit budget from the X-RateLimit-* headers of the
+    responses, and tells how long to wait before sending the next request:
+    requests are spread until the reset time once the budget is running low,
+    and paused until the reset time once it is exhausted.
+    """
+
+    threshold = 10
+    max_wait = int(os.getenv("GETGIST_RATE_LIMIT_WAIT", 60))
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.lock = Lock()
+
+    @staticmethod
+    def _header(response, name):
+        try:
+            return int(response.headers.get(name))
+        except (TypeError, ValueError):
+            return None
+
+    def update(self, response):
+        """
+        Reads the rate limit headers from a response (responses without them,
+        e.g. from raw URLs, are ignored).
+        :param response: (requests.Response)
+        :return: (None)
+        """
+        remaining = self._header(response, "X-RateLimit-Remaining")
+        if remaining is None:
+            return
+
+        with self.lock:
+            self.remaining = remaining
+            self.limit = self._header(response, "X-RateLimit-Limit")
+            self.reset = self._header(response, "X-RateLimit-Reset")
+
+    def delay(self, now=None):
+        """
+        Seconds to wait before sending the next request.
+        :param now: (int) Unix timestamp, defaults to the current time
+        :return: (float)
+        """
+        with self.lock:
+            if self.remaining is None or self.reset is None:
+                return 0
+            window = max(self.reset - (now or time()), 0)
+            if self.remaining <= 0:
+                return window
+            if self.remaining < self.threshold:
+                return window / self.remaining
+            return 0
+
+    def retry_after(self, response, now=None):
+        """
+        Seconds to wait before retrying a request refused due to the primary
+        or to the secondary rate limit.
+        :param response: (requests.Response)
+        :param now: (int) Unix timestamp, defaults to the current time
+        :return: (int) or None if the response is not a rate limit refusal
+        """
+        if response.status_code not in (403, 429):
+            return None
+
+        retry_after = self._header(response, "Retry-After")
+        if retry_after is not None:
+            return retry_after
+
+        if self._header(response, "X-RateLimit-Remaining") == 0:
+            reset = self._header(response, "X-RateLimit-Reset") or 0
+            return max(reset - (now or time()), 0)
+
+        return None
+
+    def is_exceeded(self, response):
+        """Tells whether a response was refused due to rate limiting"""
+        return self.retry_after(response) is not None
+
+    def wait(self, seconds):
+        """Sleeps for a while, letting the user know about it"""
+        if seconds > 0:
+            message = "Waiting {:.0f}s for GitHub's API rate limit"
+            GetGistCommons().warn(message.format(seconds))
+            sleep(seconds)
+
+
+class RetryPolicy(object):
+    """
+    Decides whether and when to retry a request after a transient failure
+    (connection errors, timeouts and 5xx responses) using exponential backoff
+    with full jitter, limited by a number of attempts and a total time budget.
+    """
+
+    attempts = int(os.getenv("GETGIST_RETRIES", 4))
+    backoff = 0.5
+    max_backoff = 8
+    budget = 30
+    statuses = (500, 502, 503, 504)
+    idempotent = ("get", "head", "options", "put", "delete")
+
+    def __init__(self, attempts=None, backoff=None, max_backoff=None, budget=None):
+        """
+        :param attempts: (int) maximum number of attempts for each request
+        :param backoff: (float) base delay, in seconds, doubled each retry
+        :param max_backoff: (float) maximum delay between attempts
+        :param budget: (float) maximum time, in seconds, spent on a request
+        :return: (None)
+        """
+        if attempts is not None:
+            self.attempts = attempts
+        if backoff is not None:
+            self.backoff = backoff
+        if max_backoff is not None:
+            self.max_backoff = max_backoff
+        if budget is not None:
+            self.budget = budget
+
+    def is_retryable(self, method, safe=False):
+        """
+        Only idempotent requests are retried, unless the caller knows the
+        request is safe to repeat (e.g. a PATCH setting the whole content).
+        """
+        return safe or method.lower() in self.idempotent
+
+    def delay(self, attempt):
+        """
+        Seconds to wait before the next attempt (full jitter)
+        :param attempt: (int) number of attempts made so far
+        :return: (float)
+        """
+        return uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def allows(self, attempt, started, delay):
+        """
+        Tells if there is room for another attempt after waiting.
+        :param attempt: (int) number of attempts made so far
+        :param started: (float) Unix timestamp of the first attempt
+        :param delay: (float) seconds to wait before the next attempt
+        :return: (bool)
+        """
+        if attempt >= self.attempts:
+            return False
+        return time() - started + delay <= self.budget
+
+
+class Download(object):
+    """
+    Iterable over the content of a file in fixed-size chunks (bytes), so it
+    can be written to disk without holding it all in memory.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, url, chunks, offset=0, etag=None):
+        """
+        :param url: (str) URL of the file
+        :param chunks: (iterable) of bytes
+        :param offset: (int) position of the first chunk in the file (i.e.
+        greater than zero if resuming a download)
+        :param etag: (str) validator of the contents of the file
+        :return: (None)
+        """
+        self.url = url
+        self.chunks = chunks
+        self.offset = offset
+        self.etag = etag
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    @classmethod
+    def from_response(cls, url, response, offset=0):
+        """
+        :param url: (str) URL of the file
+        :param response: (requests.Response) requested with stream=True
+        :param offset: (int) position of the response content in the file
+        :return: (Download)
+        """
+
+        def chunks():
+            try:
+                for chunk in response.iter_content(cls.chunk_size):
+                    if chunk:
+                        yield chunk
+            finally:
+                response.close()
+
+        return cls(url, chunks(), offset, response.headers.get("ETag"))
+
+    @classmethod
+    def from_file(cls, url, handler):
+        """
+        :param url: (str) URL of the file
+        :param handler: (file) opened in binary mode, closed after reading
+        :return: (Download)
+        """
+
+        def chunks():
+            with handler:
+                yield from iter(lambda: handler.read(cls.chunk_size), b"")
+
+        return cls(url, chunks())
 
 
 class GetGistRequests(object):
     """Encapsulate requests lib to always send self.headers as headers"""
 
-    def __init__(self, headers=None):
+    pool_connections = 4
+    pool_maxsize = 16
+    paced_hosts = ("api.github.com",)  # raw files do not count as API requests
+
+    def __init__(
+        self, headers=None, pool_connections=None, pool_maxsize=None, retry=None
+    ):
         """
         Get a header object to use it in all requests
         :param headers: (dict)
+        :param pool_connections: (int) number of hosts to keep a pool for
+        :param pool_maxsize: (int) number of connections to keep per host
+        :param retry: (RetryPolicy) policy for transient failures
         :return: (None)
         """
         if not headers:
             headers = dict()
         self.headers = headers
+        self.pool_connections = pool_connections or self.pool_connections
+        self.pool_maxsize = pool_maxsize or self.pool_maxsize
+        self.response_cache = ResponseCache()
+        self.rate_limit = RateLimit()
+        self.retry = retry or RetryPolicy()
+        self.retries = 0
+        self._retries_lock = Lock()
+        self._session = None
+        self._pool = self  # instance holding the session (see with_headers)
+
+    def with_headers(self, headers):
+        """
+        Creates a GetGistRequests sending its own headers (e.g. with another
+        token), but sharing the pool of connections, the rate limit and the
+        cache of responses of this instance.
+        :param headers: (dict)
+        :return: (GetGistRequests)
+        """
+        requests = GetGistRequests(
+            headers, self.pool_connections, self.pool_maxsize, self.retry
+        )
+        requests.response_cache = self.response_cache
+        requests.rate_limit = self.rate_limit
+        requests._pool = self._pool
+        return requests
+
+    @property
+    def session(self):
+        """
+        Lazily creates a requests.Session with keep-alive connection pools,
+        so every request from this instance reuses TCP/TLS connections.
+        :return: (requests.Session)
+        """
+        pool = self._pool
+        if pool._session is None:
+            import requests  # slow to import, so only when a request is sent
+            from requests.adapters import HTTPAdapter
+
+            adapter = HTTPAdapter(
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            pool._session = session
+        return pool._session
+
+    def close(self):
+        """Closes all pooled connections (a new session is created if needed)"""
+        pool = self._pool
+        if pool._session is not None:
+            pool._session.close()
+            pool._session = None
+
+    def connection_stats(self):
+        """
+        Reports how many requests were sent and how many connections were
+        opened to send them, so reuse of pooled connections can be checked.
+        :return: (dict) with requests, connections and reused counters
+        """
+        stats = dict(requests=0, connections=0, reused=0)
+        session = self._pool._session
+        if session is None:
+            return stats
+
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                stats["requests"] += pool.num_requests
+                stats["connections"] += pool.num_connections
+
+        stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+        return stats
 
     def add_headers(self, **headers):
         """
@@ -23,14 +321,138 @@ class GetGistRequests(object):
         headers.update(self.headers)
         return headers
 
-    def get(self, url, params=None, **kwargs):
-        """Encapsulate requests.get to use this class instance header"""
-        return requests.get(url, params=params, headers=self.add_headers(**kwargs))
+    def get(self, url, params=None, cache=False, **kwargs):
+        """
+        Encapsulate requests.get to use this class instance header. If cache
+        is True the request is conditional (If-None-Match/If-Modified-Since)
+        and the stored response is replayed when the server answers 304.
+        """
+        headers = self.add_headers(**kwargs)
+        if not cache or self.response_cache is None:
+            return self._request("get", url, params=params, headers=headers)
+
+        key = self.response_cache.key(url, params, headers.get("Authorization"))
+        cached = self.response_cache.load(key)
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self._request("get", url, params=params, headers=headers)
+        if response.status_code == 304 and cached:
+            return self._replay(cached, response)
+        if response.status_code == 200:
+            self.response_cache.save(key, response)
+        return response
+
+    def stream(self, url, **kwargs):
+        """
+        Encapsulate requests.get with stream=True to use this class instance
+        header: the body is not downloaded until it is read.
+        """
+        headers = self.add_headers(**kwargs)
+        return self._request("get", url, headers=headers, stream=True)
 
-    def patch(self, url, data=None, **kwargs):
-        """Encapsulate requests.patch to use this class instance header"""
-        return requests.patch(url, data=data, headers=self.add_headers(**kwargs))
+    def patch(self, url, data=None, safe=False, **kwargs):
+        """
+        Encapsulate requests.patch to use this class instance header. If safe
+        is True the request is idempotent and might be retried on failures.
+        """
+        headers = self.add_headers(**kwargs)
+        return self._request("patch", url, safe=safe, data=data, headers=headers)
 
     def post(self, url, data=None, **kwargs):
         """Encapsulate requests.post to use this class instance header"""
-        return requests.post(url, data=data, headers=self.add_headers(**kwargs))
+        headers = self.add_headers(**kwargs)
+        return self._request("post", url, data=data, headers=headers)
+
+    def rate_limit_status(self, url, **kwargs):
+        """
+        Fetches the current rate limit budget (this request itself does not
+        count against the rate limit).
+        :param url: (str) URL of the API's rate_limit endpoint
+        :return: (dict) resource name and its limit, used, remaining and
+        reset values, or None if the request fails
+        """
+        response = self.get(url, **kwargs)
+        if response.status_code != 200:
+            return None
+        return response.json().get("resources")
+
+    @staticmethod
+    def _replay(cached, not_modified):
+        """
+        Builds a 200 response from a cached one, keeping the headers of the
+        fresh 304 response (e.g. rate limit information).
+        :param cached: (dict) loaded from ResponseCache
+        :param not_modified: (requests.Response) the 304 response
+        :return: (requests.Response)
+        """
+        from requests import Response
+
+        response = Response()
+        response.status_code = 200
+        response.url = not_modified.url
+        response.headers.update(cached.get("headers", {}))
+        response.headers.update(not_modified.headers)
+        response.headers.pop("Content-Length", None)
+        response.encoding = "utf-8"
+        response._content = cached["content"].encode("utf-8")
+        response.from_cache = True
+        return response
+
+    def _request(self, method, url, safe=False, **kwargs):
+        """
+        Sends a request through the pooled session honoring the rate limit:
+        requests to the API (see paced_hosts) slow down or pause before the
+        budget runs out, and any request waits and is retried if it is
+        refused due to rate limiting. Transient
+        failures of retryable requests are retried according to self.retry.
+        """
+        from requests import ConnectionError, ConnectTimeout, Timeout
+
+        send = getattr(self.session, method)
+        retryable = self.retry.is_retryable(method, safe)
+        paced = urlparse(url).hostname in self.paced_hosts
+        started, attempt = time(), 0
+        while True:
+            # pace the requests, but never hold one longer than max_wait
+            if paced:
+                delay = min(self.rate_limit.delay(), self.rate_limit.max_wait)
+                self.rate_limit.wait(delay)
+
+            attempt += 1
+            try:
+                response = send(url, **kwargs)
+            except (ConnectionError, Timeout) as error:
+                # a request that could not even connect was never sent
+                connect_error = isinstance(error, ConnectTimeout)
+                delay = self.retry.delay(attempt)
+                if not (retryable or connect_error):
+                    raise
+                if not self.retry.allows(attempt, started, delay):
+                    raise
+            else:
+                self.rate_limit.update(response)
+                retry_after = self.rate_limit.retry_after(response)
+                if retry_after is not None:
+                    if retry_after > self.rate_limit.max_wait:
+                        return response
+                    if attempt >= self.retry.attempts:
+                        return response
+                    response.close()  # release the connection (e.g. streams)
+                    self.rate_limit.wait(retry_after)
+                    delay = 0
+                elif retryable and response.status_code in self.retry.statuses:
+                    delay = self.retry.delay(attempt)
+                    if not self.retry.allows(attempt, started, delay):
+                        return response
+                    response.close()
+                else:
+                    return response
+
+            with self._retries_lock:
+                self.retries += 1
+            if delay:
+                sleep(delay)
@@ -2,6 +2,7 @@ import json
 import os
 from glob import glob
 from tempfile import NamedTemporaryFile
+from urllib.parse import parse_qs, urlparse
 from uuid import uuid4
 
 import pytest
@@ -17,9 +18,10 @@ TEST_FILE_CONTENTS = "42"
 
 
 class MockResponse(object):
-    def __init__(self, content, status_code):
+    def __init__(self, content, status_code, headers=None):
         self.content = content
         self.status_code = status_code
+        self.headers = headers or {}
 
     def __repr__(self):
         return self.content
@@ -37,12 +39,14 @@ def response_mock(uri, **kwargs):
     fail if False) and the .json extension.
 
     :param uri: (str) Example: users/janedoe/gists/page1
-    :param kwargs: case (bool) True/success or False/fail; status_code (int)
+    :param kwargs: case (bool) True/success or False/fail; status_code (int);
+    headers (dict)
     :return: contents of the JSON file (eg: contents of
     tests/fixtures/users_janedoe_gists.success.json)
     """
     case = kwargs.get("case", True)
     status_code = kwargs.get("status_code", 200)
+    headers = kwargs.get("headers")
 
     path = os.path.dirname(__file__)
     parts = dict(
@@ -51,13 +55,34 @@ def response_mock(uri, **kwargs):
         case="success" if case else "fail",
     )
     with open("{path}/{name}.{case}.json".format(**parts)) as fobj:
-        return MockResponse(fobj.read(), status_code)
+        return MockResponse(fobj.read(), status_code, headers)
+
+
+def last_page_mock(last):
+    """Returns the headers of a response whose Link header points to the
+    page number `last` as the last page of a listing."""
+    url = "https://api.github.com/gists?per_page=100&page={}"
+    link = '<{}>; rel="next", <{}>; rel="last"'.format(url.format(2), url.format(last))
+    return {"Link": link}
+
+
+def paged_get_mock(response, uri="users/janedoe/gists", last=2):
+    """Side effect for GetGistRequests.get mocks returning the page of gists
+    requested in the URL (fetched in any order, e.g. by concurrent syncs)"""
+
+    def get(url, **kwargs):
+        page = int(parse_qs(urlparse(url).query)["page"][0])
+        headers = last_page_mock(last) if page == 1 else None
+        return response("{}/page{}".format(uri, page), headers=headers)
+
+    return get
 
 
 def parse_mock(**kwargs):
     """Accepts as kwargs the following arguments to build a dictionary with an
     expected gist (dict) values: id (int), filename (str or list), description
-    (str), user (str) and public (bool).
+    (str), user (str), public (bool) and size (int, or dict of sizes by file
+    name).
     """
 
     # filter the arguments
@@ -67,6 +92,7 @@ def parse_mock(**kwargs):
     gist_url = kwargs.get("url")
     user = kwargs.get("user", "janedoe")
     public = kwargs.get("public", True)
+    size = kwargs.get("size")
 
     filename = kwargs.get("filename", ".gist")
     if not isinstance(filename, list):
@@ -83,13 +109,21 @@ def parse_mock(**kwargs):
     base = "https://gist.githubusercontent.com/"
     for name in filename:
         url = struct.format(base=base, user=user, id=id_, hash=hash_, filename=name)
-        files.append(dict(filename=name, raw_url=url))
+        file_size = size.get(name) if isinstance(size, dict) else size
+        files.append(dict(filename=name, raw_url=url, size=file_size))
 
     return dict(
         description=description, id=id_, files=files, url=gist_url, public=public
     )
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setenv("GETGIST_CACHE_DIR", str(path))
+    return path
+
+
 @pytest.fixture
 def local():
     with open(TEST_FILE, "w") as fobj:
@@ -133,6 +167,7 @@ def gists():
         user=GETGIST_USER,
         filename=".gist",
         url="https://gist.github.com/id_gist_1",
+        size=1024,
         public=True,
     )
     gist2 = parse_mock(
@@ -141,6 +176,7 @@ def gists():
         filename=".gist",
         description="Description of Gist 2",
         url="https://gist.github.com/id_gist_2",
+        size=1024,
         public=True,
     )
     gist3 = parse_mock(
@@ -148,6 +184,7 @@ def gists():
         user=GETGIST_USER,
         filename=[".gist.sample", ".gist.dev"],
         url="https://gist.github.com/id_gist_3",
+        size={".gist.sample": 1024, ".gist.dev": 2048},
         public=True,
     )
     gist4 = parse_mock(
@@ -155,6 +192,7 @@ def gists():
         user=GETGIST_USER,
         filename=".gist.prod",
         url="https://gist.github.com/id_gist_4",
+        size=256,
         public=False,
     )
 
@@ -0,0 +1,147 @@
+import asyncio
+from json import dumps as json_dumps
+
+import pytest
+
+from getgist.aio import AsyncGitHubTools
+from getgist.github import FileFromGist
+from tests.conftest import MockResponse, last_page_mock, paged_get_mock
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def collect(gists):
+    return [gist async for gist in gists]
+
+
+@pytest.fixture
+def tools(mocker):
+    oauth = mocker.patch("getgist.github.GitHubTools.start_oauth_check")
+    oauth.return_value = None
+    tools = AsyncGitHubTools("janedoe", ".gist", use_cache=False)
+    yield tools
+    tools.close()
+
+
+def test_get_gists(mocker, response, gists, tools):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    fetched = run(collect(tools.get_gists()))
+    assert gists[0] in fetched
+    assert gists[1] in fetched
+    assert gists[3] not in fetched
+
+
+def test_get_gists_in_order_with_bounded_concurrency(mocker, response, tools):
+    tools.max_concurrency = 2
+    pages = dict()
+    for number in range(1, 6):
+        headers = last_page_mock(5) if number == 1 else None
+        gist = response("gist/id_gist_1").json()
+        gist["id"] = str(number)
+        pages[number] = MockResponse("[{}]".format(json_dumps(gist)), 200, headers)
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = lambda url, **kwargs: pages[int(url.split("&page=")[1])]
+
+    fetched = run(collect(tools.get_gists()))
+    assert [gist["id"] for gist in fetched] == ["1", "2", "3", "4", "5"]
+    assert tools._semaphore._value == 2
+
+
+def test_get_gists_from_catalog(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.start_oauth_check")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    with_catalog = AsyncGitHubTools("janedoe", ".gist")
+    fetched = run(collect(with_catalog.get_gists()))
+    assert gists[0] in fetched
+    assert run(collect(with_catalog.get_gists())) == fetched
+    assert get.call_count == 2
+    with_catalog.close()
+
+
+def test_select_gist(mocker, response, gists, tools):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    assert run(tools.select_gist(".gist.sample")) == gists[2]
+
+
+def test_concurrent_lookups_share_one_catalog_sync(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.start_oauth_check")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = paged_get_mock(response, last=3)
+
+    async def lookups(tools):
+        names = (".gist.dev", ".gist.sample") * 4
+        return await asyncio.gather(*(tools.select_gist(name) for name in names))
+
+    with_catalog = AsyncGitHubTools("janedoe", ".gist")
+    assert run(lookups(with_catalog)) == [gists[2]] * 8
+    assert get.call_count == 3
+    with_catalog.close()
+
+
+def test_select_gist_newest(mocker, response, gists, tools):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    assert run(tools.select_gist(newest=True)) == gists[0]
+
+
+def test_select_gist_not_found(mocker, response, tools):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    assert run(tools.select_gist(".nope")) is False
+
+
+def test_list_gists(mocker, response, tools):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    files = run(tools.list_gists())
+    assert all(isinstance(gist_file, FileFromGist) for gist_file in files)
+    assert (
+        FileFromGist(".gist", ".gist", "https://gist.github.com/id_gist_1", True)
+        in files
+    )
+
+
+def test_read_gist_file(mocker, parse, tools):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = MockResponse(b"42", 200)
+    gist = parse(id=3, filename=[".gist.dev", ".gist.sample"])
+    assert run(tools.read_gist_file(gist, ".gist.dev")) == b"42"
+    get.assert_called_once_with(gist["files"][0]["raw_url"])
+
+
+def test_update_and_create(mocker, parse, tools):
+    update = mocker.patch("getgist.github.GitHubTools.update_files")
+    create = mocker.patch("getgist.github.GitHubTools.create_files")
+    update.return_value = create.return_value = True
+    gist = parse(id=1)
+    assert run(tools.update(gist, "42"))
+    assert run(tools.create("42", ".vimrc", public=False))
+    update.assert_called_once_with(gist, {".gist": "42"})
+    create.assert_called_once_with({".vimrc": "42"}, public=False)
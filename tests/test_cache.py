@@ -0,0 +1,147 @@
+import os
+
+from requests import Response
+
+from getgist.cache import (
+    BlobCache,
+    ResponseCache,
+    cache_dir,
+    format_age,
+    parse_duration,
+    parse_size,
+)
+
+
+def test_cache_dir_from_env(monkeypatch):
+    monkeypatch.setenv("GETGIST_CACHE_DIR", "/tmp/getgist")
+    assert cache_dir("foo") == os.path.join("/tmp/getgist", "foo")
+
+
+def test_cache_dir_default(monkeypatch):
+    monkeypatch.delenv("GETGIST_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", "/tmp/xdg")
+    assert cache_dir() == os.path.join("/tmp/xdg", "getgist")
+
+
+def test_response_cache_without_validators():
+    response = Response()
+    response._content = b"[]"
+    cache = ResponseCache()
+    key = cache.key("https://api.github.com/gists")
+    assert not cache.save(key, response)
+    assert cache.load(key) is None
+
+
+def test_response_cache_roundtrip():
+    response = Response()
+    response._content = b"[42]"
+    response.headers.update({"ETag": '"abc"', "Link": "<foo>", "X-Foo": "bar"})
+    cache = ResponseCache()
+    key = cache.key("https://api.github.com/gists", authorization="token 42")
+    assert cache.save(key, response)
+    assert cache.load(key) == {
+        "etag": '"abc"',
+        "last_modified": None,
+        "headers": {"ETag": '"abc"', "Link": "<foo>"},
+        "content": "[42]",
+    }
+
+
+def test_response_cache_key():
+    url = "https://api.github.com/gists"
+    assert ResponseCache.key(url) == ResponseCache.key(url)
+    assert ResponseCache.key(url) != ResponseCache.key(url, {"page": 2})
+    assert ResponseCache.key(url) != ResponseCache.key(url, authorization="token")
+
+
+RAW_URL = (
+    "https://gist.githubusercontent.com/janedoe/id_gist_1/raw/"
+    "0123456789abcdef0123456789abcdef01234567/.gist"
+)
+
+
+def test_parse_size():
+    assert parse_size(512) == 512
+    assert parse_size("64K") == 64 * 1024
+    assert parse_size("1.5m") == 1024**2 * 3 // 2
+    assert parse_size("1GB") == 1024**3
+
+
+def test_parse_duration():
+    assert parse_duration(90) == 90
+    assert parse_duration("30s") == 30
+    assert parse_duration("10m") == 10 * 60
+    assert parse_duration("1.5h") == 90 * 60
+    assert parse_duration("2D") == 2 * 24 * 60 * 60
+
+
+def test_format_age():
+    assert format_age(1) == "1 second"
+    assert format_age(42.5) == "42 seconds"
+    assert format_age(60) == "1 minute"
+    assert format_age(5 * 60 + 30) == "5 minutes"
+    assert format_age(2 * 60 * 60) == "2 hours"
+    assert format_age(3 * 24 * 60 * 60) == "3 days"
+
+
+def test_blob_cache_key():
+    blobs = BlobCache()
+    assert blobs.key(RAW_URL).startswith("0123456789abcdef0123456789abcdef01234567-")
+    assert blobs.key(RAW_URL) != blobs.key(RAW_URL.replace(".gist", ".vimrc"))
+    assert blobs.key("https://gist.githubusercontent.com/janedoe/42/raw/.gist") is None
+
+
+def test_blob_cache_roundtrip():
+    blobs = BlobCache()
+    assert blobs.get(RAW_URL) is None
+    assert blobs.put(RAW_URL, b"42")
+    assert blobs.get(RAW_URL) == b"42"
+
+
+def test_blob_cache_does_not_store_unpinned_urls():
+    blobs = BlobCache()
+    url = "https://gist.githubusercontent.com/janedoe/42/raw/.gist"
+    assert not blobs.put(url, b"42")
+    assert blobs.get(url) is None
+
+
+def test_blob_cache_evicts_least_recently_used():
+    blobs = BlobCache(max_size=4)
+    urls = tuple(RAW_URL.replace(".gist", name) for name in (".a", ".b", ".c"))
+    blobs.put(urls[0], b"aa")
+    blobs.put(urls[1], b"bb")
+    os.utime(blobs.path_for(blobs.key(urls[1])), (1, 1))
+    blobs.get(urls[0])
+    blobs.put(urls[2], b"cc")
+    assert blobs.get(urls[0]) == b"aa"
+    assert blobs.get(urls[1]) is None
+    assert blobs.get(urls[2]) == b"cc"
+
+
+def test_blob_cache_prune():
+    blobs = BlobCache()
+    blobs.put(RAW_URL, b"42")
+    assert blobs.prune(max_size=0) == (1, 2)
+    assert blobs.get(RAW_URL) is None
+
+
+def test_blob_cache_store():
+    blobs = BlobCache()
+    assert b"".join(blobs.store(RAW_URL, (b"4", b"2"))) == b"42"
+    with blobs.open(RAW_URL) as handler:
+        assert handler.read() == b"42"
+
+
+def test_blob_cache_store_interrupted():
+    blobs = BlobCache()
+    chunks = blobs.store(RAW_URL, (b"4", b"2"))
+    next(chunks)
+    chunks.close()
+    assert blobs.open(RAW_URL) is None
+    assert not os.listdir(os.path.dirname(blobs.path_for(blobs.key(RAW_URL))))
+
+
+def test_blob_cache_store_too_big():
+    blobs = BlobCache(max_size=1)
+    assert b"".join(blobs.store(RAW_URL, (b"4", b"2"))) == b"42"
+    assert blobs.open(RAW_URL) is None
@@ -0,0 +1,133 @@
+import os
+
+import pytest
+
+from getgist.catalog import Catalog
+
+
+def test_scope():
+    assert Catalog.scope("JaneDoe") == "janedoe:anon"
+    assert Catalog.scope("JaneDoe", authenticated=True) == "janedoe:auth"
+
+
+def test_empty_catalog():
+    catalog = Catalog()
+    assert catalog.synced_at("janedoe:anon") is None
+    assert catalog.needs_full_sync("janedoe:anon")
+    assert not tuple(catalog.gists("janedoe:anon"))
+
+
+def test_replace(gists):
+    catalog = Catalog()
+    catalog.replace("janedoe:auth", gists, 42)
+    assert catalog.synced_at("janedoe:auth") == 42
+    assert not catalog.needs_full_sync("janedoe:auth", now=43)
+    assert catalog.needs_full_sync("janedoe:auth", now=42 + 24 * 60 * 60 + 1)
+    assert tuple(catalog.gists("janedoe:auth")) == gists
+    assert not tuple(catalog.gists("janedoe:anon"))
+
+    catalog.replace("janedoe:auth", gists[2:], 43)
+    assert tuple(catalog.gists("janedoe:auth")) == gists[2:]
+
+
+def test_update(gists, parse):
+    catalog = Catalog()
+    catalog.replace("janedoe:auth", gists[:3], 42)
+
+    updated = parse(id=3, filename=".gist.staging")
+    catalog.update("janedoe:auth", (gists[3], updated), 43)
+    assert catalog.synced_at("janedoe:auth") == 43
+    assert tuple(catalog.gists("janedoe:auth")) == (
+        gists[3],
+        updated,
+        gists[0],
+        gists[1],
+    )
+
+
+def test_find(gists):
+    catalog = Catalog()
+    catalog.replace("janedoe:auth", gists, 42)
+    assert tuple(catalog.find("janedoe:auth", ".gist")) == gists[:2]
+    assert tuple(catalog.find("janedoe:auth", ".gist.dev")) == gists[2:3]
+    assert not tuple(catalog.find("janedoe:auth", ".no_gist"))
+    assert not tuple(catalog.find("janedoe:anon", ".gist"))
+
+
+@pytest.mark.parametrize("chunk_size", (1, 2, 3))
+def test_gists_are_read_in_chunks(gists, chunk_size):
+    catalog = Catalog()
+    catalog.chunk_size = chunk_size
+    catalog.replace("janedoe:auth", gists, 42)
+    assert tuple(catalog.gists("janedoe:auth")) == gists
+    assert tuple(catalog.find("janedoe:auth", ".gist")) == gists[:2]
+
+
+def test_catalog_is_persistent(gists):
+    Catalog().replace("janedoe:auth", gists, 42)
+    assert tuple(Catalog().gists("janedoe:auth")) == gists
+
+
+def test_catalog_is_private(gists):
+    catalog = Catalog()
+    catalog.replace("janedoe:auth", gists, 42)
+    assert os.stat(catalog.path).st_mode & 0o777 == 0o600
+    assert os.stat(os.path.dirname(catalog.path)).st_mode & 0o777 == 0o700
+
+
+def test_catalog_without_sizes_is_migrated(gists):
+    import sqlite3
+
+    catalog = Catalog()
+    os.makedirs(os.path.dirname(catalog.path))
+    with sqlite3.connect(catalog.path) as connection:
+        connection.execute(
+            "CREATE TABLE files (scope TEXT NOT NULL, gist_id TEXT NOT NULL, "
+            "filename TEXT NOT NULL, raw_url TEXT, "
+            "PRIMARY KEY (scope, gist_id, filename))"
+        )
+    connection.close()
+    catalog.replace("janedoe:auth", gists, 42)
+    assert tuple(catalog.gists("janedoe:auth")) == gists
+
+
+def test_filenames(gists):
+    catalog = Catalog()
+    catalog.replace("janedoe:auth", gists, 42)
+    assert catalog.filenames("janedoe:auth") == [
+        ".gist",
+        ".gist.dev",
+        ".gist.prod",
+        ".gist.sample",
+    ]
+    assert catalog.filenames("janedoe:auth", ".gist.") == [
+        ".gist.dev",
+        ".gist.prod",
+        ".gist.sample",
+    ]
+    assert catalog.filenames("janedoe:auth", ".gist.p") == [".gist.prod"]
+    assert catalog.filenames("janedoe:auth", ".vim") == []
+    assert catalog.filenames("janedoe:anon") == []
+
+
+def test_gist(gists):
+    catalog = Catalog()
+    catalog.replace("janedoe:auth", gists, 42)
+    assert catalog.gist("janedoe:auth", "id_gist_3") == gists[2]
+    assert catalog.gist("janedoe:auth", "id_gist_42") is None
+    assert catalog.gist("janedoe:anon", "id_gist_3") is None
+
+
+def test_latest_scope(gists):
+    catalog = Catalog()
+    assert catalog.latest_scope("janedoe") == (None, None)
+    assert not os.path.exists(catalog.path)
+
+    catalog.replace("janedoe:anon", gists, 42)
+    assert catalog.latest_scope("janedoe") == ("janedoe:anon", 42)
+    assert catalog.latest_scope("janedoe", authenticated=True) == ("janedoe:anon", 42)
+
+    catalog.replace("janedoe:auth", gists, 43)
+    assert catalog.latest_scope("janedoe") == ("janedoe:anon", 42)
+    assert catalog.latest_scope("janedoe", authenticated=True) == ("janedoe:auth", 43)
+    assert catalog.latest_scope("johndoe") == (None, None)
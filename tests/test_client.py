@@ -0,0 +1,168 @@
+import pytest
+
+from getgist.client import (
+    AmbiguousGistError,
+    AuthenticationError,
+    GetGistClient,
+    GetGistError,
+    GistNotFoundError,
+)
+from getgist.github import FileFromGist
+from tests.conftest import (
+    GETGIST_TOKEN,
+    GETGIST_USER,
+    MockResponse,
+    last_page_mock,
+    paged_get_mock,
+)
+
+
+@pytest.fixture
+def client(mocker, response):
+    mocker.patch("getgist.github.GitHubTools._get_token").return_value = None
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    return GetGistClient(GETGIST_USER)
+
+
+def test_client_requires_user():
+    with pytest.raises(GetGistError):
+        GetGistClient(None)
+
+
+def test_client_uses_its_token(mocker, response):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("user")
+    client = GetGistClient(GETGIST_USER, token=GETGIST_TOKEN)
+    assert client.is_authenticated
+    assert client.github.headers["Authorization"] == "token " + GETGIST_TOKEN
+
+
+def test_clients_do_not_share_tokens(mocker, response):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (response("user"), response("user"), response("user", case=False))
+    alice = GetGistClient(GETGIST_USER, token="A")
+    bob = GetGistClient(GETGIST_USER, token="B")
+    eve = GetGistClient(GETGIST_USER, token="invalid")
+    assert alice.github.requests.add_headers()["Authorization"] == "token A"
+    assert bob.github.requests.add_headers()["Authorization"] == "token B"
+    assert "Authorization" not in eve.github.requests.add_headers()
+    assert alice.is_authenticated and bob.is_authenticated
+    assert not eve.is_authenticated
+    assert alice.github.requests.session is bob.github.requests.session
+
+
+def test_ls(client, gists, capsys):
+    files = client.ls()
+    assert all(isinstance(gist_file, FileFromGist) for gist_file in files)
+    assert len(files) == 4
+    assert not capsys.readouterr().out
+
+
+def test_client_from_many_threads(mocker, response, gists):
+    from concurrent.futures import ThreadPoolExecutor
+
+    mocker.patch("getgist.github.GitHubTools._get_token").return_value = None
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = paged_get_mock(response, last=3)
+    client = GetGistClient(GETGIST_USER)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        found = list(executor.map(client.find, (".gist.dev",) * 8))
+    assert found == [[gists[2]]] * 8
+    assert get.call_count == 3
+
+
+def test_listing_is_reused(client, mocker):
+    client.ls()
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    assert client.find(".gist.sample")
+    get.assert_not_called()
+
+
+def test_failed_listing_raises(mocker, response):
+    mocker.patch("getgist.github.GitHubTools._get_token").return_value = None
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("users/janedoe/gists", case=False, status_code=404)
+    with pytest.raises(GetGistError, match="User `janedoe` not found"):
+        GetGistClient(GETGIST_USER).ls()
+
+
+def test_get(client, mocker, gists):
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 200
+    stream.return_value.iter_content.return_value = (b"4", b"2")
+    assert client.get(".gist.sample") == b"42"
+    assert stream.call_args[0][0] == gists[2]["files"][1]["raw_url"]
+
+
+def test_get_not_found(client):
+    with pytest.raises(GistNotFoundError):
+        client.get(".nope")
+
+
+def test_get_ambiguous(client, mocker, gists):
+    with pytest.raises(AmbiguousGistError) as error:
+        client.get(".gist")
+    assert error.value.gists == [gists[0], gists[1]]
+
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 200
+    stream.return_value.iter_content.return_value = (b"42",)
+    assert client.get(".gist", newest=True) == b"42"
+
+
+def test_get_by_gist_id(client, mocker, gists):
+    mocker.patch("getgist.github.GitHubTools.get_gist").return_value = gists[1]
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 200
+    stream.return_value.iter_content.return_value = (b"42",)
+    assert client.get(".gist", gist_id="id_gist_2") == b"42"
+    with pytest.raises(GistNotFoundError):
+        client.get(".vimrc", gist_id="id_gist_2")
+
+
+def test_put_requires_authentication(client):
+    with pytest.raises(AuthenticationError):
+        client.put(".gist.sample", "42")
+
+
+def test_put(client, mocker, gists):
+    mocker.patch("getgist.github.GitHubTools.is_authenticated", True)
+    update = mocker.patch("getgist.github.GitHubTools.update_files")
+    update.return_value = True
+    get_gist = mocker.patch("getgist.github.GitHubTools.get_gist")
+    get_gist.return_value = updated = dict(gists[2], description="Updated")
+    assert client.put(".gist.sample", "42") == updated
+    update.assert_called_once_with(gists[2], {".gist.sample": "42"})
+    get_gist.assert_called_once_with("id_gist_3")
+
+
+def test_find_uses_the_catalog_index(client, mocker, gists):
+    find = mocker.spy(client.github.catalog, "find")
+    listing = mocker.spy(client.github.catalog, "gists")
+    assert client.find("~/.gist.dev") == [gists[2]]
+    find.assert_called_once_with("janedoe:anon", ".gist.dev")
+    listing.assert_not_called()
+
+
+def test_put_new_file(client, mocker, gists):
+    mocker.patch("getgist.github.GitHubTools.is_authenticated", True)
+    create = mocker.patch("getgist.github.GitHubTools.create_files")
+    create.return_value = gists[0]
+    assert client.put("~/.vimrc", "42", public=False) == gists[0]
+    create.assert_called_once_with({".vimrc": "42"}, public=False)
+
+
+def test_failed_put_raises(client, mocker):
+    mocker.patch("getgist.github.GitHubTools.is_authenticated", True)
+    client.ls()
+    mocker.patch("getgist.request.GetGistRequests.get").return_value = MockResponse(
+        b"", 200
+    )
+    patch = mocker.patch("getgist.request.GetGistRequests.patch")
+    patch.return_value = MockResponse("{}", 500)
+    with pytest.raises(GetGistError, match="PATCH request returned 500"):
+        client.put(".gist.sample", "42")
@@ -0,0 +1,72 @@
+from time import time
+
+import pytest
+
+from getgist.__main__ import complete_filenames, refresh_in_background, run_getgist
+from getgist.catalog import Catalog
+
+
+class Context(object):
+    def __init__(self, **params):
+        self.params = params
+
+
+@pytest.fixture
+def catalog(gists):
+    catalog = Catalog()
+    catalog.replace(Catalog.scope("janedoe"), gists, time())
+    catalog.close()
+    return catalog
+
+
+@pytest.fixture
+def popen(mocker):
+    return mocker.patch("subprocess.Popen")
+
+
+def test_complete_filenames(mocker, catalog, popen):
+    mocker.patch.dict("os.environ", {"GETGIST_TOKEN": ""})
+    names = complete_filenames(Context(user="janedoe"), ".gist.")
+    assert names == [".gist.dev", ".gist.prod", ".gist.sample"]
+    assert complete_filenames(Context(user="janedoe"), ".vim") == []
+    assert complete_filenames(Context(user="johndoe"), ".gist") == []
+    popen.assert_not_called()
+
+
+def test_complete_filenames_with_user_from_env(mocker, catalog, popen):
+    mocker.patch.dict("os.environ", {"GETGIST_TOKEN": "", "GETGIST_USER": "janedoe"})
+    assert complete_filenames(Context(), ".gist.p") == [".gist.prod"]
+
+
+def test_complete_filenames_falls_back_to_anonymous_listing(mocker, catalog, popen):
+    mocker.patch.dict("os.environ", {"GETGIST_TOKEN": "Jane's token"})
+    assert complete_filenames(Context(user="janedoe"), ".gist.p") == [".gist.prod"]
+
+
+def test_complete_filenames_without_catalog(mocker, popen):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    assert complete_filenames(Context(user="janedoe"), ".gist") == []
+    get.assert_not_called()
+    popen.assert_not_called()
+
+
+def test_completion_is_wired_to_filenames():
+    (filenames,) = (p for p in run_getgist.params if p.name == "filenames")
+    assert getattr(filenames, "_custom_shell_complete", None) or getattr(
+        filenames, "autocompletion", None
+    )
+
+
+def test_refresh_in_background(popen):
+    scope = Catalog.scope("janedoe")
+    assert not refresh_in_background("janedoe", scope, synced_at=time())
+    popen.assert_not_called()
+
+    synced_at = time() - 2 * 60 * 60
+    assert refresh_in_background("janedoe", scope, synced_at)
+    popen.assert_called_once()
+    assert popen.call_args[0][0][-2:] == ("refresh", "janedoe")
+
+    # do not start another refresh while the first one runs
+    assert not refresh_in_background("janedoe", scope, synced_at)
+    popen.assert_called_once()
@@ -1,7 +1,24 @@
+import json
 from re import search
+from threading import Event
+from time import sleep, time
 
-from getgist.github import FileFromGist, GitHubTools
-from tests.conftest import MockResponse, GETGIST_TOKEN, GETGIST_USER
+import pytest
+
+from getgist.catalog import Catalog
+from getgist.github import FileFromGist, GitHubTools, parse_gist_reference
+from tests.conftest import (
+    MockResponse,
+    GETGIST_TOKEN,
+    GETGIST_USER,
+    last_page_mock,
+    paged_get_mock,
+)
+
+RAW_URL = (
+    "https://gist.githubusercontent.com/janedoe/id_gist_1/raw/"
+    "0123456789abcdef0123456789abcdef01234567/.gist"
+)
 
 
 def test_no_token_results_in_no_authentication(mocker):
@@ -58,9 +75,8 @@ def test_parse_gist(authenticated_github, response, gists):
 def test_get_gists(mocker, response, gists, authenticated_github):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     get.side_effect = (
-        response("users/janedoe/gists/page1"),
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
         response("users/janedoe/gists/page2"),
-        response("users/janedoe/gists/page3"),
     )
     fetched_gists = tuple(authenticated_github.get_gists())
     assert gists[0] in fetched_gists
@@ -86,9 +102,8 @@ def test_authenticated_get_gists(mocker, response, gists):
     token.return_value = GETGIST_TOKEN
     get.side_effect = (
         response("user"),
-        response("gists/page1"),
+        response("gists/page1", headers=last_page_mock(2)),
         response("gists/page2"),
-        response("gists/page3"),
     )
 
     github = GitHubTools(GETGIST_USER, ".gist")
@@ -102,9 +117,8 @@ def test_select_gist_one_input(mocker, response, gists, authenticated_github):
     prompt = mocker.patch("getgist.github.prompt")
     prompt.return_value = 2
     get.side_effect = (
-        response("users/janedoe/gists/page1"),
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
         response("users/janedoe/gists/page2"),
-        response("users/janedoe/gists/page3"),
     )
 
     authenticated_github.filename = ".gist"
@@ -115,9 +129,8 @@ def test_select_gist_one_input(mocker, response, gists, authenticated_github):
 def test_select_gist_multi_input(mocker, response, gists, authenticated_github):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     get.side_effect = (
-        response("users/janedoe/gists/page1"),
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
         response("users/janedoe/gists/page2"),
-        response("users/janedoe/gists/page3"),
     )
     prompt = mocker.patch("getgist.github.prompt")
     prompt.side_effect = (42, 2)
@@ -130,9 +143,8 @@ def test_select_gist_multi_input(mocker, response, gists, authenticated_github):
 def test_select_gist_single_match(mocker, response, gists, authenticated_github):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     get.side_effect = (
-        response("users/janedoe/gists/page1"),
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
         response("users/janedoe/gists/page2"),
-        response("users/janedoe/gists/page3"),
     )
     authenticated_github.filename = ".gist.sample"
     assert authenticated_github.select_gist() == gists[2]
@@ -141,20 +153,33 @@ def test_select_gist_single_match(mocker, response, gists, authenticated_github)
 def test_select_gist_no_match_default(mocker, response, gists, authenticated_github):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     get.side_effect = (
-        response("users/janedoe/gists/page1"),
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
         response("users/janedoe/gists/page2"),
-        response("users/janedoe/gists/page3"),
     )
     authenticated_github.filename = ".no_gist"
     assert not authenticated_github.select_gist()
 
 
+def test_select_gist_suggests_similar_names(
+    mocker, response, gists, authenticated_github
+):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    warn = mocker.patch("getgist.github.GitHubTools.warn")
+    authenticated_github.filename = ".gist.sampel"
+    assert not authenticated_github.select_gist()
+    warn.assert_any_call("Did you mean `.gist.sample`?")
+    assert get.call_count == 2  # suggestions do not list the gists again
+
+
 def test_select_gist_no_match_allow_none(mocker, response, gists, authenticated_github):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     get.side_effect = (
-        response("users/janedoe/gists/page1"),
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
         response("users/janedoe/gists/page2"),
-        response("users/janedoe/gists/page3"),
     )
     authenticated_github.filename = ".no_gist"
     assert not authenticated_github.select_gist(allow_none=True)
@@ -163,9 +188,8 @@ def test_select_gist_no_match_allow_none(mocker, response, gists, authenticated_
 def test_select_gist_multi_matches(mocker, response, gists, authenticated_github):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     get.side_effect = (
-        response("users/janedoe/gists/page1"),
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
         response("users/janedoe/gists/page2"),
-        response("users/janedoe/gists/page3"),
     )
     prompt = mocker.patch("getgist.github.prompt")
     prompt.return_value = 2
@@ -176,9 +200,8 @@ def test_select_gist_multi_matches(mocker, response, gists, authenticated_github
 def test_select_gist_without_filename(mocker, response, gists, authenticated_github):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     get.side_effect = (
-        response("users/janedoe/gists/page1"),
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
         response("users/janedoe/gists/page2"),
-        response("users/janedoe/gists/page3"),
     )
     authenticated_github.filename = None
     assert not authenticated_github.select_gist()
@@ -204,7 +227,7 @@ def test_update_gist(mocker, response, parse):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     patch = mocker.patch("getgist.request.GetGistRequests.patch")
     token = mocker.patch("getgist.github.GitHubTools._get_token")
-    get.return_value = response("user")
+    get.side_effect = (response("user"), MockResponse(b"", 200))
     patch.return_value = response("gist/id_gist_1")
     token.return_value = GETGIST_TOKEN
     gist = parse(id=1, user=GETGIST_USER, filename=".gist", url="")
@@ -216,7 +239,7 @@ def test_failed_update_gist(mocker, response, parse):
     get = mocker.patch("getgist.request.GetGistRequests.get")
     token = mocker.patch("getgist.github.GitHubTools._get_token")
     patch = mocker.patch("getgist.request.GetGistRequests.patch")
-    get.return_value = response("user")
+    get.side_effect = (response("user"), MockResponse(b"", 200))
     token.return_value = GETGIST_TOKEN
     patch.return_value = response("gist/id_gist_1", case=False, status_code=404)
     gist = parse(id=1, user=GETGIST_USER, filename=".gist", url="")
@@ -282,9 +305,8 @@ def test_ls_gists(mocker, response, authenticated_github):
     tabulate = mocker.patch.object(GitHubTools, "tabulate")
     get = mocker.patch("getgist.request.GetGistRequests.get")
     get.side_effect = (
-        response("gists/page1"),
+        response("gists/page1", headers=last_page_mock(2)),
         response("gists/page2"),
-        response("gists/page3"),
     )
     authenticated_github.list_gists()
     expected = (
@@ -303,3 +325,767 @@ def test_ls_gists(mocker, response, authenticated_github):
         ),
     )
     tabulate.assert_called_once_with(*expected)
+
+
+def test_get_gists_with_rate_limit_exceeded(mocker, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    oops = mocker.patch.object(GitHubTools, "oops")
+    headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0"}
+    get.return_value = MockResponse("{}", 403, headers)
+    assert not tuple(authenticated_github.get_gists())
+    oops.assert_called_once_with("GitHub API rate limit exceeded")
+
+
+def test_last_page(authenticated_github):
+    assert authenticated_github._last_page(MockResponse("[]", 200)) == 1
+    response = MockResponse("[]", 200, last_page_mock(42))
+    assert authenticated_github._last_page(response) == 42
+
+
+def test_get_gists_requests_max_page_size(mocker, response, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("users/janedoe/gists/page1")
+    tuple(authenticated_github.get_gists())
+    get.assert_called_once_with(
+        "https://api.github.com/users/janedoe/gists?per_page=100&page=1", cache=True
+    )
+
+
+def test_get_gists_fetches_pages_concurrently_in_order(mocker, authenticated_github):
+    def get(url, **kwargs):
+        page = int(url.split("page=")[-1])
+        sleep(0.01 * (7 - page))
+        gist = {"id": str(page), "description": "", "files": {"f": {}}}
+        headers = last_page_mock(7) if page == 1 else None
+        return MockResponse(json.dumps([gist]), 200, headers)
+
+    mocker.patch("getgist.request.GetGistRequests.get", side_effect=get)
+    gists = tuple(authenticated_github.get_gists())
+    assert tuple(gist["id"] for gist in gists) == ("1", "2", "3", "4", "5", "6", "7")
+
+
+def test_get_gists_stops_fetching_when_closed(mocker, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = MockResponse(
+        '[{"id": "1", "description": "", "files": {"f": {}}}]', 200, last_page_mock(50)
+    )
+    gists = authenticated_github.fetch_gists()
+    next(gists)
+    next(gists)
+    gists.close()
+    assert get.call_count <= 2 + authenticated_github.max_workers
+
+
+def test_get_gists_without_catalog(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("users/janedoe/gists/page1")
+    github = GitHubTools(GETGIST_USER, ".gist", use_cache=False)
+    assert github.catalog is None
+    assert tuple(github.get_gists()) == gists[:2]
+    assert tuple(github.get_gists()) == gists[:2]
+    assert get.call_count == 2
+
+
+def test_get_gists_syncs_catalog_incrementally(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    mocker.patch("getgist.github.time", return_value=86400)
+    mocker.patch("getgist.catalog.time", return_value=86400)
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("users/janedoe/gists/page1")
+    github = GitHubTools(GETGIST_USER, ".gist")
+    assert tuple(github.get_gists()) == gists[:2]
+    assert tuple(github.get_gists()) == gists[:2]
+    assert get.call_count == 1
+
+    get.reset_mock()
+    get.return_value = MockResponse(
+        json.dumps(
+            [
+                {
+                    "id": "id_gist_5",
+                    "description": "New gist",
+                    "html_url": "https://gist.github.com/id_gist_5",
+                    "public": True,
+                    "files": {".gist": {"raw_url": "https://raw/.gist", "size": 8}},
+                }
+            ]
+        ),
+        200,
+    )
+    github = GitHubTools(GETGIST_USER, ".gist")
+    new = dict(
+        description="New gist",
+        id="id_gist_5",
+        files=[dict(filename=".gist", raw_url="https://raw/.gist", size=8)],
+        url="https://gist.github.com/id_gist_5",
+        public=True,
+    )
+    assert tuple(github.get_gists()) == (new,) + gists[:2]
+    get.assert_called_once_with(
+        "https://api.github.com/users/janedoe/gists"
+        "?per_page=100&page=1&since=1970-01-01T23:59:00Z",
+        cache=False,
+    )
+
+
+def test_select_gist_from_catalog(mocker, response, gists, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    find = mocker.spy(authenticated_github.catalog, "find")
+    authenticated_github.filename = ".gist.dev"
+    assert authenticated_github.select_gist() == gists[2]  # streamed by the sync
+    find.assert_not_called()
+    assert authenticated_github.select_gist() == gists[2]
+    find.assert_called_once_with("janedoe:anon", ".gist.dev")
+    assert get.call_count == 2
+
+
+def test_parse_gist_reference():
+    gist_id = "aa5a315d61ae9438b18d"
+    assert parse_gist_reference(gist_id) == (gist_id, None)
+    assert parse_gist_reference(gist_id + ":.vimrc") == (gist_id, ".vimrc")
+    url = "https://gist.github.com/janedoe/{}".format(gist_id)
+    assert parse_gist_reference(url) == (gist_id, None)
+    assert parse_gist_reference(url + ":.vimrc") == (gist_id, ".vimrc")
+    assert parse_gist_reference("https://gist.github.com/" + gist_id) == (
+        gist_id,
+        None,
+    )
+    assert parse_gist_reference(".vimrc") == (None, None)
+    assert parse_gist_reference("notes:todo.md") == (None, None)
+    assert parse_gist_reference(None) == (None, None)
+
+
+def test_get_gist(mocker, response, gists, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("gist/id_gist_1")
+    assert authenticated_github.get_gist("id_gist_1") == gists[0]
+    get.assert_called_once_with("https://api.github.com/gists/id_gist_1", cache=True)
+
+
+def test_get_gist_not_found(mocker, response, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    oops = mocker.patch.object(GitHubTools, "oops")
+    get.return_value = response("gist/id_gist_1", case=False, status_code=404)
+    assert authenticated_github.get_gist("id_gist_1") is None
+    oops.assert_called_once_with("Gist `id_gist_1` not found")
+
+
+def test_select_gist_by_id(mocker, response, gists, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("gist/id_gist_1")
+    assert authenticated_github.select_gist_by_id("id_gist_1") == gists[0]
+    get.assert_called_once()
+
+
+def test_select_gist_by_id_without_file(mocker, response, gists, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("gist/id_gist_1")
+    authenticated_github.filename = ".no_gist"
+    assert not authenticated_github.select_gist_by_id("id_gist_1")
+    assert authenticated_github.select_gist_by_id("id_gist_1", allow_none=True)
+
+
+def test_select_gist_stops_fetching_on_first_match(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(20)),
+        response("users/janedoe/gists/page2"),
+    )
+    github = GitHubTools(GETGIST_USER, ".gist", assume_yes=True, use_cache=False)
+    assert github.select_gist() == gists[0]
+    assert get.call_count == 1
+
+
+def test_select_gist_stops_syncing_catalog_on_first_match(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(3)),
+        response("users/janedoe/gists/page2"),
+        response("users/janedoe/gists/page3"),
+    )
+    github = GitHubTools(GETGIST_USER, ".gist", assume_yes=True)
+    assert github.select_gist() == gists[0]
+    assert get.call_count == 1
+
+    # the interrupted listing is not taken as a complete one
+    assert github.catalog.synced_at(github.catalog_scope) is None
+    assert github.catalog.needs_full_sync(github.catalog_scope)
+    assert not tuple(github.catalog.gists(github.catalog_scope))
+
+
+def test_select_gist_on_last_page_completes_catalog_sync(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("users/janedoe/gists/page1")
+    github = GitHubTools(GETGIST_USER, ".gist", assume_yes=True)
+    assert github.select_gist() == gists[0]
+    assert get.call_count == 1
+
+    # the page where the match was found was the whole listing
+    assert github.catalog.synced_at(github.catalog_scope) is not None
+    assert tuple(github.catalog.gists(github.catalog_scope)) == gists[:2]
+    offline = GitHubTools(GETGIST_USER, ".gist", assume_yes=True, offline=True)
+    assert offline.select_gist() == gists[0]
+    assert get.call_count == 1
+
+
+def test_select_gist_newest(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    prompt = mocker.patch("getgist.github.prompt")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = response("users/janedoe/gists/page1")
+    github = GitHubTools(GETGIST_USER, ".gist")
+    assert github.select_gist(newest=True) == gists[0]
+    prompt.assert_not_called()
+
+
+def test_read_gist_from_cache(mocker, authenticated_github, parse):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = MockResponse(b"Hello, world!", 200)
+    gist = parse(id=1, filename=".gist")
+    gist["files"][0]["raw_url"] = RAW_URL
+    assert authenticated_github.read_gist_file(gist) == b"Hello, world!"
+    assert authenticated_github.read_gist_file(gist) == b"Hello, world!"
+    get.assert_called_once()
+
+
+def test_read_gist_without_cache(mocker, parse):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = MockResponse(b"Hello, world!", 200)
+    gist = parse(id=1, filename=".gist")
+    gist["files"][0]["raw_url"] = RAW_URL
+    github = GitHubTools(GETGIST_USER, ".gist", use_cache=False)
+    assert github.read_gist_file(gist) == b"Hello, world!"
+    assert github.read_gist_file(gist) == b"Hello, world!"
+    assert get.call_count == 2
+
+
+def test_stream_gist_file(mocker, authenticated_github, parse):
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 200
+    stream.return_value.iter_content.return_value = (b"Hello, ", b"world!")
+    gist = parse(id=1, filename=".gist")
+    gist["files"][0]["raw_url"] = RAW_URL
+    download = authenticated_github.stream_gist_file(gist)
+    assert b"".join(download) == b"Hello, world!"
+    stream.return_value.close.assert_called_once_with()
+
+    download = authenticated_github.stream_gist_file(gist)
+    assert b"".join(download) == b"Hello, world!"
+    stream.assert_called_once_with(RAW_URL, **{"Accept-Encoding": "identity"})
+
+
+def test_stream_gist_file_failure(mocker, authenticated_github, parse):
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 404
+    gist = parse(id=1, filename=".gist")
+    assert authenticated_github.stream_gist_file(gist) is None
+
+
+def test_stream_gist_file_not_in_gist(authenticated_github, parse):
+    gist = parse(id=1, filename=".vimrc")
+    assert authenticated_github.stream_gist_file(gist) is None
+
+
+def test_stream_gist_file_resume(mocker, authenticated_github, parse):
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 206
+    stream.return_value.headers = {"ETag": '"abc"'}
+    stream.return_value.iter_content.return_value = (b"world!",)
+    gist = parse(id=1, filename=".gist")
+    gist["files"][0]["raw_url"] = RAW_URL
+    download = authenticated_github.stream_gist_file(gist, 7, '"abc"')
+    assert (download.offset, download.etag) == (7, '"abc"')
+    assert b"".join(download) == b"world!"
+    stream.assert_called_once_with(
+        RAW_URL,
+        Range="bytes=7-",
+        **{"If-Range": '"abc"', "Accept-Encoding": "identity"}
+    )
+    assert not authenticated_github.blobs.get(RAW_URL)
+
+
+def test_stream_gist_file_resume_not_supported(mocker, authenticated_github, parse):
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 200
+    stream.return_value.headers = {}
+    stream.return_value.iter_content.return_value = (b"Hello, world!",)
+    gist = parse(id=1, filename=".gist")
+    download = authenticated_github.stream_gist_file(gist, 7)
+    assert download.offset == 0
+    assert b"".join(download) == b"Hello, world!"
+
+
+def test_stream_gist_file_resume_not_satisfiable(mocker, authenticated_github, parse):
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    not_satisfiable, ok = mocker.Mock(status_code=416), mocker.Mock(status_code=200)
+    ok.iter_content.return_value = (b"Hello, world!",)
+    stream.side_effect = (not_satisfiable, ok)
+    gist = parse(id=1, filename=".gist")
+    download = authenticated_github.stream_gist_file(gist, 42)
+    assert download.offset == 0
+    assert b"".join(download) == b"Hello, world!"
+    not_satisfiable.close.assert_called_once_with()
+
+
+def test_select_files(mocker, gists, authenticated_github):
+    get_gists = mocker.patch("getgist.github.GitHubTools.get_gists")
+    get_gists.return_value = iter(gists)
+    authenticated_github.assume_yes = True
+    selected = authenticated_github.select_files((".gist", "dotfiles/.gist.*"))
+    assert selected == [
+        (".gist", gists[0]),
+        ("dotfiles/.gist.dev", gists[2]),
+        ("dotfiles/.gist.sample", gists[2]),
+        ("dotfiles/.gist.prod", gists[3]),
+    ]
+    get_gists.assert_called_once_with()
+
+
+def test_select_files_once(mocker, gists, authenticated_github):
+    get_gists = mocker.patch("getgist.github.GitHubTools.get_gists")
+    get_gists.return_value = iter(gists)
+    prompt = mocker.patch("getgist.github.prompt")
+    prompt.return_value = 2
+    selected = authenticated_github.select_files(
+        (".gist", "*.prod", ".gist*", ".gist", "*.toml", "*.toml")
+    )
+    assert selected == [
+        (".gist", gists[1]),
+        (".gist.prod", gists[3]),
+        (".gist.dev", gists[2]),
+        (".gist.sample", gists[2]),
+        ("*.toml", False),
+    ]
+    prompt.assert_called_once()
+
+
+def test_select_files_asks_which_gist(mocker, gists, authenticated_github):
+    get_gists = mocker.patch("getgist.github.GitHubTools.get_gists")
+    get_gists.return_value = iter(gists)
+    prompt = mocker.patch("getgist.github.prompt")
+    prompt.return_value = 2
+    selected = authenticated_github.select_files((".gist", ".gist.prod"))
+    assert selected == [(".gist", gists[1]), (".gist.prod", gists[3])]
+    prompt.assert_called_once()
+
+
+def test_select_files_not_found(mocker, gists, authenticated_github):
+    get_gists = mocker.patch("getgist.github.GitHubTools.get_gists")
+    get_gists.return_value = iter(gists)
+    selected = authenticated_github.select_files(("*.toml", ".gist.prod"))
+    assert selected == [("*.toml", False), (".gist.prod", gists[3])]
+
+
+def test_select_files_suggests_similar_names(mocker, gists, authenticated_github):
+    get_gists = mocker.patch("getgist.github.GitHubTools.get_gists")
+    get_gists.return_value = iter(gists)
+    warn = mocker.patch("getgist.github.GitHubTools.warn")
+    selected = authenticated_github.select_files((".gist.dve", ".gist.prod"))
+    assert selected == [(".gist.dve", False), (".gist.prod", gists[3])]
+    warn.assert_called_once_with("Did you mean `.gist.dev`?")
+    get_gists.assert_called_once()
+
+
+def test_select_files_by_gist_id(mocker, gists, authenticated_github):
+    get_gist = mocker.patch("getgist.github.GitHubTools.get_gist")
+    get_gist.return_value = gists[2]
+    get_gists = mocker.patch("getgist.github.GitHubTools.get_gists")
+    selected = authenticated_github.select_files(("*.dev", "*.sample"), "id_gist_3")
+    assert selected == [(".gist.dev", gists[2]), (".gist.sample", gists[2])]
+    get_gist.assert_called_once_with("id_gist_3")
+    get_gists.assert_not_called()
+
+
+def test_stream_gist_file_by_filename(mocker, gists, authenticated_github):
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 200
+    stream.return_value.iter_content.return_value = (b"dev",)
+    authenticated_github.filename = None
+    download = authenticated_github.stream_gist_file(gists[2], filename=".gist.dev")
+    assert b"".join(download) == b"dev"
+    assert stream.call_args[0][0] == gists[2]["files"][0]["raw_url"]
+
+
+def test_select_files_to_upload(mocker, gists, authenticated_github):
+    get_gists = mocker.patch("getgist.github.GitHubTools.get_gists")
+    get_gists.return_value = iter(gists)
+    selected = authenticated_github.select_files(
+        ("dotfiles/.gist.dev", ".new"), newest=True, allow_none=True
+    )
+    assert selected == [("dotfiles/.gist.dev", gists[2]), (".new", None)]
+
+
+def test_update_files(mocker, response, parse):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    patch = mocker.patch("getgist.request.GetGistRequests.patch")
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    get.side_effect = (response("user"), MockResponse(b"", 200), MockResponse(b"", 200))
+    patch.return_value = response("gist/id_gist_1")
+    token.return_value = GETGIST_TOKEN
+    gist = parse(id=1, user=GETGIST_USER, filename=[".gist", ".vimrc"], url="")
+    github = GitHubTools(GETGIST_USER, None)
+    assert github.update_files(gist, {".gist": "42", ".vimrc": "set nu"})
+    patch.assert_called_once()
+    url = patch.call_args[0][0]
+    data = json.loads(patch.call_args[1]["data"])
+    assert url == "https://api.github.com/gists/id_gist_1"
+    assert data == {
+        "files": {".gist": {"content": "42"}, ".vimrc": {"content": "set nu"}}
+    }
+
+
+def test_create_files(mocker, response):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    post = mocker.patch("getgist.request.GetGistRequests.post")
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    get.return_value = response("user")
+    post.return_value = response("gist/id_gist_1", status_code=201)
+    token.return_value = GETGIST_TOKEN
+    github = GitHubTools(GETGIST_USER, None)
+    assert github.create_files({".gist": "42", ".vimrc": "set nu"}, public=False)
+    post.assert_called_once()
+    data = json.loads(post.call_args[1]["data"])
+    assert data["description"] == ".gist, .vimrc"
+    assert not data["public"]
+    assert set(data["files"]) == {".gist", ".vimrc"}
+
+
+def test_has_changed(mocker, parse, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = MockResponse(b"42", 200)
+    gist = parse(id=1, filename=".gist")
+    gist["files"][0]["raw_url"] = RAW_URL
+    assert not authenticated_github.has_changed(gist, "42")
+    assert authenticated_github.has_changed(gist, "4242")
+    get.assert_called_once_with(RAW_URL)  # then read from the cache
+
+
+def test_has_changed_compares_sizes_first(mocker, parse, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = MockResponse(b"42", 200)
+    gist = parse(id=1, filename=".gist", size=2)
+    assert authenticated_github.has_changed(gist, "4242")
+    get.assert_not_called()
+    assert authenticated_github.has_changed(gist, "4é")  # 3 bytes
+    get.assert_not_called()
+    assert not authenticated_github.has_changed(gist, "42")
+    get.assert_called_once()
+
+
+def test_has_changed_when_remote_is_unknown(mocker, parse, authenticated_github):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.return_value = MockResponse(b"Not found", 404)
+    gist = parse(id=1, filename=".gist")
+    assert authenticated_github.has_changed(gist, "42")
+    assert authenticated_github.has_changed(gist, "42", ".vimrc")
+
+
+def test_update_unchanged_files(mocker, response, parse):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    patch = mocker.patch("getgist.request.GetGistRequests.patch")
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    token.return_value = GETGIST_TOKEN
+    get.side_effect = (response("user"), MockResponse(b"42", 200))
+    gist = parse(id=1, user=GETGIST_USER, filename=".gist", url="")
+    github = GitHubTools(GETGIST_USER, ".gist")
+    assert github.update(gist, "42")
+    patch.assert_not_called()
+
+
+def test_update_only_changed_files(mocker, response, parse):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    patch = mocker.patch("getgist.request.GetGistRequests.patch")
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    token.return_value = GETGIST_TOKEN
+    get.side_effect = (
+        response("user"),
+        MockResponse(b"42", 200),
+        MockResponse(b"set nu", 200),
+    )
+    patch.return_value = response("gist/id_gist_1")
+    gist = parse(id=1, user=GETGIST_USER, filename=[".gist", ".vimrc"], url="")
+    github = GitHubTools(GETGIST_USER, None)
+    assert github.update_files(gist, {".gist": "42", ".vimrc": "set nonu"})
+    data = json.loads(patch.call_args[1]["data"])
+    assert data == {"files": {".vimrc": {"content": "set nonu"}}}
+
+
+def test_token_validation_is_cached(mocker, response, cache_dir):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    get.return_value = response("user")
+    token.return_value = GETGIST_TOKEN
+
+    assert GitHubTools(GETGIST_USER, ".gist").is_authenticated
+    assert GitHubTools(GETGIST_USER, ".gist").is_authenticated
+    get.assert_called_once_with("https://api.github.com/user")
+    assert GETGIST_TOKEN not in (cache_dir / "tokens.json").read_text()
+
+
+def test_token_validation_cache_expires(mocker, response):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    get.return_value = response("user")
+    token.return_value = GETGIST_TOKEN
+
+    GitHubTools(GETGIST_USER, ".gist")
+    mocker.patch("getgist.github.time", return_value=time() + 2 * 24 * 60 * 60)
+    assert GitHubTools(GETGIST_USER, ".gist").is_authenticated
+    assert get.call_count == 2
+
+
+def test_token_validation_not_cached_without_cache(mocker, response):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    get.return_value = response("user")
+    token.return_value = GETGIST_TOKEN
+
+    GitHubTools(GETGIST_USER, ".gist", use_cache=False)
+    GitHubTools(GETGIST_USER, ".gist", use_cache=False)
+    assert get.call_count == 2
+
+
+def test_revoked_token_is_validated_again(mocker, response):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    token.return_value = GETGIST_TOKEN
+    get.return_value = response("user")
+    GitHubTools(GETGIST_USER, ".gist")
+
+    get.side_effect = (
+        MockResponse("{}", 401),  # listing gists with a cached (revoked) token
+        response("user", case=False, status_code=401),
+    )
+    github = GitHubTools(GETGIST_USER, ".gist")
+    assert github.is_authenticated
+    assert not tuple(github.get_gists())
+    assert not github.is_authenticated
+    assert "Authorization" not in github.headers
+
+    get.side_effect = None
+    get.return_value = response("user", case=False, status_code=401)
+    assert not GitHubTools(GETGIST_USER, ".gist").is_authenticated
+
+
+def routed_get(routes):
+    """Mocks GetGistRequests.get answering each URL (without the query
+    string) with the result of calling its route."""
+
+    def get(url, *args, **kwargs):
+        return routes[url.split("?")[0]](**kwargs)
+
+    return get
+
+
+def test_pipelined_token_check(mocker, response, gists):
+    listing = Event()
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    token.return_value = GETGIST_TOKEN
+
+    def user(**kwargs):
+        assert listing.wait(timeout=5)  # the listing did not wait for it
+        return response("user")
+
+    def list_gists(**kwargs):
+        assert kwargs["Authorization"] == "token " + GETGIST_TOKEN
+        listing.set()
+        return response("gists/page1")
+
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = routed_get(
+        {
+            "https://api.github.com/user": user,
+            "https://api.github.com/gists": list_gists,
+        }
+    )
+
+    github = GitHubTools(GETGIST_USER, ".gist", pipeline=True)
+    assert tuple(github.get_gists())
+    assert github.is_authenticated
+    assert get.call_count == 2
+
+
+def test_pipelined_token_check_with_invalid_token(mocker, response):
+    token = mocker.patch("getgist.github.GitHubTools._get_token")
+    token.return_value = GETGIST_TOKEN
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = routed_get(
+        {
+            "https://api.github.com/user": lambda **kwargs: response(
+                "user", case=False, status_code=401
+            ),
+            "https://api.github.com/gists": lambda **kwargs: MockResponse("{}", 401),
+            "https://api.github.com/users/janedoe/gists": lambda **kwargs: response(
+                "users/janedoe/gists/page1"
+            ),
+        }
+    )
+
+    github = GitHubTools(GETGIST_USER, ".gist", pipeline=True)
+    gists = tuple(github.get_gists())
+    assert gists
+    assert all(gist["public"] for gist in gists)
+    assert not github.is_authenticated
+
+
+@pytest.mark.parametrize("use_cache", (True, False))
+def test_ls_gists_streams_rows(
+    mocker, response, authenticated_github, capsys, use_cache
+):
+    def second_page():
+        # the rows from the first page were printed before it was requested
+        assert '"file": ".gist"' in capsys.readouterr().out
+        return response("gists/page2")
+
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    pages = iter(
+        (lambda: response("gists/page1", headers=last_page_mock(2)), second_page)
+    )
+    get.side_effect = lambda *args, **kwargs: next(pages)()
+    if not use_cache:
+        authenticated_github.use_cache = False
+        authenticated_github.catalog = None
+    authenticated_github.max_workers = 1
+    authenticated_github.list_gists("jsonl")
+    rows = capsys.readouterr().out.splitlines()
+    assert json.loads(rows[-1])["file"] == ".gist.prod"
+
+
+def staged(catalog):
+    """Number of gists written to staging scopes of a catalog"""
+    query = "SELECT COUNT(*) FROM gists WHERE scope LIKE '%:staging:%'"
+    return catalog.connection.execute(query).fetchone()[0]
+
+
+def test_catalog_is_written_page_by_page(mocker, response, authenticated_github):
+    def second_page():
+        staged_gists = staged(authenticated_github.catalog)
+        assert staged_gists == len(response("gists/page1").json())
+        return response("gists/page2")
+
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    pages = iter(
+        (lambda: response("gists/page1", headers=last_page_mock(2)), second_page)
+    )
+    get.side_effect = lambda *args, **kwargs: next(pages)()
+    authenticated_github.max_workers = 1
+    listed = tuple(authenticated_github.get_gists())
+    scope = authenticated_github.catalog_scope
+    assert tuple(authenticated_github.catalog.gists(scope)) == listed
+    assert not staged(authenticated_github.catalog)
+
+
+def test_overlapping_catalog_syncs(mocker, response, gists):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = paged_get_mock(response)
+    first, second = (GitHubTools(GETGIST_USER, ".gist") for _ in range(2))
+    first_sync, second_sync = first._sync_catalog(), second._sync_catalog()
+    assert next(first_sync) == gists[0]
+    assert next(second_sync) == gists[0]
+    assert tuple(first_sync) == gists[1:3]
+    assert tuple(second_sync) == gists[1:3]
+
+    catalog = Catalog()
+    assert tuple(catalog.gists(first.catalog_scope)) == gists[:3]
+    assert catalog.synced_at(first.catalog_scope) is not None
+    assert not staged(catalog)
+
+
+def test_interrupted_catalog_sync_is_discarded(mocker, response):
+    mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = paged_get_mock(response)
+    github = GitHubTools(GETGIST_USER, ".gist")
+    sync = github._sync_catalog()
+    next(sync)
+    sync.close()
+    assert not staged(github.catalog)
+    assert github.catalog.synced_at(github.catalog_scope) is None
+
+
+@pytest.fixture
+def offline_catalog(mocker, gists):
+    mocker.patch("getgist.github.GitHubTools._get_token").return_value = None
+    catalog = Catalog()
+    catalog.replace(Catalog.scope(GETGIST_USER), gists, time() - 5 * 60)
+    catalog.close()
+    return catalog
+
+
+def test_select_gist_offline(mocker, offline_catalog, gists):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    oauth = mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    warn = mocker.patch("getgist.github.GitHubTools.warn")
+    github = GitHubTools(GETGIST_USER, ".gist.dev", offline=True)
+    assert github.select_gist() == gists[2]
+    warn.assert_called_once_with(
+        "Using janedoe's gists as listed 5 minutes ago (offline)"
+    )
+    get.assert_not_called()
+    oauth.assert_not_called()
+
+
+def test_select_gist_offline_without_catalog(mocker):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    oops = mocker.patch("getgist.github.GitHubTools.oops")
+    github = GitHubTools(GETGIST_USER, ".gist", offline=True)
+    assert not github.select_gist()
+    msg = "janedoe's gists are not in the local cache, list them once online"
+    assert oops.call_args_list.count(mocker.call(msg)) == 1
+    get.assert_not_called()
+
+
+def test_select_gist_by_id_offline(mocker, offline_catalog, gists):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    github = GitHubTools(GETGIST_USER, ".gist.dev", offline=True)
+    assert github.select_gist_by_id("id_gist_3") == gists[2]
+    assert not github.select_gist_by_id("id_gist_42")
+    get.assert_not_called()
+
+
+def test_read_gist_file_offline(mocker, offline_catalog, parse):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    gist = parse(id=1, filename=".gist")
+    gist["files"][0]["raw_url"] = RAW_URL
+    github = GitHubTools(GETGIST_USER, ".gist", offline=True)
+    assert github.read_gist_file(gist) is None
+    assert github.stream_gist_file(gist) is None
+
+    github.blobs.put(RAW_URL, b"Hello, world!")
+    assert github.read_gist_file(gist) == b"Hello, world!"
+    assert b"".join(github.stream_gist_file(gist)) == b"Hello, world!"
+    get.assert_not_called()
+    stream.assert_not_called()
+
+
+def test_select_gist_with_fresh_catalog(mocker, offline_catalog, gists):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    oauth = mocker.patch("getgist.github.GitHubTools.add_oauth_header")
+    warn = mocker.patch("getgist.github.GitHubTools.warn")
+    github = GitHubTools(GETGIST_USER, ".gist.dev", max_stale=60 * 60)
+    assert github.select_gist() == gists[2]
+    warn.assert_called_once_with("Using janedoe's gists as listed 5 minutes ago")
+    get.assert_not_called()
+    oauth.assert_not_called()
+
+
+def test_select_gist_with_stale_catalog(mocker, response, offline_catalog, gists):
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = (
+        response("users/janedoe/gists/page1", headers=last_page_mock(2)),
+        response("users/janedoe/gists/page2"),
+    )
+    github = GitHubTools(GETGIST_USER, ".gist.dev", max_stale=60)
+    assert github.select_gist()["files"][0]["filename"] == ".gist.dev"
+    assert get.call_count == 2
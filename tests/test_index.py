@@ -0,0 +1,61 @@
+from getgist.index import FilenameIndex, is_pattern
+
+
+def test_is_pattern():
+    assert is_pattern("*.toml")
+    assert is_pattern(".gist.?")
+    assert is_pattern("[ab].txt")
+    assert not is_pattern(".vimrc")
+    assert not is_pattern(None)
+
+
+def test_empty_index():
+    index = FilenameIndex()
+    assert not len(index)
+    assert index.names == []
+    assert index.search(".gist") == []
+    assert index.search("*") == []
+    assert index.fuzzy(".gist") == []
+
+
+def test_exact(gists):
+    index = FilenameIndex(gists)
+    assert len(index) == 4
+    assert ".gist" in index
+    assert index.exact(".gist") == [".gist"]
+    assert index.exact(".gis") == []
+    assert index.gists(".gist") == [gists[0], gists[1]]
+    assert index.gists(".gist.dev") == [gists[2]]
+    assert index.gists(".gis") == []
+
+
+def test_prefix(gists):
+    index = FilenameIndex(gists)
+    assert index.prefix(".gist.") == [".gist.dev", ".gist.prod", ".gist.sample"]
+    assert index.prefix(".gist.s") == [".gist.sample"]
+    assert index.prefix("") == index.names
+    assert index.prefix(".vim") == []
+
+
+def test_glob_keeps_the_order_of_the_listing(gists):
+    index = FilenameIndex(gists)
+    assert index.glob(".gist.*") == [".gist.dev", ".gist.sample", ".gist.prod"]
+    assert index.glob("*.prod") == [".gist.prod"]
+    assert index.glob("*") == [".gist", ".gist.dev", ".gist.sample", ".gist.prod"]
+    assert index.search(".gist.[dp]*") == [".gist.dev", ".gist.prod"]
+    assert index.search("*.toml") == []
+
+
+def test_fuzzy(gists):
+    index = FilenameIndex(gists)
+    assert index.fuzzy(".gist.dve")[0] == ".gist.dev"
+    assert index.fuzzy(".GIST") == [".gist"]
+    assert index.fuzzy(".gist.sampel", limit=1) == [".gist.sample"]
+    assert index.fuzzy("Makefile") == []
+
+
+def test_index_is_updated_when_gists_are_added(gists, parse):
+    index = FilenameIndex(gists)
+    assert index.prefix(".gist.s") == [".gist.sample"]
+    index.add(parse(id=5, filename=".gist.staging"))
+    assert index.prefix(".gist.s") == [".gist.sample", ".gist.staging"]
@@ -1,10 +1,12 @@
+from sys import stderr
+
 from getgist import GetGistCommons
 from getgist.github import FileFromGist
 
 
 def test_tabulate(mocker):
     secho = mocker.patch("getgist.secho")
-    tabulate = mocker.patch("getgist.tabulate")
+    tabulate = mocker.patch("tabulate.tabulate")
     commons = GetGistCommons()
     commons.tabulate(
         FileFromGist("file1.txt", "My First Gist", "http://...", False),
@@ -18,3 +20,26 @@ def test_tabulate(mocker):
         headers=("Gist", "File", "URL"),
     )
     secho.assert_called_once()
+
+
+def test_rows(capsys):
+    commons = GetGistCommons()
+    files = (
+        FileFromGist("My\tFirst Gist", "file1.txt", "http://...", False),
+        FileFromGist("My 2nd Gist", "file2.txt", "https://...", True),
+    )
+    commons.rows(files, "jsonl")
+    commons.rows(files, "tsv")
+    assert capsys.readouterr().out.splitlines() == [
+        '{"gist": "My\\tFirst Gist", "file": "file1.txt", "url": "http://...", "public": false}',
+        '{"gist": "My 2nd Gist", "file": "file2.txt", "url": "https://...", "public": true}',
+        "My First Gist [Secret Gist]\tfile1.txt\thttp://...",
+        "My 2nd Gist\tfile2.txt\thttps://...",
+    ]
+
+
+def test_messages_go_to_stderr_when_stdout_carries_data(mocker):
+    secho = mocker.patch("getgist.secho")
+    mocker.patch.object(GetGistCommons, "data_on_stdout", True)
+    GetGistCommons().yeah("Done!")
+    assert secho.call_args[1]["file"] is stderr
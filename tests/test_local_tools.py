@@ -1,6 +1,11 @@
 import os
+import stat
+from hashlib import sha256
+
+import pytest
 
 from getgist import GetGistCommons
+from getgist.request import Download
 from tests.conftest import TEST_FILE_CONTENTS
 
 
@@ -93,7 +98,8 @@ def test_write_file_with_backup(local, mocker):
     assert os.path.exists(local.file_path)
     assert local.read() == TEST_FILE_CONTENTS
 
-    backup = "{}.bkp1".format(local.file_path)
+    backup = "{}.bkp".format(local.file_path)
+    assert not os.path.exists(backup)  # unchanged, nothing to back up
     local.save("new contents")
     assert os.path.exists(local.file_path)
     assert os.path.exists(backup)
@@ -115,3 +121,83 @@ def test_write_file_with_multiple_backup(local, mocker):
     for ext in ("", ".bkp", ".bkp1", ".bkp2", ".bkp3", ".bkp4"):
         backup = "{}{}".format(local.file_path, ext)
         assert os.path.exists(backup)
+
+
+def test_write_file_from_chunks(local):
+    os.remove(local.file_path)
+    local.save(iter((b"4", b"2")))
+    assert local.read() == TEST_FILE_CONTENTS
+    assert local.digest == sha256(b"42").hexdigest()
+    assert not os.path.exists(local.temporary_path)
+
+
+def test_interrupted_write_keeps_existing_file(local):
+    def chunks():
+        yield b"new"
+        raise ConnectionError
+
+    local.assume_yes = True
+    with pytest.raises(ConnectionError):
+        local.save(chunks())
+    assert local.read() == TEST_FILE_CONTENTS
+    assert not os.path.exists(local.temporary_path)
+
+
+def test_write_file_keeps_permissions(local):
+    os.chmod(local.file_path, 0o600)
+    local.assume_yes = True
+    local.save("new contents")
+    assert local.read() == "new contents"
+    assert stat.S_IMODE(os.stat(local.file_path).st_mode) == 0o600
+
+
+def test_interrupted_download_can_be_resumed(local):
+    def chunks():
+        yield b"4"
+        raise ConnectionError
+
+    local.assume_yes = True
+    assert local.partial("https://raw/.gist") == (0, None)
+    with pytest.raises(ConnectionError):
+        local.save(Download("https://raw/.gist", chunks(), etag='"abc"'))
+    assert local.read() == TEST_FILE_CONTENTS
+    assert local.partial("https://raw/.gist") == (1, '"abc"')
+    assert local.partial("https://raw/.vimrc") == (0, None)
+
+    local.save(Download("https://raw/.gist", (b"2",), offset=1, etag='"abc"'))
+    assert local.read() == "42"
+    assert local.digest == sha256(b"42").hexdigest()
+    assert local.partial("https://raw/.gist") == (0, None)
+    assert not os.path.exists(local.temporary_path)
+    assert not os.path.exists(local.partial_info_path)
+
+
+def test_resumed_download_restarted_by_server(local):
+    def chunks():
+        yield b"4"
+        raise ConnectionError
+
+    local.assume_yes = True
+    with pytest.raises(ConnectionError):
+        local.save(Download("https://raw/.gist", chunks()))
+    local.save(Download("https://raw/.gist", (b"21",)))
+    assert local.read() == "21"
+
+
+def test_save_unchanged_file(mocker, local):
+    confirm = mocker.patch("getgist.local.confirm")
+    backup = mocker.patch("getgist.local.LocalTools.backup")
+    os.utime(local.file_path, (1, 1))
+    local.save(TEST_FILE_CONTENTS)
+    confirm.assert_not_called()
+    backup.assert_not_called()
+    assert os.stat(local.file_path).st_mtime == 1
+    assert local.read() == TEST_FILE_CONTENTS
+    assert not os.path.exists(local.temporary_path)
+
+
+def test_file_digest(mocker, local):
+    expected = sha256(TEST_FILE_CONTENTS.encode("utf-8")).hexdigest()
+    assert local.file_digest(local.file_path) == expected
+    mocker.patch.object(local, "mmap_threshold", 1)
+    assert local.file_digest(local.file_path) == expected
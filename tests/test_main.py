@@ -0,0 +1,69 @@
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from getgist.__main__ import run_getmy, run_putmy
+from tests.conftest import GETGIST_USER, paged_get_mock
+
+
+@pytest.fixture
+def runner(mocker, response, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mocker.patch.dict("os.environ", {"GETGIST_USER": GETGIST_USER})
+    mocker.patch("getgist.github.GitHubTools._get_token").return_value = None
+    get = mocker.patch("getgist.request.GetGistRequests.get")
+    get.side_effect = paged_get_mock(response)
+    stream = mocker.patch("getgist.request.GetGistRequests.stream")
+    stream.return_value.status_code = 200
+    stream.return_value.headers = {}
+    stream.return_value.iter_content.return_value = (b"42",)
+    return CliRunner()
+
+
+def test_getmy_downloads_all_files(runner, mocker):
+    yeah = mocker.patch("getgist.GetGistCommons.yeah")
+    result = runner.invoke(run_getmy, ["-y", ".gist.dev", ".gist.s*"])
+    assert result.exit_code == 0
+    yeah.assert_called_with("Downloaded 2 of 2 file(s)")
+    for name in (".gist.dev", ".gist.sample"):
+        with open(name) as fobj:
+            assert fobj.read() == "42"
+
+
+def test_getmy_fails_if_a_file_is_not_downloaded(runner, mocker):
+    oops = mocker.patch("getgist.GetGistCommons.oops")
+    result = runner.invoke(run_getmy, ["-y", ".gist.dev", ".nope"])
+    assert result.exit_code == 1
+    oops.assert_called_with("Could not download .nope")
+    assert os.path.exists(".gist.dev")
+
+
+def test_getmy_fails_if_the_file_is_not_found(runner):
+    assert runner.invoke(run_getmy, ["-y", ".nope"]).exit_code == 1
+
+
+def test_putmy_sends_one_request_per_gist(runner, mocker, gists):
+    update = mocker.patch("getgist.github.GitHubTools.update_files")
+    update.return_value = True
+    create = mocker.patch("getgist.github.GitHubTools.create_files")
+    create.return_value = gists[0]
+    for name in (".gist.dev", ".gist.sample", ".new"):
+        with open(name, "w") as fobj:
+            fobj.write(name)
+
+    result = runner.invoke(run_putmy, ["-y", ".gist.*", ".new"])
+    assert result.exit_code == 0
+    update.assert_called_once_with(
+        gists[2], {".gist.dev": ".gist.dev", ".gist.sample": ".gist.sample"}
+    )
+    create.assert_called_once_with({".new": ".new"}, public=True)
+
+
+def test_putmy_fails_if_a_file_is_not_sent(runner, mocker):
+    mocker.patch("getgist.github.GitHubTools.update_files").return_value = False
+    with open(".gist.dev", "w") as fobj:
+        fobj.write("42")
+    with open(".gist.sample", "w") as fobj:
+        fobj.write("42")
+    assert runner.invoke(run_putmy, ["-y", ".gist.*"]).exit_code == 1
@@ -0,0 +1,100 @@
+import gc
+import tracemalloc
+
+from getgist.github import GitHubTools
+from getgist.models import FileFromGist, Gist, GistFile
+
+API_GIST = {
+    "id": "42",
+    "description": "",
+    "html_url": "https://gist.github.com/42",
+    "public": False,
+    "files": {
+        "b.txt": {"raw_url": "https://raw/42/b.txt", "size": 2},
+        "a.txt": {"raw_url": "https://raw/42/a.txt", "size": 1},
+    },
+}
+
+
+def test_gist_from_api():
+    gist = Gist.from_api(API_GIST)
+    assert gist.description == "a.txt"
+    assert gist.id == "42"
+    assert gist.url == "https://gist.github.com/42"
+    assert gist.public is False
+    assert gist.files == (
+        GistFile("a.txt", "https://raw/42/a.txt", 1),
+        GistFile("b.txt", "https://raw/42/b.txt", 2),
+    )
+
+
+def test_gist_files_are_not_tracked_by_the_garbage_collector():
+    gist = Gist.from_api(API_GIST)
+    gc.collect()
+    assert not any(gc.is_tracked(gist_file) for gist_file in tuple(gist)[2])
+    assert all(isinstance(gist_file, GistFile) for gist_file in gist.files)
+
+
+def test_gist_reads_like_a_dict():
+    gist = Gist.from_api(API_GIST)
+    assert gist["id"] == "42"
+    assert gist["files"][1]["filename"] == "b.txt"
+    assert gist.get("url") == "https://gist.github.com/42"
+    assert gist.get("html_url") is None
+    assert gist.get("html_url", 42) == 42
+    assert set(gist.keys()) == {"description", "id", "files", "url", "public"}
+    assert dict(gist)["public"] is False
+
+
+def test_gist_equals_a_dict():
+    gist = Gist.from_api(API_GIST)
+    as_dict = dict(
+        description="a.txt",
+        id="42",
+        files=[
+            dict(filename="a.txt", raw_url="https://raw/42/a.txt", size=1),
+            dict(filename="b.txt", raw_url="https://raw/42/b.txt", size=2),
+        ],
+        url="https://gist.github.com/42",
+        public=False,
+    )
+    assert gist == as_dict
+    assert as_dict == gist
+    as_dict["public"] = True
+    assert gist != as_dict
+    del as_dict["public"]
+    assert gist != as_dict
+
+
+def test_records_of_different_types_are_not_equal():
+    assert GistFile("a", "b", 1) == GistFile("a", "b", 1)
+    assert GistFile("a", "b", 1) != ("a", "b", 1, "c")
+
+
+def test_file_from_gist_from_gist():
+    gist = Gist.from_api(API_GIST)
+    url = "https://gist.github.com/42"
+    assert list(FileFromGist.from_gist(gist)) == [
+        FileFromGist("a.txt", "a.txt", url, False),
+        FileFromGist("a.txt", "b.txt", url, False),
+    ]
+
+
+def test_parsed_gists_are_compact():
+    gists = [
+        dict(API_GIST, id=str(number), files={"f{}".format(number): {"raw_url": ""}})
+        for number in range(1000)
+    ]
+
+    def parsed_size(parse):
+        tracemalloc.start()
+        parsed = [parse(gist) for gist in gists]  # noqa: F841
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size
+
+    def as_dict(gist):
+        files = [dict(f._asdict()) for f in Gist.from_api(gist).files]
+        return dict(Gist.from_api(gist), files=files)
+
+    assert parsed_size(GitHubTools._parse_gist) < parsed_size(as_dict) / 2
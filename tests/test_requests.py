@@ -1,4 +1,12 @@
-from getgist.request import GetGistRequests
+from io import BytesIO
+from time import time
+
+import pytest
+from requests import ConnectionError, ConnectTimeout, Response
+
+from getgist.request import Download, GetGistRequests, RateLimit, RetryPolicy
+
+API_URL = "https://api.github.com/users/janedoe/gists"
 
 
 def test_no_header():
@@ -18,7 +26,8 @@ def test_add_header():
 
 
 def test_get_without_params(mocker):
-    get = mocker.patch("getgist.request.requests.get")
+    session = mocker.patch("requests.Session")
+    get = session.return_value.get
     requests = GetGistRequests({"foo": "bar"})
     requests.get("foobar", bar="foo")
     get.assert_called_once_with(
@@ -27,7 +36,8 @@ def test_get_without_params(mocker):
 
 
 def test_get_with_params(mocker):
-    get = mocker.patch("getgist.request.requests.get")
+    session = mocker.patch("requests.Session")
+    get = session.return_value.get
     requests = GetGistRequests({"foo": "bar"})
     requests.get("foobar", params=42, bar="foo")
     get.assert_called_once_with(
@@ -36,7 +46,8 @@ def test_get_with_params(mocker):
 
 
 def test_post_without_data(mocker):
-    post = mocker.patch("getgist.request.requests.post")
+    session = mocker.patch("requests.Session")
+    post = session.return_value.post
     requests = GetGistRequests({"foo": "bar"})
     requests.post("foobar", bar="foo")
     post.assert_called_once_with(
@@ -45,7 +56,8 @@ def test_post_without_data(mocker):
 
 
 def test_post_with_data(mocker):
-    post = mocker.patch("getgist.request.requests.post")
+    session = mocker.patch("requests.Session")
+    post = session.return_value.post
     requests = GetGistRequests({"foo": "bar"})
     requests.post("foobar", data=42, bar="foo")
     post.assert_called_once_with(
@@ -54,7 +66,8 @@ def test_post_with_data(mocker):
 
 
 def test_patch_without_data(mocker):
-    patch = mocker.patch("getgist.request.requests.patch")
+    session = mocker.patch("requests.Session")
+    patch = session.return_value.patch
     requests = GetGistRequests({"foo": "bar"})
     requests.patch("foobar", bar="foo")
     patch.assert_called_once_with(
@@ -63,9 +76,387 @@ def test_patch_without_data(mocker):
 
 
 def test_patch_with_data(mocker):
-    patch = mocker.patch("getgist.request.requests.patch")
+    session = mocker.patch("requests.Session")
+    patch = session.return_value.patch
     requests = GetGistRequests({"foo": "bar"})
     requests.patch("foobar", data=42, bar="foo")
     patch.assert_called_once_with(
         "foobar", data=42, headers={"foo": "bar", "bar": "foo"}
     )
+
+
+def test_session_is_reused(mocker):
+    session = mocker.patch("requests.Session")
+    requests = GetGistRequests({"foo": "bar"})
+    requests.get("foobar")
+    requests.patch("foobar")
+    requests.post("foobar")
+    session.assert_called_once_with()
+
+
+def test_session_pool_size(mocker):
+    session = mocker.patch("requests.Session")
+    requests = GetGistRequests(pool_connections=2, pool_maxsize=8)
+    requests.get("foobar")
+    adapter = session.return_value.mount.call_args[0][1]
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 8
+
+
+def test_close_session(mocker):
+    session = mocker.patch("requests.Session")
+    requests = GetGistRequests()
+    requests.get("foobar")
+    requests.close()
+    session.return_value.close.assert_called_once_with()
+    requests.get("foobar")
+    assert session.call_count == 2
+
+
+def test_connection_stats_without_session():
+    requests = GetGistRequests()
+    assert requests.connection_stats() == {
+        "requests": 0,
+        "connections": 0,
+        "reused": 0,
+    }
+
+
+def test_connection_stats():
+    requests = GetGistRequests()
+    pool = requests.session.get_adapter("https://").poolmanager.connection_from_url(
+        "https://api.github.com/"
+    )
+    pool.num_requests, pool.num_connections = 5, 1
+    assert requests.connection_stats() == {
+        "requests": 5,
+        "connections": 1,
+        "reused": 4,
+    }
+
+
+def http_response(status_code, content=b"", headers=None):
+    response = Response()
+    response.status_code = status_code
+    response._content = content
+    response.raw = BytesIO(content)
+    response.headers.update(headers or {})
+    return response
+
+
+def test_get_with_cache_stores_response(mocker):
+    session = mocker.patch("requests.Session")
+    session.return_value.get.return_value = http_response(
+        200, b"[42]", {"ETag": '"abc"'}
+    )
+    requests = GetGistRequests({"foo": "bar"})
+    assert requests.get("foobar", cache=True).json() == [42]
+    session.return_value.get.assert_called_once_with(
+        "foobar", params=None, headers={"foo": "bar"}
+    )
+
+
+def test_get_with_cache_replays_not_modified(mocker):
+    session = mocker.patch("requests.Session")
+    session.return_value.get.side_effect = (
+        http_response(200, b"[42]", {"ETag": '"abc"', "Link": "<foo>; rel=next"}),
+        http_response(304, headers={"ETag": '"abc"', "X-RateLimit-Remaining": "1"}),
+    )
+    requests = GetGistRequests({"foo": "bar"})
+    requests.get("foobar", cache=True)
+    response = requests.get("foobar", cache=True)
+
+    session.return_value.get.assert_called_with(
+        "foobar", params=None, headers={"foo": "bar", "If-None-Match": '"abc"'}
+    )
+    assert response.status_code == 200
+    assert response.from_cache
+    assert response.json() == [42]
+    assert response.headers["Link"] == "<foo>; rel=next"
+    assert response.headers["X-RateLimit-Remaining"] == "1"
+
+
+def test_get_with_cache_refreshes_modified(mocker):
+    session = mocker.patch("requests.Session")
+    session.return_value.get.side_effect = (
+        http_response(200, b"[42]", {"Last-Modified": "yesterday"}),
+        http_response(200, b"[21]", {"Last-Modified": "today"}),
+        http_response(304),
+    )
+    requests = GetGistRequests()
+    requests.get("foobar", cache=True)
+    assert requests.get("foobar", cache=True).json() == [21]
+    assert requests.get("foobar", cache=True).json() == [21]
+    session.return_value.get.assert_called_with(
+        "foobar", params=None, headers={"If-Modified-Since": "today"}
+    )
+
+
+def test_get_with_cache_depends_on_authorization(mocker):
+    session = mocker.patch("requests.Session")
+    session.return_value.get.return_value = http_response(
+        200, b"[42]", {"ETag": '"abc"'}
+    )
+    requests = GetGistRequests()
+    requests.get("foobar", cache=True)
+    requests.get("foobar", cache=True, Authorization="token 42")
+    session.return_value.get.assert_called_with(
+        "foobar", params=None, headers={"Authorization": "token 42"}
+    )
+
+
+def test_rate_limit_update():
+    rate_limit = RateLimit()
+    rate_limit.update(http_response(200))
+    assert rate_limit.remaining is None
+
+    headers = {
+        "X-RateLimit-Limit": "60",
+        "X-RateLimit-Remaining": "42",
+        "X-RateLimit-Reset": "1000",
+    }
+    rate_limit.update(http_response(200, headers=headers))
+    assert (rate_limit.limit, rate_limit.remaining, rate_limit.reset) == (60, 42, 1000)
+
+
+def test_rate_limit_delay():
+    rate_limit = RateLimit()
+    assert rate_limit.delay(now=900) == 0
+
+    rate_limit.remaining, rate_limit.reset = 42, 1000
+    assert rate_limit.delay(now=900) == 0
+
+    rate_limit.remaining = 5
+    assert rate_limit.delay(now=900) == 20
+
+    rate_limit.remaining = 0
+    assert rate_limit.delay(now=900) == 100
+    assert rate_limit.delay(now=1100) == 0
+
+
+def test_rate_limit_retry_after():
+    rate_limit = RateLimit()
+    assert rate_limit.retry_after(http_response(200), now=900) is None
+    assert rate_limit.retry_after(http_response(403), now=900) is None
+
+    response = http_response(429, headers={"Retry-After": "30"})
+    assert rate_limit.retry_after(response, now=900) == 30
+
+    headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1000"}
+    response = http_response(403, headers=headers)
+    assert rate_limit.retry_after(response, now=900) == 100
+
+
+def test_request_waits_when_budget_is_low(mocker):
+    sleep = mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    headers = {
+        "X-RateLimit-Remaining": "2",
+        "X-RateLimit-Reset": str(int(time()) + 20),
+    }
+    session.return_value.get.return_value = http_response(200, headers=headers)
+    requests = GetGistRequests()
+    requests.get(API_URL)
+    sleep.assert_not_called()
+    requests.get(API_URL)
+    assert 0 < sleep.call_args[0][0] <= 10
+
+
+def test_request_waits_at_most_max_wait(mocker):
+    sleep = mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    headers = {
+        "X-RateLimit-Remaining": "9",
+        "X-RateLimit-Reset": str(int(time()) + 600),
+    }
+    session.return_value.get.return_value = http_response(200, headers=headers)
+    requests = GetGistRequests()
+    requests.get(API_URL)
+    sleep.assert_not_called()
+    requests.get(API_URL)
+    sleep.assert_called_once_with(RateLimit.max_wait)
+
+
+def test_request_does_not_pace_raw_files(mocker):
+    sleep = mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    headers = {
+        "X-RateLimit-Remaining": "2",
+        "X-RateLimit-Reset": str(int(time()) + 20),
+    }
+    session.return_value.get.return_value = http_response(200, headers=headers)
+    requests = GetGistRequests()
+    requests.get(API_URL)
+    requests.get("https://gist.githubusercontent.com/janedoe/42/raw/.gist")
+    sleep.assert_not_called()
+
+
+def test_request_retries_after_rate_limit_refusal(mocker):
+    sleep = mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.get.side_effect = (
+        http_response(429, headers={"Retry-After": "3"}),
+        http_response(200, b"[42]"),
+    )
+    requests = GetGistRequests()
+    assert requests.get("foobar").json() == [42]
+    sleep.assert_called_once_with(3)
+
+
+def test_request_does_not_wait_too_long(mocker):
+    sleep = mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.get.return_value = http_response(
+        429, headers={"Retry-After": "3600"}
+    )
+    requests = GetGistRequests()
+    assert requests.get("foobar").status_code == 429
+    assert requests.get("foobar").status_code == 429
+    sleep.assert_not_called()
+
+
+def test_rate_limit_status(mocker):
+    session = mocker.patch("requests.Session")
+    session.return_value.get.return_value = http_response(
+        200, b'{"resources": {"core": {"limit": 60}}}'
+    )
+    requests = GetGistRequests()
+    assert requests.rate_limit_status("foobar") == {"core": {"limit": 60}}
+
+
+def test_retry_policy_is_retryable():
+    retry = RetryPolicy()
+    assert retry.is_retryable("get")
+    assert not retry.is_retryable("patch")
+    assert retry.is_retryable("patch", safe=True)
+    assert not retry.is_retryable("post")
+
+
+def test_retry_policy_delay(mocker):
+    uniform = mocker.patch("getgist.request.uniform")
+    retry = RetryPolicy(backoff=1, max_backoff=5)
+    retry.delay(1)
+    uniform.assert_called_with(0, 1)
+    retry.delay(3)
+    uniform.assert_called_with(0, 4)
+    retry.delay(4)
+    uniform.assert_called_with(0, 5)
+
+
+def test_retry_policy_allows():
+    retry = RetryPolicy(attempts=3, budget=10)
+    assert retry.allows(1, time(), 1)
+    assert not retry.allows(3, time(), 1)
+    assert not retry.allows(1, time(), 11)
+    assert not retry.allows(1, time() - 10, 1)
+
+
+def test_request_retries_server_errors(mocker):
+    sleep = mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.get.side_effect = (
+        http_response(502),
+        http_response(503),
+        http_response(200, b"[42]"),
+    )
+    requests = GetGistRequests(retry=RetryPolicy(attempts=3))
+    assert requests.get("foobar").json() == [42]
+    assert requests.retries == 2
+    assert sleep.call_count == 2
+
+
+def test_request_closes_responses_it_retries(mocker):
+    mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    failed, succeeded = http_response(503), http_response(200, b"[42]")
+    close = mocker.patch.object(failed, "close")
+    session.return_value.get.side_effect = (failed, succeeded)
+    requests = GetGistRequests(retry=RetryPolicy(attempts=3))
+    assert requests.get("foobar", stream=True) is succeeded
+    close.assert_called_once_with()
+
+
+def test_request_gives_up_after_attempts(mocker):
+    mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.get.return_value = http_response(503)
+    requests = GetGistRequests(retry=RetryPolicy(attempts=3))
+    assert requests.get("foobar").status_code == 503
+    assert session.return_value.get.call_count == 3
+    assert requests.retries == 2
+
+
+def test_request_retries_connection_errors(mocker):
+    mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.get.side_effect = (
+        ConnectionError("Connection reset by peer"),
+        http_response(200, b"[42]"),
+    )
+    requests = GetGistRequests()
+    assert requests.get("foobar").json() == [42]
+    assert requests.retries == 1
+
+
+def test_request_raises_connection_errors_when_giving_up(mocker):
+    mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.get.side_effect = ConnectionError
+    requests = GetGistRequests(retry=RetryPolicy(attempts=2))
+    with pytest.raises(ConnectionError):
+        requests.get("foobar")
+    assert session.return_value.get.call_count == 2
+
+
+def test_request_does_not_retry_post(mocker):
+    sleep = mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.post.return_value = http_response(502)
+    requests = GetGistRequests()
+    assert requests.post("foobar").status_code == 502
+    sleep.assert_not_called()
+    assert requests.retries == 0
+
+
+def test_request_retries_post_that_could_not_connect(mocker):
+    mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.post.side_effect = (ConnectTimeout, http_response(201))
+    requests = GetGistRequests()
+    assert requests.post("foobar").status_code == 201
+
+
+def test_request_retries_safe_patch(mocker):
+    mocker.patch("getgist.request.sleep")
+    session = mocker.patch("requests.Session")
+    session.return_value.patch.side_effect = (http_response(502), http_response(200))
+    requests = GetGistRequests()
+    assert requests.patch("foobar", safe=True).status_code == 200
+    assert requests.retries == 1
+
+
+def test_stream(mocker):
+    session = mocker.patch("requests.Session")
+    requests = GetGistRequests({"foo": "bar"})
+    requests.stream("foobar")
+    session.return_value.get.assert_called_once_with(
+        "foobar", headers={"foo": "bar"}, stream=True
+    )
+
+
+def test_download_from_response():
+    response = http_response(200, b"42" * 3)
+    response._content_consumed = True
+    download = Download.from_response("foobar", response)
+    assert download.url == "foobar"
+    assert b"".join(download) == b"424242"
+
+
+def test_download_from_file(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(b"42" * Download.chunk_size)
+    handler = open(str(path), "rb")
+    chunks = tuple(Download.from_file("foobar", handler))
+    assert len(chunks) == 2
+    assert b"".join(chunks) == b"42" * Download.chunk_size
+    assert handler.closed
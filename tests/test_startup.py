@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SLOW_MODULES = ("requests", "tabulate", "pkg_resources", "sqlite3")
+BUDGET = int(os.getenv("GETGIST_IMPORT_BUDGET_MS", 150))
+
+
+def import_times(module=None):
+    """Imports a module in a new interpreter with `-X importtime` and returns
+    the cumulative import time (in microseconds) of each module imported
+    (including the ones imported by the interpreter on startup)."""
+    code = "import " + module if module else "pass"
+    command = (sys.executable, "-X", "importtime", "-c", code)
+    result = subprocess.run(command, stderr=subprocess.PIPE, check=True)
+    times = dict()
+    for line in result.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError:  # header line
+            continue
+    return times
+
+
+@pytest.mark.parametrize("module", ("getgist", "getgist.__main__"))
+def test_slow_modules_are_not_imported_on_startup(module):
+    times = import_times(module)
+    imported = set(times) - set(import_times())
+    assert module in imported
+    for slow_module in SLOW_MODULES:
+        assert slow_module not in imported
+
+
+def test_startup_import_time_budget():
+    best = min(import_times("getgist.__main__")["getgist.__main__"] for _ in range(3))
+    assert best / 1000 < BUDGET, "Importing the CLI took {:.0f}ms".format(best / 1000)